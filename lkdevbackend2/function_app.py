@@ -9,6 +9,8 @@ from .scrapers.image_scraper import scrape_image
 from .scrapers.pdf_scraper import scrape_pdf
 from .scrapers.facebook_scraper import scrape_facebook_post
 from .scrapers.dynamic_scraper import scrape_dynamic_content
+from .scrapers.format_detection import detect_format
+from .scrapers.page_document import page_run
 from .utils.data_processing import process_menu_text
 
 # Initialize Flask app
@@ -28,6 +30,46 @@ if not openai_api_key:
     raise Exception("OPENAI_API_KEY is not set.")
 openai.api_key = openai_api_key
 
+SUPPORTED_FORMATS = ("PDF", "TEXT", "IMAGE", "FACEBOOK POST", "DYNAMIC")
+
+
+def scrape_format(format, link, solution=None):
+    """
+    Runs the scraper of one format. Returns the menu text, or None.
+    Raises ValueError for an unsupported format.
+    """
+    if format.upper() == "PDF":
+        return scrape_pdf(link, solution)
+    elif format.upper() == "TEXT":
+        return scrape_text(link)
+    elif format.upper() == "IMAGE":
+        return scrape_image(link)
+    elif format.upper() == "FACEBOOK POST":
+        return scrape_facebook_post(link)
+    elif format.upper() == "DYNAMIC":
+        return scrape_dynamic_content(link)
+    raise ValueError(f"Unsupported format: {format}")
+
+
+def scrape_link(format, link, solution=None):
+    """
+    Scrapes link with the given format, or, when format is missing or AUTO, with
+    the detected candidate formats from the cheapest likely to succeed.
+    Returns (menu_text, format used). The landing page is fetched and parsed once
+    for the detection and all the scrapers tried.
+    """
+    with page_run():
+        if format and format.upper() != "AUTO":
+            return scrape_format(format, link, solution), format.upper()
+
+        detected = detect_format(link)
+        for candidate in detected["candidates"]:
+            menu_text = scrape_format(candidate, link, solution)
+            if menu_text:
+                return menu_text, candidate
+            logger.info(f"Detected format {candidate} gave no menu text for {link}; trying the next one.")
+        return None, detected["format"]
+
 
 @app.route("/")
 def index():
@@ -41,7 +83,7 @@ def scrape_menu():
     """
     Endpoint to scrape a menu based on the provided format and link.
     Query Parameters:
-        - format: Menu format (PDF, TEXT, IMAGE, etc.)
+        - format: (Optional) Menu format (PDF, TEXT, IMAGE, etc.); detected when missing or AUTO
         - link: URL to scrape
         - solution: (Optional) Additional parameter for certain formats
     """
@@ -49,33 +91,25 @@ def scrape_menu():
     link = request.args.get("link")
     solution = request.args.get("solution")
 
-    # Validate required parameters
-    if not format or not link:
-        logger.warning("Missing 'format' or 'link' parameter.")
-        return jsonify({"error": "Missing 'format' or 'link' parameter"}), 400
+    # Validate required parameters; a missing format is detected from the link
+    if not link:
+        logger.warning("Missing 'link' parameter.")
+        return jsonify({"error": "Missing 'link' parameter"}), 400
 
     logger.info(f"Received request: format={format}, link={link}, solution={solution}")
 
     try:
-        # Dispatch the request based on the format
-        if format.upper() == "PDF":
-            menu_text = scrape_pdf(link, solution)
-        elif format.upper() == "TEXT":
-            menu_text = scrape_text(link)
-        elif format.upper() == "IMAGE":
-            menu_text = scrape_image(link)
-        elif format.upper() == "FACEBOOK POST":
-            menu_text = scrape_facebook_post(link)
-        elif format.upper() == "DYNAMIC":
-            menu_text = scrape_dynamic_content(link)
-        else:
+        if format and format.upper() not in SUPPORTED_FORMATS + ("AUTO",):
             logger.warning(f"Unsupported format: {format}")
             return jsonify({"error": f"Unsupported format: {format}"}), 400
 
+        # Dispatch the request based on the format, detecting it when missing or AUTO
+        menu_text, format = scrape_link(format, link, solution)
+
         # If scraping failed
         if not menu_text:
             logger.error("Failed to retrieve menu text.")
-            return jsonify({"error": "Failed to retrieve menu text"}), 500
+            return jsonify({"error": "Failed to retrieve menu text", "format": format}), 500
 
         # Process the scraped text into structured menu data
         lunch_menus = process_menu_text(menu_text)
@@ -87,7 +121,7 @@ def scrape_menu():
 
         # Return the processed lunch menus
         logger.info(f"Processed menu data: {lunch_menus}")
-        return jsonify({"lunch_menus": lunch_menus}), 200
+        return jsonify({"lunch_menus": lunch_menus, "format": format}), 200
 
     except Exception as e:
         logger.exception("Error processing scrape-menu request.")
@@ -99,7 +133,7 @@ def lkdevbackend2():
     """
     Main route for processing API requests.
     Query Parameters:
-        - format: Menu format (PDF, TEXT, IMAGE, etc.)
+        - format: (Optional) Menu format (PDF, TEXT, IMAGE, etc.); detected when missing or AUTO
         - link: URL to scrape
         - solution: (Optional) Additional parameter for certain formats
     Body (if POST):
@@ -117,33 +151,25 @@ def lkdevbackend2():
         data = request.get_json()
         custom_prompt = data.get('customPrompt')
 
-    # Validate required parameters
-    if not format or not link:
-        logger.warning("Missing 'format' or 'link' parameter.")
-        return jsonify({"error": "Missing 'format' or 'link' parameter"}), 400
+    # Validate required parameters; a missing format is detected from the link
+    if not link:
+        logger.warning("Missing 'link' parameter.")
+        return jsonify({"error": "Missing 'link' parameter"}), 400
 
     logger.info(f"Received request: format={format}, link={link}, solution={solution}, custom_prompt={'Yes' if custom_prompt else 'No'}")
 
     try:
-        # Dispatch the request based on the format
-        if format.upper() == "PDF":
-            menu_text = scrape_pdf(link, solution)
-        elif format.upper() == "TEXT":
-            menu_text = scrape_text(link)
-        elif format.upper() == "IMAGE":
-            menu_text = scrape_image(link)
-        elif format.upper() == "FACEBOOK POST":
-            menu_text = scrape_facebook_post(link)
-        elif format.upper() == "DYNAMIC":
-            menu_text = scrape_dynamic_content(link)
-        else:
+        if format and format.upper() not in SUPPORTED_FORMATS + ("AUTO",):
             logger.warning(f"Unsupported format: {format}")
             return jsonify({"error": f"Unsupported format: {format}"}), 400
 
+        # Dispatch the request based on the format, detecting it when missing or AUTO
+        menu_text, format = scrape_link(format, link, solution)
+
         # If scraping failed
         if not menu_text:
             logger.error("Failed to retrieve menu text.")
-            return jsonify({"error": "Failed to retrieve menu text"}), 500
+            return jsonify({"error": "Failed to retrieve menu text", "format": format}), 500
 
         # Process the scraped text into structured menu data
         lunch_menus = process_menu_text(menu_text, custom_prompt)
@@ -155,7 +181,7 @@ def lkdevbackend2():
 
         # Return the processed lunch menus
         logger.info(f"Processed menu data: {lunch_menus}")
-        return jsonify({"lunch_menus": lunch_menus}), 200
+        return jsonify({"lunch_menus": lunch_menus, "format": format}), 200
 
     except Exception as e:
         logger.exception("Error processing lkdevbackend2 request.")
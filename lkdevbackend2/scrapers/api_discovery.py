@@ -0,0 +1,187 @@
+import base64
+import datetime
+import json
+import logging
+import os
+import re
+
+import requests
+from bs4 import BeautifulSoup
+from selenium.common.exceptions import WebDriverException
+
+from .content_extraction import MIN_BLOCK_SCORE, content_text, menu_signal_score
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+API_TIMEOUT = int(os.getenv('API_TIMEOUT', '15'))
+# Largest endpoint response read (bytes)
+API_MAX_BYTES = int(os.getenv('API_MAX_BYTES', str(2 * 1024 * 1024)))
+# Request types that can carry a menu widget's data
+API_RESOURCE_TYPES = ('XHR', 'Fetch')
+API_MIME_MARKERS = ('json', 'text/plain', 'text/html', 'javascript')
+# Request headers replayed with the endpoint call
+REPLAYED_HEADERS = ('accept', 'content-type', 'x-requested-with')
+
+
+def json_strings(value):
+    """
+    Yields every string value of a decoded JSON document, depth first.
+    """
+    if isinstance(value, str):
+        yield value
+    elif isinstance(value, dict):
+        for item in value.values():
+            yield from json_strings(item)
+    elif isinstance(value, list):
+        for item in value:
+            yield from json_strings(item)
+
+
+def response_text(body, mime_type):
+    """
+    Turns an endpoint response into plain text: the string values of JSON
+    documents one per line, the content text of HTML fragments, or the body as is.
+    """
+    if 'json' in mime_type or body.lstrip()[:1] in ('{', '['):
+        try:
+            strings = (' '.join(BeautifulSoup(s, 'html.parser').get_text(' ').split()) if '<' in s else s.strip()
+                       for s in json_strings(json.loads(body)))
+            return '\n'.join(s for s in strings if s)
+        except ValueError:
+            pass
+    if 'html' in mime_type:
+        return content_text(BeautifulSoup(body, 'html.parser'))
+    return body
+
+
+def templatize(text, today=None):
+    """
+    Replaces today's date, the week's Monday and the ISO week number in a learned
+    URL or body with placeholders, so the endpoint keeps working in later weeks.
+    """
+    today = today or datetime.date.today()
+    week_start = today - datetime.timedelta(days=today.weekday())
+    week = today.isocalendar()[1]
+    text = text.replace(today.isoformat(), '{today}').replace(week_start.isoformat(), '{week_start}')
+    return re.sub(rf'((?:week|vecka)[=/]){week}(?!\d)', r'\1{week}', text)
+
+
+def render_template(text, today=None):
+    today = today or datetime.date.today()
+    week_start = today - datetime.timedelta(days=today.weekday())
+    return (
+        text.replace('{today}', today.isoformat())
+        .replace('{week_start}', week_start.isoformat())
+        .replace('{week}', str(today.isocalendar()[1]))
+    )
+
+
+def collect_network_responses(driver):
+    """
+    Reads the performance log of a browser visit (started with capture_network)
+    and returns the XHR/Fetch responses with their bodies as dicts with 'url',
+    'method', 'post_data', 'headers', 'mime_type' and 'body'.
+    """
+    requests_by_id = {}
+    responses = []
+    for entry in driver.get_log('performance'):
+        try:
+            message = json.loads(entry['message'])['message']
+        except (KeyError, ValueError):
+            continue
+        params = message.get('params', {})
+        if message.get('method') == 'Network.requestWillBeSent':
+            requests_by_id[params.get('requestId')] = params.get('request', {})
+        elif message.get('method') == 'Network.responseReceived':
+            response = params.get('response', {})
+            mime_type = response.get('mimeType', '').lower()
+            if params.get('type') in API_RESOURCE_TYPES and response.get('status', 0) < 400 \
+                    and any(marker in mime_type for marker in API_MIME_MARKERS):
+                responses.append((params.get('requestId'), response.get('url'), mime_type))
+
+    captured = []
+    for request_id, url, mime_type in responses:
+        try:
+            result = driver.execute_cdp_cmd('Network.getResponseBody', {'requestId': request_id})
+        except WebDriverException:
+            continue  # Bodies of some requests are no longer available
+        body = result.get('body', '')
+        if result.get('base64Encoded'):
+            body = base64.b64decode(body).decode('utf-8', errors='replace')
+        request = requests_by_id.get(request_id, {})
+        headers = {
+            name: value for name, value in request.get('headers', {}).items()
+            if name.lower() in REPLAYED_HEADERS
+        }
+        captured.append({
+            'url': url,
+            'method': request.get('method', 'GET'),
+            'post_data': request.get('postData'),
+            'headers': headers,
+            'mime_type': mime_type,
+            'body': body,
+        })
+    return captured
+
+
+def find_menu_endpoint(responses):
+    """
+    Picks the captured response whose text carries the most menu signals and
+    returns it as an endpoint to store on the restaurant, or None if no response
+    looks like a menu.
+    """
+    best = None
+    best_score = 0
+    for response in responses:
+        score = menu_signal_score(response_text(response['body'], response['mime_type']))
+        if score > best_score:
+            best, best_score = response, score
+
+    if best is None or best_score < MIN_BLOCK_SCORE:
+        logger.info(f"No backing API found among {len(responses)} captured responses.")
+        return None
+
+    logger.info(f"Discovered menu endpoint {best['method']} {best['url']} (score {best_score}).")
+    return {
+        'url': templatize(best['url']),
+        'method': best['method'],
+        'body': templatize(best['post_data']) if best['post_data'] else None,
+        'headers': best['headers'],
+        'mime_type': best['mime_type'],
+        'strategy': 'api',
+        'learned_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+    }
+
+
+def fetch_from_endpoint(endpoint):
+    """
+    Calls a stored menu endpoint with the plain HTTP client and returns its menu
+    text, or None when the call fails or the response no longer looks like a menu
+    (the caller then falls back to the browser).
+    """
+    url = render_template(endpoint['url'])
+    try:
+        with requests.request(
+            endpoint.get('method', 'GET'), url,
+            data=render_template(endpoint['body']).encode('utf-8') if endpoint.get('body') else None,
+            headers=endpoint.get('headers') or {},
+            timeout=API_TIMEOUT, stream=True,
+        ) as response:
+            response.raise_for_status()
+            content = response.raw.read(API_MAX_BYTES + 1, decode_content=True)
+            if len(content) > API_MAX_BYTES:
+                logger.warning(f"Menu endpoint {url} returned more than {API_MAX_BYTES} bytes.")
+                return None
+            body = content.decode(response.encoding or 'utf-8', errors='replace')
+            mime_type = response.headers.get('Content-Type', endpoint.get('mime_type', '')).lower()
+    except requests.exceptions.RequestException as e:
+        logger.warning(f"Menu endpoint {url} failed: {e}")
+        return None
+
+    text = response_text(body, mime_type)
+    if menu_signal_score(text) < MIN_BLOCK_SCORE:
+        logger.info(f"Menu endpoint {url} no longer returns a menu.")
+        return None
+    logger.info(f"Fetched menu from endpoint {url} without a browser.")
+    return text
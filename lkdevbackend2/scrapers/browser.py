@@ -0,0 +1,206 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from selenium import webdriver
+from selenium.common.exceptions import TimeoutException, WebDriverException
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.common.by import By
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Hard deadline (seconds) for navigation plus readiness waits
+BROWSER_DEADLINE_SECONDS = float(os.getenv('BROWSER_DEADLINE_SECONDS', '20'))
+# Readiness conditions waited for, in order: selector, network_idle, text_stable
+BROWSER_WAIT_CONDITIONS = [
+    condition.strip()
+    for condition in os.getenv('BROWSER_WAIT_CONDITIONS', 'selector,network_idle,text_stable').split(',')
+    if condition.strip()
+]
+BROWSER_BLOCK_IMAGES = os.getenv('BROWSER_BLOCK_IMAGES', '1') == '1'
+# Longest wait (seconds) for a known selector, so a broken recipe leaves time for discovery
+SELECTOR_WAIT_SECONDS = float(os.getenv('BROWSER_SELECTOR_WAIT_SECONDS', '8'))
+# Quiet period (seconds) that counts as network idle / stable text
+NETWORK_IDLE_SECONDS = 0.5
+TEXT_STABLE_SECONDS = 0.75
+POLL_SECONDS = 0.1
+
+# Counts the resources fetched so far, or -1 while the document is loading. The
+# resource timing buffer stops at 250 entries by default, after which its length
+# no longer changes and a busy page would look idle, so a PerformanceObserver
+# (which sees every entry) does the counting and the buffer is enlarged for
+# browsers without one
+RESOURCE_COUNT_SCRIPT = """
+if (document.readyState === 'loading') { return -1; }
+if (window.__resourceCount === undefined) {
+    performance.setResourceTimingBufferSize(100000);
+    window.__resourceCount = null;
+    if (window.PerformanceObserver) {
+        window.__resourceCount = 0;
+        new PerformanceObserver(function (list) { window.__resourceCount += list.getEntries().length; })
+            .observe({type: 'resource', buffered: true});
+    }
+}
+return window.__resourceCount === null
+    ? performance.getEntriesByType('resource').length
+    : window.__resourceCount;
+"""
+
+# URL patterns blocked through DevTools: heavy media, fonts, analytics, chat widgets
+# and video embeds never carry the menu text
+BLOCKED_URL_PATTERNS = [
+    '*.png', '*.jpg', '*.jpeg', '*.gif', '*.webp', '*.avif', '*.svg', '*.ico',
+    '*.woff', '*.woff2', '*.ttf', '*.otf', '*.eot',
+    '*.mp4', '*.webm', '*.mp3', '*.m3u8',
+    '*google-analytics.com*', '*googletagmanager.com*', '*doubleclick.net*',
+    '*connect.facebook.net*', '*hotjar.com*', '*clarity.ms*', '*intercom.io*',
+    '*tawk.to*', '*crisp.chat*', '*zendesk.com*', '*youtube.com/embed*', '*player.vimeo.com*',
+]
+BLOCKED_URL_PATTERNS += [
+    pattern.strip() for pattern in os.getenv('BROWSER_EXTRA_BLOCKED_URLS', '').split(',') if pattern.strip()
+]
+
+# Timings of the most recent browser visits
+_page_load_timings = deque(maxlen=500)
+_timings_lock = threading.Lock()
+
+
+def create_driver(block_resources=True, capture_network=False):
+    """
+    Starts headless Chrome. With block_resources, images are disabled and the URL
+    patterns in BLOCKED_URL_PATTERNS are blocked through the DevTools protocol.
+    With capture_network, the performance log (network events) is recorded.
+    """
+    options = Options()
+    options.add_argument('--headless=new')
+    # Return from navigation once the DOM is ready; readiness is waited for explicitly
+    options.page_load_strategy = 'eager'
+    if block_resources and BROWSER_BLOCK_IMAGES:
+        options.add_argument('--blink-settings=imagesEnabled=false')
+        options.add_experimental_option('prefs', {'profile.managed_default_content_settings.images': 2})
+    if capture_network:
+        options.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
+
+    driver = webdriver.Chrome(options=options)
+    if block_resources:
+        try:
+            driver.execute_cdp_cmd('Network.enable', {})
+            driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': BLOCKED_URL_PATTERNS})
+        except WebDriverException as e:
+            logger.warning(f"Could not enable resource blocking: {e.msg}")
+    return driver
+
+
+def remaining(deadline):
+    return max(0.0, deadline - time.monotonic())
+
+
+def load_page(driver, url, deadline):
+    """
+    Navigates to url within the deadline. A navigation that times out is stopped
+    and the partially loaded page is kept.
+    """
+    driver.set_page_load_timeout(max(1.0, remaining(deadline)))
+    try:
+        driver.get(url)
+    except TimeoutException:
+        logger.warning(f"Navigation to {url} hit the deadline; using the partially loaded page.")
+        try:
+            driver.execute_script('window.stop();')
+        except WebDriverException:
+            pass
+
+
+def wait_for_selector(driver, selector, deadline):
+    while remaining(deadline) > 0:
+        try:
+            if driver.find_elements(By.CSS_SELECTOR, selector):
+                return True
+        except WebDriverException:
+            return False
+        time.sleep(POLL_SECONDS)
+    return False
+
+
+def wait_for_network_idle(driver, deadline):
+    """
+    Waits until no new resource has been fetched for NETWORK_IDLE_SECONDS.
+    """
+    last_count = -1
+    quiet_since = time.monotonic()
+    while remaining(deadline) > 0:
+        count = driver.execute_script(RESOURCE_COUNT_SCRIPT)
+        if count != last_count or count < 0:
+            last_count = count
+            quiet_since = time.monotonic()
+        elif time.monotonic() - quiet_since >= NETWORK_IDLE_SECONDS:
+            return True
+        time.sleep(POLL_SECONDS)
+    return False
+
+
+def wait_for_text_stable(driver, deadline):
+    """
+    Waits until the page's visible text has stopped changing for TEXT_STABLE_SECONDS.
+    """
+    last_length = -1
+    stable_since = time.monotonic()
+    while remaining(deadline) > 0:
+        length = driver.execute_script("return document.body ? document.body.innerText.length : 0;")
+        if length != last_length or length == 0:
+            last_length = length
+            stable_since = time.monotonic()
+        elif time.monotonic() - stable_since >= TEXT_STABLE_SECONDS:
+            return True
+        time.sleep(POLL_SECONDS)
+    return False
+
+
+def wait_until_ready(driver, deadline, selector=None, conditions=None):
+    """
+    Waits for the readiness conditions in order, all sharing one hard deadline.
+    The selector condition is skipped when no selector is known. Returns the list
+    of conditions that were met.
+    """
+    met = []
+    for condition in conditions or BROWSER_WAIT_CONDITIONS:
+        try:
+            if condition == 'selector':
+                if not selector:
+                    continue
+                ok = wait_for_selector(driver, selector, min(deadline, time.monotonic() + SELECTOR_WAIT_SECONDS))
+            elif condition == 'network_idle':
+                ok = wait_for_network_idle(driver, deadline)
+            elif condition == 'text_stable':
+                ok = wait_for_text_stable(driver, deadline)
+            else:
+                logger.warning(f"Unknown readiness condition: {condition}")
+                continue
+        except WebDriverException as e:
+            logger.warning(f"Readiness check '{condition}' failed: {e.msg}")
+            ok = False
+        if ok:
+            met.append(condition)
+    return met
+
+
+def record_page_load(url, timings):
+    """
+    Logs and keeps the page-load timings of one browser visit.
+    """
+    with _timings_lock:
+        _page_load_timings.append(dict(timings, url=url))
+    logger.info(
+        f"Browser timings for {url}: " + ", ".join(
+            f"{name}={value:.2f}s" if isinstance(value, float) else f"{name}={value}"
+            for name, value in timings.items()
+        )
+    )
+
+
+def get_page_load_timings():
+    with _timings_lock:
+        return list(_page_load_timings)
@@ -0,0 +1,205 @@
+import logging
+import re
+import time
+
+from bs4 import BeautifulSoup
+from bs4.element import Comment, Declaration, Doctype, ProcessingInstruction
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Elements that never hold the menu
+NON_CONTENT_TAGS = {
+    'script', 'style', 'noscript', 'template', 'svg', 'iframe', 'button',
+    'nav', 'footer', 'head', 'title', 'meta', 'link',
+}
+# Elements that usually hold no menu, but sometimes do (a lunch sidebar, a menu
+# wrapped in an ASP.NET page form); they are dropped only when they score below
+# MIN_BLOCK_SCORE
+OPTIONAL_CONTENT_TAGS = {'aside', 'form'}
+# Elements considered as menu blocks
+BLOCK_TAGS = {'main', 'article', 'section', 'div', 'table', 'tbody', 'ul', 'ol', 'dl', 'body', 'aside', 'form'}
+# Non-text strings BeautifulSoup keeps in the tree
+SKIPPED_STRING_TYPES = (Comment, Declaration, Doctype, ProcessingInstruction)
+
+WEEKDAY_PATTERN = re.compile(
+    r'\b(måndag|tisdag|onsdag|torsdag|fredag|lördag|söndag|'
+    r'monday|tuesday|wednesday|thursday|friday|saturday|sunday)\b',
+    re.IGNORECASE,
+)
+PRICE_PATTERN = re.compile(r'\b\d{2,3}\s*(?:kr\b|sek\b|:-)', re.IGNORECASE)
+WEEK_PATTERN = re.compile(r'\b(?:vecka|v\.)\s*\d{1,2}\b|\bveckans\b', re.IGNORECASE)
+
+# Signal weights: distinct weekdays matter most, then week markers, then prices
+WEEKDAY_WEIGHT = 3
+WEEK_WEIGHT = 2
+PRICE_WEIGHT = 1
+# A block must score at least this to be used instead of the whole page
+MIN_BLOCK_SCORE = 6
+# The smallest block keeping this share of the best score is returned
+BLOCK_SCORE_RATIO = 0.8
+
+
+def iter_content_strings(element):
+    """
+    Yields the text strings of element in document order, skipping comments,
+    anything inside non-content elements (scripts, styles, navigation, footers...)
+    and asides and forms without enough menu signals.
+    """
+    strings = [
+        string for string in element.find_all(string=True)
+        if not isinstance(string, SKIPPED_STRING_TYPES)
+        and not any(parent.name in NON_CONTENT_TAGS for parent in string.parents)
+    ]
+
+    # Score each aside and form by its own strings, innermost first
+    optional_text = {}
+    for string in strings:
+        for parent in string.parents:
+            if parent.name in OPTIONAL_CONTENT_TAGS:
+                optional_text.setdefault(id(parent), []).append(str(string))
+    dropped = {
+        key for key, texts in optional_text.items()
+        if menu_signal_score(' '.join(texts)) < MIN_BLOCK_SCORE
+    }
+
+    for string in strings:
+        if dropped and any(id(parent) in dropped for parent in string.parents if parent.name in OPTIONAL_CONTENT_TAGS):
+            continue
+        yield string
+
+
+def content_text(element):
+    """
+    The content text of element with whitespace collapsed to single spaces.
+    """
+    return ' '.join(' '.join(iter_content_strings(element)).split())
+
+
+def score_blocks(soup):
+    """
+    Scores every block element by the menu signals in its content text. Signals of
+    each string are added to all of its block ancestors in a single pass over the
+    text. Returns a list of (element, score, length, has_week_marker).
+    """
+    stats = {}
+    for string in iter_content_strings(soup):
+        text = str(string)
+        length = len(text.strip())
+        if not length:
+            continue
+        weekdays = {match.lower() for match in WEEKDAY_PATTERN.findall(text)}
+        prices = len(PRICE_PATTERN.findall(text))
+        weeks = len(WEEK_PATTERN.findall(text))
+        for parent in string.parents:
+            if parent.name not in BLOCK_TAGS:
+                continue
+            entry = stats.get(id(parent))
+            if entry is None:
+                entry = stats[id(parent)] = {'element': parent, 'weekdays': set(), 'prices': 0, 'weeks': 0, 'length': 0}
+            entry['weekdays'] |= weekdays
+            entry['prices'] += prices
+            entry['weeks'] += weeks
+            entry['length'] += length
+
+    return [
+        (
+            entry['element'],
+            WEEKDAY_WEIGHT * len(entry['weekdays'])
+            + WEEK_WEIGHT * min(entry['weeks'], 2)
+            + PRICE_WEIGHT * min(entry['prices'], 10),
+            entry['length'],
+            entry['weeks'] > 0,
+        )
+        for entry in stats.values()
+    ]
+
+
+def menu_signal_score(text):
+    """
+    Scores a piece of text by the same weekday, week-marker and price signals used
+    to rank blocks.
+    """
+    weekdays = {match.lower() for match in WEEKDAY_PATTERN.findall(text or '')}
+    return (
+        WEEKDAY_WEIGHT * len(weekdays)
+        + WEEK_WEIGHT * min(len(WEEK_PATTERN.findall(text or '')), 2)
+        + PRICE_WEIGHT * min(len(PRICE_PATTERN.findall(text or '')), 10)
+    )
+
+
+def find_main_block(soup):
+    """
+    Returns the block element that best looks like a lunch menu: the smallest block
+    keeping most of the page's weekday, price and week signals. A block is never
+    chosen over its parent if that drops the week marker, which later stages need
+    to date the menu. Returns None when no block scores high enough.
+    """
+    blocks = score_blocks(soup)
+    best = max(blocks, key=lambda block: block[1], default=None)
+    if best is None or best[1] < MIN_BLOCK_SCORE:
+        return None
+
+    candidates = [
+        block for block in blocks
+        if block[1] >= BLOCK_SCORE_RATIO * best[1] and (block[3] or not best[3])
+    ]
+    element, score, length, _ = min(candidates, key=lambda block: block[2])
+    logger.info(f"Selected <{element.name}> block with score {score} ({length} characters).")
+    return element
+
+
+def extract_main_content(soup):
+    """
+    Returns the content text of the main menu block (see find_main_block), or of
+    the whole page when no block has enough menu signals.
+    """
+    element = find_main_block(soup)
+    if element is None:
+        logger.info("No block with enough menu signals; using the whole page text.")
+        return content_text(soup)
+    return content_text(element)
+
+
+def benchmark_text_extraction(html_paths, parsers=('html.parser', 'lxml')):
+    """
+    Compares parse time and output size of the full-page text and the main-content
+    text over captured pages, for each available parser.
+    """
+    report = {}
+    for parser in parsers:
+        parse_seconds = 0.0
+        extract_seconds = 0.0
+        full_chars = 0
+        main_chars = 0
+        try:
+            for path in html_paths:
+                with open(path, 'rb') as f:
+                    html = f.read()
+                start = time.perf_counter()
+                soup = BeautifulSoup(html, parser)
+                parse_seconds += time.perf_counter() - start
+                full_chars += len(' '.join(soup.get_text(separator=' ').split()))
+                start = time.perf_counter()
+                main_chars += len(extract_main_content(soup))
+                extract_seconds += time.perf_counter() - start
+        except Exception as e:
+            logger.warning(f"Skipping parser {parser}: {e}")
+            continue
+
+        report[parser] = {
+            'mean_parse_seconds': parse_seconds / max(1, len(html_paths)),
+            'mean_extract_seconds': extract_seconds / max(1, len(html_paths)),
+            'full_text_chars': full_chars,
+            'main_content_chars': main_chars,
+        }
+        logger.info(f"Text extraction with {parser}: {report[parser]}")
+    return report
+
+
+if __name__ == "__main__":
+    # Usage: python -m scrapers.content_extraction captured/*.html
+    import sys
+
+    logging.basicConfig(level=logging.INFO)
+    benchmark_text_extraction(sys.argv[1:])
@@ -0,0 +1,249 @@
+import logging
+import mmap
+import os
+import re
+import tempfile
+from io import BytesIO
+
+import requests
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Largest body accepted by default (bytes)
+DOWNLOAD_MAX_BYTES = int(os.getenv('DOWNLOAD_MAX_BYTES', str(25 * 1024 * 1024)))
+# Bodies larger than this are spooled to a temporary file instead of memory
+DOWNLOAD_SPOOL_BYTES = int(os.getenv('DOWNLOAD_SPOOL_BYTES', str(2 * 1024 * 1024)))
+DOWNLOAD_TIMEOUT = int(os.getenv('DOWNLOAD_TIMEOUT', '30'))
+CHUNK_SIZE = 64 * 1024
+# Bytes looked at when sniffing the content
+SNIFF_BYTES = 1024
+
+HTML_KINDS = ('html',)
+PDF_KINDS = ('pdf',)
+IMAGE_KINDS = ('jpeg', 'png', 'gif', 'webp')
+
+_MAGIC_NUMBERS = (
+    (b'%PDF-', 'pdf'),
+    (b'\xff\xd8\xff', 'jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+)
+
+_CONTENT_TYPE_KINDS = {
+    'application/pdf': 'pdf',
+    'image/jpeg': 'jpeg',
+    'image/jpg': 'jpeg',
+    'image/png': 'png',
+    'image/gif': 'gif',
+    'image/webp': 'webp',
+    'text/html': 'html',
+    'application/xhtml+xml': 'html',
+}
+
+_HTML_MARKERS = (b'<!doctype html', b'<html', b'<head', b'<body', b'<meta', b'<title')
+
+
+class DownloadedContent:
+    """
+    A downloaded body, held in memory when small and in a temporary file (exposed
+    through a memory map) when large. Use as a context manager, or call close(),
+    to release the temporary file. A shared download (cached for a run, see
+    page_document.get_run_download) ignores close() until it is released.
+    """
+
+    def __init__(self, url, kind, content_type, encoding, size, buffer=None, path=None):
+        self.url = url
+        self.kind = kind
+        self.content_type = content_type
+        self.encoding = encoding
+        self.size = size
+        self.path = path
+        self._buffer = buffer
+        self._file = None
+        self._mmap = None
+        self.shared = False
+
+    @property
+    def content(self):
+        """
+        The body as a bytes-like object: bytes for small bodies, a read-only memory
+        map of the spool file for large ones.
+        """
+        if self._buffer is not None:
+            return self._buffer
+        if self._mmap is None:
+            self._file = open(self.path, 'rb')
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._mmap
+
+    @property
+    def text(self):
+        return bytes(self.content).decode(self.encoding or 'utf-8', errors='replace')
+
+    def close(self):
+        if self.shared:
+            return
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self.path:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+            self.path = None
+
+    def release(self):
+        """
+        Closes a shared download for good.
+        """
+        self.shared = False
+        self.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def sniff_kind(head, content_type=''):
+    """
+    Identifies the body type from its first bytes (magic numbers and HTML markers),
+    falling back to the declared Content-Type. Returns 'pdf', 'jpeg', 'png', 'gif',
+    'webp', 'html' or 'unknown'.
+    """
+    for magic, kind in _MAGIC_NUMBERS:
+        if head.startswith(magic):
+            return kind
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'webp'
+
+    # Some servers prepend a BOM, whitespace or comments to HTML
+    lowered = head[:SNIFF_BYTES].lstrip(b'\xef\xbb\xbf \t\r\n').lower()
+    if any(marker in lowered for marker in _HTML_MARKERS):
+        return 'html'
+
+    return declared_kind(content_type) or 'unknown'
+
+
+def declared_kind(content_type):
+    """
+    Maps a Content-Type header to a kind, or None when it is missing or generic.
+    """
+    media_type = (content_type or '').split(';')[0].strip().lower()
+    if media_type in _CONTENT_TYPE_KINDS:
+        return _CONTENT_TYPE_KINDS[media_type]
+    if media_type.startswith(('video/', 'audio/')) or media_type in ('application/zip', 'application/x-rar-compressed'):
+        return media_type
+    return None
+
+
+def detect_html_encoding(head, content_type):
+    """
+    Returns the charset declared in the Content-Type header, else the one in a
+    <meta> tag near the top of the document, else None, so the parser can detect
+    it from the bytes (many Swedish pages are undeclared cp1252).
+    """
+    match = re.search(r'charset=([\w\-]+)', content_type or '', re.IGNORECASE)
+    if match:
+        return match.group(1)
+    match = re.search(rb'<meta[^>]+charset=["\']?([\w\-]+)', head, re.IGNORECASE)
+    if match:
+        return match.group(1).decode('ascii', errors='ignore')
+    return None
+
+
+def download_url(url, expected_kinds=None, max_bytes=DOWNLOAD_MAX_BYTES, verify=True, timeout=DOWNLOAD_TIMEOUT):
+    """
+    Streams the body of url with a byte cap. The download is aborted early when:
+        - Content-Length exceeds max_bytes,
+        - the declared Content-Type is a known type not in expected_kinds,
+        - the sniffed magic bytes are not in expected_kinds, or
+        - the streamed body exceeds max_bytes.
+    Returns a DownloadedContent, or None if the download failed or was aborted.
+    """
+    spool_file = None
+    spool_path = None
+    try:
+        with requests.get(url, stream=True, verify=verify, timeout=timeout) as response:
+            response.raise_for_status()
+            content_type = response.headers.get('Content-Type', '')
+
+            content_length = response.headers.get('Content-Length')
+            if content_length and content_length.isdigit() and int(content_length) > max_bytes:
+                logger.warning(f"Skipping {url}: Content-Length {content_length} exceeds the {max_bytes} byte limit.")
+                return None
+
+            declared = declared_kind(content_type)
+            # HTML is still sniffed, since servers often label downloads as text/html
+            if expected_kinds and declared and declared != 'html' and declared not in expected_kinds:
+                logger.warning(f"Skipping {url}: declared Content-Type '{content_type}' is not one of {expected_kinds}.")
+                return None
+
+            buffer = BytesIO()
+            kind = None
+            head = b''
+            received = 0
+
+            for chunk in response.iter_content(CHUNK_SIZE):
+                if not chunk:
+                    continue
+
+                received += len(chunk)
+                if received > max_bytes:
+                    logger.warning(f"Aborting download of {url}: body exceeds the {max_bytes} byte limit.")
+                    return None
+
+                if kind is None:
+                    head = (head + chunk)[:SNIFF_BYTES]
+                    if len(head) >= SNIFF_BYTES:
+                        kind = sniff_kind(head, content_type)
+                        if expected_kinds and kind not in expected_kinds:
+                            logger.warning(f"Skipping {url}: content looks like '{kind}', expected one of {expected_kinds}.")
+                            return None
+
+                if spool_file is None and received > DOWNLOAD_SPOOL_BYTES:
+                    # Move the body to disk once it outgrows the in-memory budget
+                    fd, spool_path = tempfile.mkstemp(prefix='download-')
+                    spool_file = os.fdopen(fd, 'wb')
+                    spool_file.write(buffer.getvalue())
+                    buffer = None
+
+                (spool_file or buffer).write(chunk)
+
+            if kind is None:
+                kind = sniff_kind(head, content_type)
+                if expected_kinds and kind not in expected_kinds:
+                    logger.warning(f"Skipping {url}: content looks like '{kind}', expected one of {expected_kinds}.")
+                    return None
+
+            encoding = detect_html_encoding(head, content_type) if kind == 'html' else response.encoding
+            final_url = response.url
+
+        logger.info(f"Downloaded {url} ({received} bytes, {kind}).")
+        if spool_file is not None:
+            spool_file.close()
+            spool_file = None
+            download = DownloadedContent(final_url, kind, content_type, encoding, received, path=spool_path)
+            spool_path = None
+            return download
+        return DownloadedContent(final_url, kind, content_type, encoding, received, buffer=buffer.getvalue())
+
+    except requests.exceptions.RequestException as e:
+        logger.error(f"Failed to download {url}: {e}")
+        return None
+    finally:
+        # Clean up when the download was aborted or failed after spooling started
+        if spool_file is not None:
+            spool_file.close()
+        if spool_path:
+            try:
+                os.remove(spool_path)
+            except OSError:
+                pass
@@ -1,14 +1,138 @@
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
+import logging
+import time
+
+from bs4 import BeautifulSoup
+from selenium.common.exceptions import WebDriverException
+from selenium.webdriver.common.by import By
+
+from .api_discovery import collect_network_responses, fetch_from_endpoint, find_menu_endpoint
+from .browser import (
+    BROWSER_DEADLINE_SECONDS,
+    create_driver,
+    get_page_load_timings,
+    load_page,
+    record_page_load,
+    wait_until_ready,
+)
+from .content_extraction import find_main_block
+from .page_document import HTML_PARSER
+from .recipes import is_valid_recipe_text, make_recipe
+
+# Configure logging
+logger = logging.getLogger(__name__)
 
 def scrape_dynamic_content(url):
-    options = Options()
-    options.headless = True
-    driver = webdriver.Chrome(options=options)
-    driver.get(url)
-    # Handle pop-ups and dynamic content
-    # Wait for elements to load
-    menu_element = driver.find_element_by_id('menu')
-    menu_text = menu_element.text
-    driver.quit()
+    menu_text, _, _ = scrape_dynamic_content_with_recipe(url)
     return menu_text
+
+def read_element_text(driver, selector):
+    """
+    Returns the rendered text of the element matching selector, or None.
+    """
+    try:
+        return driver.find_element(By.CSS_SELECTOR, selector).text
+    except WebDriverException as e:
+        logger.info(f"Selector '{selector}' not found on the rendered page: {e.msg}")
+        return None
+
+def scrape_dynamic_content_with_recipe(url, recipe=None, endpoint=None, block_resources=True, discover_api=True):
+    """
+    Extracts the menu of a JavaScript-rendered page. Returns (menu_text, recipe, endpoint).
+
+    A stored endpoint (the JSON/XHR call the page's menu widget makes) is called
+    directly with the plain HTTP client. When there is none, or it stopped
+    returning a menu, the page is rendered in headless Chrome: images, fonts,
+    media, analytics and chat widgets are blocked, and the page is read once it is
+    ready (recipe selector present, network idle, text stable) or the hard
+    deadline passes. A stored recipe sends the extraction straight to the menu
+    node; otherwise the rendered DOM is searched for the menu container and a new
+    recipe is learned. With discover_api, the visit's network responses are
+    recorded and the one carrying the menu is returned as the new endpoint.
+    """
+    if endpoint:
+        menu_text = fetch_from_endpoint(endpoint)
+        if menu_text:
+            return menu_text, recipe, endpoint
+        logger.info(f"Stored menu endpoint for {url} stopped working; falling back to the browser.")
+        endpoint = None
+
+    timings = {'resources_blocked': block_resources}
+    start = time.monotonic()
+    driver = create_driver(block_resources=block_resources, capture_network=discover_api)
+    timings['driver_start'] = time.monotonic() - start
+    try:
+        deadline = time.monotonic() + BROWSER_DEADLINE_SECONDS
+        step = time.monotonic()
+        load_page(driver, url, deadline)
+        timings['navigation'] = time.monotonic() - step
+
+        selector = recipe.get('selector') if recipe and recipe.get('strategy') == 'dynamic' else None
+        step = time.monotonic()
+        timings['ready'] = ','.join(wait_until_ready(driver, deadline, selector=selector)) or 'deadline'
+        timings['readiness'] = time.monotonic() - step
+
+        if discover_api:
+            step = time.monotonic()
+            try:
+                endpoint = find_menu_endpoint(collect_network_responses(driver))
+            except WebDriverException as e:
+                logger.warning(f"Could not read the network log of {url}: {e.msg}")
+            timings['api_discovery'] = time.monotonic() - step
+
+        step = time.monotonic()
+        try:
+            if selector:
+                menu_text = read_element_text(driver, selector)
+                if is_valid_recipe_text(menu_text):
+                    logger.info(f"Extracted menu with recipe selector '{selector}'.")
+                    return menu_text, recipe, endpoint
+                logger.info(f"Recipe selector '{selector}' no longer holds a menu; rediscovering.")
+
+            # Discovery: the conventional #menu container if it holds a menu (sites use
+            # the id for their navigation too), else the block with the most menu signals
+            soup = BeautifulSoup(driver.page_source, HTML_PARSER)
+            element = soup.find(id='menu')
+            if element is not None and not is_valid_recipe_text(element.get_text(separator='\n', strip=True)):
+                logger.info(f"The #menu element of {url} holds no menu; searching the page.")
+                element = None
+            element = element or find_main_block(soup)
+            if element is None:
+                logger.warning(f"No menu container found on {url}")
+                return None, recipe, endpoint
+
+            new_recipe = make_recipe(element, 'dynamic')
+            if new_recipe:
+                menu_text = read_element_text(driver, new_recipe['selector'])
+                if menu_text:
+                    return menu_text, new_recipe, endpoint
+            return element.get_text(separator='\n', strip=True), recipe, endpoint
+        finally:
+            timings['extraction'] = time.monotonic() - step
+    finally:
+        driver.quit()
+        timings['total'] = time.monotonic() - start
+        record_page_load(url, timings)
+
+def benchmark_resource_blocking(urls):
+    """
+    Loads each site with and without resource blocking and reports the mean total
+    page time of both, so the savings can be compared per site.
+    """
+    report = {}
+    for url in urls:
+        for block_resources in (False, True):
+            scrape_dynamic_content_with_recipe(url, block_resources=block_resources, discover_api=False)
+        runs = [timing for timing in get_page_load_timings() if timing['url'] == url]
+        report[url] = {
+            'unblocked_total': runs[-2]['total'],
+            'blocked_total': runs[-1]['total'],
+        }
+        logger.info(f"Resource blocking for {url}: {report[url]}")
+    return report
+
+if __name__ == "__main__":
+    # Usage: python -m scrapers.dynamic_scraper https://example.se/lunch ...
+    import sys
+
+    logging.basicConfig(level=logging.INFO)
+    benchmark_resource_blocking(sys.argv[1:])
@@ -1,42 +1,183 @@
 import requests
 import os
+import json
+import logging
+import time
+import datetime
 from dotenv import load_dotenv
-import os
 
 load_dotenv()  # Load variables from .env file into the environment
 
-def scrape_facebook_post(page_url):
-    access_token = os.getenv('FACEBOOK_ACCESS_TOKEN')
-    if not access_token:
-        print("Facebook access token not set.")
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Graph API location; point FACEBOOK_GRAPH_URL at a fake server for testing
+FACEBOOK_GRAPH_URL = os.getenv('FACEBOOK_GRAPH_URL', 'https://graph.facebook.com').rstrip('/')
+FACEBOOK_GRAPH_VERSION = os.getenv('FACEBOOK_GRAPH_VERSION', 'v12.0')
+# Graph accepts at most 50 requests per batch
+FACEBOOK_BATCH_SIZE = min(50, int(os.getenv('FACEBOOK_BATCH_SIZE', '50')))
+FACEBOOK_POST_FIELDS = 'message,created_time'
+FACEBOOK_POST_LIMIT = 5
+FACEBOOK_TIMEOUT = 30
+# App usage (percent of the hourly limit) above which batches are slowed down / stopped
+FACEBOOK_USAGE_SLOWDOWN = int(os.getenv('FACEBOOK_USAGE_SLOWDOWN', '75'))
+FACEBOOK_USAGE_STOP = int(os.getenv('FACEBOOK_USAGE_STOP', '95'))
+FACEBOOK_SLOWDOWN_SECONDS = 5
+# Graph error codes that mean the app or page is being throttled
+RATE_LIMIT_ERROR_CODES = {4, 17, 32, 613}
+
+def page_identifier_from_url(page_url):
+    """
+    Extracts the page ID or username from a Facebook page URL, or None.
+    """
+    if 'facebook.com/' not in (page_url or ''):
         return None
+    return page_url.split('facebook.com/')[-1].split('/')[0].split('?')[0] or None
 
-    # Extract the page ID or username from the URL
-    if 'facebook.com/' not in page_url:
-        print("Invalid Facebook page URL.")
+def is_menu_post(message):
+    message = (message or '').lower()
+    return 'lunch' in message or 'dagens' in message
+
+def parse_created_time(created_time):
+    """
+    Converts a Graph created_time ('2024-10-14T09:30:00+0000') to a Unix timestamp.
+    """
+    try:
+        return int(datetime.datetime.strptime(created_time, '%Y-%m-%dT%H:%M:%S%z').timestamp())
+    except (TypeError, ValueError):
         return None
 
-    page_identifier = page_url.split('facebook.com/')[-1].split('/')[0]
+def app_usage_percent(headers):
+    """
+    Returns the highest percentage reported in the X-App-Usage header (call count,
+    total time, CPU time), or 0 when the header is missing.
+    """
+    for name, value in (headers or {}).items():
+        if name.lower() == 'x-app-usage':
+            try:
+                return max(int(v) for v in json.loads(value).values())
+            except (ValueError, TypeError, AttributeError):
+                return 0
+    return 0
+
+def build_posts_request(page_id, since=None):
+    relative_url = f"{page_id}/posts?fields={FACEBOOK_POST_FIELDS}&limit={FACEBOOK_POST_LIMIT}"
+    if since:
+        relative_url += f"&since={int(since) + 1}"
+    return {'method': 'GET', 'relative_url': relative_url}
 
-    # Use Facebook Graph API to get the latest posts
-    api_url = f"https://graph.facebook.com/v12.0/{page_identifier}/posts"
-    params = {
-        'access_token': access_token,
-        'fields': 'message',
-        'limit': 5  # Fetch the latest 5 posts
-    }
-    response = requests.get(api_url, params=params)
+def fetch_posts_batch(pages, access_token):
+    """
+    Fetches the new posts of up to FACEBOOK_BATCH_SIZE pages in one Graph batch
+    request. pages is a list of (page_id, since). Returns (results, usage) where
+    results maps page_id to {'posts': [...]} or {'error': {...}}, and usage is the
+    app usage percentage reported by Graph.
+    """
+    response = requests.post(
+        f"{FACEBOOK_GRAPH_URL}/{FACEBOOK_GRAPH_VERSION}/",
+        data={
+            'access_token': access_token,
+            'include_headers': 'false',
+            'batch': json.dumps([build_posts_request(page_id, since) for page_id, since in pages]),
+        },
+        timeout=FACEBOOK_TIMEOUT,
+    )
+    usage = app_usage_percent(response.headers)
     if response.status_code != 200:
-        print(f"Failed to fetch posts from Facebook: {response.json().get('error', {})}")
-        return None
+        error = response.json().get('error', {}) if response.content else {}
+        logger.error(f"Facebook batch request failed: {error}")
+        return {page_id: {'error': error} for page_id, _ in pages}, usage
+
+    results = {}
+    for (page_id, _), item in zip(pages, response.json()):
+        if not item:
+            # Graph leaves null entries for requests it did not get to
+            results[page_id] = {'error': {'message': 'Request not processed'}}
+            continue
+        body = json.loads(item.get('body') or '{}')
+        if item.get('code') != 200:
+            results[page_id] = {'error': body.get('error', {})}
+        else:
+            results[page_id] = {'posts': body.get('data', [])}
+    return results, usage
+
+def scrape_facebook_posts(pages):
+    """
+    Fetches the latest menu post of many Facebook pages with a few batched Graph
+    calls. pages is a list of (key, page_url, since), where since is the Unix
+    timestamp of the newest post seen on a previous run (or None); only posts
+    after it are requested.
 
-    data = response.json()
-    posts = data.get('data', [])
+    Returns a dict mapping key to {'text': menu post or None, 'newest': timestamp
+    of the newest post returned, or the previous since}. Pages that could not be
+    fetched (errors, rate limits) are left out. Batching slows down when the
+    X-App-Usage header passes FACEBOOK_USAGE_SLOWDOWN percent and stops for the run
+    above FACEBOOK_USAGE_STOP percent or on a throttling error.
+    """
+    access_token = os.getenv('FACEBOOK_ACCESS_TOKEN')
+    if not access_token:
+        logger.error("Facebook access token not set.")
+        return {}
+
+    keys_by_page = {}
+    for key, page_url, since in pages:
+        page_id = page_identifier_from_url(page_url)
+        if not page_id:
+            logger.warning(f"Invalid Facebook page URL: {page_url}")
+            continue
+        keys_by_page.setdefault(page_id, []).append((key, since))
+
+    # Restaurants sharing a page get one request, for posts after the oldest since
+    # among them (or all posts if one of them has none)
+    requests_to_send = [
+        (page_id, None if not all(since for _, since in keys) else min(since for _, since in keys))
+        for page_id, keys in keys_by_page.items()
+    ]
+
+    results = {}
+    calls = 0
+    for start in range(0, len(requests_to_send), FACEBOOK_BATCH_SIZE):
+        batch = requests_to_send[start:start + FACEBOOK_BATCH_SIZE]
+        try:
+            batch_results, usage = fetch_posts_batch(batch, access_token)
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logger.error(f"Facebook batch request failed: {e}")
+            break
+        calls += 1
+
+        throttled = False
+        for page_id, result in batch_results.items():
+            if 'error' in result:
+                logger.warning(f"Failed to fetch posts for Facebook page {page_id}: {result['error']}")
+                throttled = throttled or result['error'].get('code') in RATE_LIMIT_ERROR_CODES
+                continue
+            posts = [(post, parse_created_time(post.get('created_time'))) for post in result['posts']]
+            for key, since in keys_by_page[page_id]:
+                # Only the posts this restaurant has not seen yet
+                unseen = [(post, created) for post, created in posts if not since or (created and created > since)]
+                menu_post = next((post['message'] for post, _ in unseen if is_menu_post(post.get('message'))), None)
+                newest = max([created for _, created in unseen if created] or [0])
+                results[key] = {'text': menu_post, 'newest': max(newest, since or 0) or None}
+
+        if throttled or usage >= FACEBOOK_USAGE_STOP:
+            logger.warning(f"Facebook rate limit reached (app usage {usage}%); stopping for this run.")
+            break
+        if usage >= FACEBOOK_USAGE_SLOWDOWN and start + FACEBOOK_BATCH_SIZE < len(requests_to_send):
+            logger.info(f"Facebook app usage at {usage}%; slowing down.")
+            time.sleep(FACEBOOK_SLOWDOWN_SECONDS)
+
+    logger.info(f"Fetched Facebook posts for {len(results)} restaurants with {calls} batch calls.")
+    return results
+
+def scrape_facebook_post(page_url, since=None):
+    # Extract the page ID or username from the URL
+    if not page_identifier_from_url(page_url):
+        logger.warning(f"Invalid Facebook page URL: {page_url}")
+        return None
 
-    for post in posts:
-        message = post.get('message', '').lower()
-        if 'lunch' in message or 'dagens' in message:
-            return post['message']
+    result = scrape_facebook_posts([(page_url, page_url, since)]).get(page_url)
+    if result and result['text']:
+        return result['text']
 
-    print("No recent posts containing 'lunch' or 'dagens' found.")
+    logger.info("No recent posts containing 'lunch' or 'dagens' found.")
     return None
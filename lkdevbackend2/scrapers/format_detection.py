@@ -0,0 +1,99 @@
+import logging
+import re
+
+from .content_extraction import MIN_BLOCK_SCORE, menu_signal_score
+from .downloads import IMAGE_KINDS, PDF_KINDS
+from .page_document import get_link_download, get_page_document
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Formats in the order of their cost, cheapest first
+FORMAT_COSTS = ['TEXT', 'PDF', 'IMAGE', 'DYNAMIC']
+# Less visible text than this (characters) on a page with scripts suggests a JS-only shell
+JS_SHELL_MAX_TEXT = 200
+# Mount points of single-page-app frameworks
+JS_SHELL_MOUNT_IDS = ('root', 'app', '__next', '__nuxt', 'svelte', 'main-app')
+# Width or height (px) from which an image is large enough to carry a menu
+LARGE_IMAGE_PIXELS = 400
+MENU_NAME_PATTERN = re.compile(r'lunch|meny|menu|dagens|veckans', re.IGNORECASE)
+# Certificate verification when probing links, as in the text scraper: many
+# restaurant sites have broken certificates, and a link the text scraper can read
+# must not be detected as unreachable (and the fetched page is then shared with it)
+DETECTION_VERIFY = False
+
+
+def is_js_shell(document):
+    """
+    True when the page has scripts but almost no text, or an empty framework mount point.
+    """
+    if not document.soup.find('script'):
+        return False
+    if len(document.text) < JS_SHELL_MAX_TEXT:
+        return True
+    for mount_id in JS_SHELL_MOUNT_IDS:
+        mount = document.soup.find(id=mount_id)
+        if mount is not None and not mount.get_text(strip=True):
+            return True
+    return False
+
+
+def is_menu_image(img):
+    """
+    True for <img> tags that are large or named like a menu.
+    """
+    for attribute in ('width', 'height'):
+        value = str(img.get(attribute, '')).rstrip('px')
+        if value.isdigit() and int(value) >= LARGE_IMAGE_PIXELS:
+            return True
+    return bool(MENU_NAME_PATTERN.search(' '.join([img.get('src', ''), img.get('alt', '')])))
+
+
+def detect_format(url):
+    """
+    Cheaply guesses the lunch_format of a link without running a scraper:
+        - Facebook URLs are 'FACEBOOK POST',
+        - PDF or image bodies (magic bytes, Content-Type) are 'PDF' / 'IMAGE',
+        - HTML with menu text in the page is 'TEXT', a JS-only shell 'DYNAMIC',
+          and a page linking a PDF or showing a large menu image 'PDF' / 'IMAGE'.
+
+    Returns a dict with 'format' (the best guess), 'candidates' (the formats worth
+    trying, best first, then by cost) and 'reason'.
+    """
+    if 'facebook.com/' in (url or '').lower():
+        return {'format': 'FACEBOOK POST', 'candidates': ['FACEBOOK POST'], 'reason': 'facebook url'}
+
+    # One download: an HTML page is parsed (and shared with the scrapers), a PDF
+    # or image body is kept for the scraper that processes it directly
+    document = get_page_document(url, verify=DETECTION_VERIFY)
+    if document is None:
+        download = get_link_download(url, PDF_KINDS + IMAGE_KINDS, verify=DETECTION_VERIFY)
+        if not download:
+            # Unreachable for plain HTTP (blocked, unknown content): only a browser may get through
+            return {'format': 'DYNAMIC', 'candidates': ['DYNAMIC'], 'reason': 'no html, pdf or image body'}
+        download.close()
+        if download.kind in PDF_KINDS:
+            return {'format': 'PDF', 'candidates': ['PDF'], 'reason': 'pdf body'}
+        return {'format': 'IMAGE', 'candidates': ['IMAGE'], 'reason': f"{download.kind} body"}
+
+    evidence = []
+    if menu_signal_score(document.main_text) >= MIN_BLOCK_SCORE:
+        evidence.append(('TEXT', 'menu text in page'))
+    if is_js_shell(document):
+        evidence.append(('DYNAMIC', 'javascript shell'))
+    if document.pdf_candidates:
+        evidence.append(('PDF', 'pdf link'))
+    if any(is_menu_image(img) for img in document.soup.find_all('img') if img.get('src')):
+        evidence.append(('IMAGE', 'large image'))
+    if not evidence:
+        evidence.append(('TEXT', 'plain html'))
+
+    candidates = [name for name, _ in evidence]
+    # The dynamic scraper renders anything the cheaper ones miss
+    if 'DYNAMIC' not in candidates:
+        candidates.append('DYNAMIC')
+    candidates = candidates[:1] + sorted(candidates[1:], key=FORMAT_COSTS.index)
+
+    detected = {'format': candidates[0], 'candidates': candidates, 'reason': evidence[0][1]}
+    logger.info(f"Detected format {detected['format']} for {url} ({detected['reason']}); candidates {candidates}.")
+    return detected
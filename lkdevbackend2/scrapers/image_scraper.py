@@ -1,5 +1,3 @@
-import requests
-from bs4 import BeautifulSoup
 import pytesseract
 from PIL import Image
 import logging
@@ -7,84 +5,130 @@ from io import BytesIO
 import cv2
 import numpy as np
 import re
+import os
+
+from .downloads import download_url, IMAGE_KINDS
+from .page_document import get_link_download, get_page_document, get_run_download, page_run
+from .shared_pages import ocr_regions
+from .weeks import KNOWN_WEEK, classify_source_week
+from .image_preprocessing import normalize_image_for_ocr
+from .layout import crop_text_region
+from .ocr import (
+    ocr_with_confidence,
+    is_acceptable_ocr,
+    best_ocr_result,
+    record_ocr_result,
+    summarize_ocr_results,
+    record_ocr_retry,
+)
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
+# Largest image downloaded for OCR (bytes)
+IMAGE_MAX_BYTES = int(os.getenv('IMAGE_MAX_BYTES', str(15 * 1024 * 1024)))
+
 # Set the path to the Tesseract executable (adjust the path as needed)
 pytesseract.pytesseract.tesseract_cmd = r'C:\Users\mohammed.amayri\AppData\Local\Programs\Tesseract-OCR\tesseract.exe'
 
-def scrape_image(url):
+def scrape_image(url, known_weeks=None, preprocessing=None, details=None):
     """
-    Scrapes images from the provided URL, filters based on size and relevance,
-    and extracts text from the identified lunch menu image using OCR.
+    Scrapes images from the provided URL (or the URL itself, when it is an
+    image), filters based on size and relevance, and extracts text from the
+    identified lunch menu image using OCR.
+    Images whose filename or alt text mark them as being for a past week, or a
+    week in known_weeks, are skipped; KNOWN_WEEK is returned when nothing else
+    was found.
+    preprocessing and details are passed on to process_image_for_menu_text.
     """
-    try:
-        # Fetch the webpage content
-        response = requests.get(url)
-        response.raise_for_status()
-        html_content = response.content
-
-        # Parse the HTML content with BeautifulSoup
-        soup = BeautifulSoup(html_content, 'html.parser')
-        img_tags = soup.find_all('img')
-
-        if not img_tags:
-            logger.info("No images found on the page.")
-            return None
-
-        extracted_texts = []
-        for img_tag in img_tags:
-            img_url = img_tag.get('src')
-            if not img_url:
-                continue
-
-            # Handle relative URLs
-            img_url = requests.compat.urljoin(url, img_url)
-
-            logger.info(f"Processing image: {img_url}")
+    # Shares the fetch of a directly linked image with its processing, also when
+    # called outside a batch run
+    with page_run():
+        try:
+            # Fetch and parse the webpage (shared with the other scrapers during a run)
+            document = get_page_document(url)
+            if document:
+                img_candidates = document.image_candidates
+            else:
+                download = get_link_download(url, IMAGE_KINDS)
+                if not download:
+                    return None
+                download.close()
+                # The link is the menu image itself
+                logger.info(f"{url} is an image; processing it directly.")
+                img_candidates = [{'url': url, 'alt': ''}]
+
+            if not img_candidates:
+                logger.info("No images found on the page.")
+                return None
+
+            extracted_texts = []
+            skipped_known_week = False
+            for img_candidate in img_candidates:
+                img_url = img_candidate['url']
+
+                logger.info(f"Processing image: {img_url}")
+
+                # Skip images that are provably for a past or already stored week
+                alt_text = img_candidate['alt']
+                if classify_source_week(img_url, alt_text, known_weeks) in ('stale', 'ingested'):
+                    logger.info(f"Skipping image for a stale or already ingested week: {img_url}")
+                    skipped_known_week = True
+                    continue
 
-            # Download and check image
-            image_content = download_image(img_url)
-            if not image_content:
-                logger.warning(f"Failed to download image: {img_url}")
-                continue
+                # Download and check image
+                image_content = download_image(img_url)
+                if not image_content:
+                    logger.warning(f"Failed to download image: {img_url}")
+                    continue
 
-            # Open the image and check dimensions
-            try:
-                image = Image.open(BytesIO(image_content))
-                if not is_proper_image(image):  # Skipping logos and other small images
-                    logger.info(f"Skipping image due to size constraints: {img_url}")
+                # Open the image and check dimensions
+                try:
+                    image = Image.open(BytesIO(image_content))
+                    if not is_proper_image(image):  # Skipping logos and other small images
+                        logger.info(f"Skipping image due to size constraints: {img_url}")
+                        continue
+                except Exception as e:
+                    logger.warning(f"Failed to open image {img_url}: {e}")
                     continue
-            except Exception as e:
-                logger.warning(f"Failed to open image {img_url}: {e}")
-                continue
-
-            # Extract text from the image
-            text = process_image_for_menu_text(image)
-            if text:
-                logger.info(f"Extracted text from image (length: {len(text)}).")
-                extracted_texts.append(text)
+
+                # Extract text from the image
+                # OCR output is not trusted for week numbers, so only the URL and alt text are checked
+                text = process_image_for_menu_text(image, preprocessing, details)
+                if text:
+                    logger.info(f"Extracted text from image (length: {len(text)}).")
+                    extracted_texts.append(text)
+                else:
+                    logger.info(f"No relevant text extracted from image: {img_url}")
+
+            if extracted_texts:
+                combined_text = "\n\n".join(extracted_texts)
+                logger.info("Extracted text from images is ready for further processing.")
+                return combined_text
+            elif skipped_known_week:
+                logger.info("The only menu images are for a past or already stored week.")
+                return KNOWN_WEEK
             else:
-                logger.info(f"No relevant text extracted from image: {img_url}")
+                logger.info("No relevant text extracted from any images.")
+                return None
 
-        if extracted_texts:
-            combined_text = "\n\n".join(extracted_texts)
-            logger.info("Extracted text from images is ready for further processing.")
-            return combined_text
-        else:
-            logger.info("No relevant text extracted from any images.")
+        except Exception as e:
+            logger.error(f"An error occurred while scraping images from {url}: {e}")
             return None
 
-    except Exception as e:
-        logger.error(f"An error occurred while scraping images from {url}: {e}")
-        return None
-
 def download_image(img_url):
+    """
+    Downloads an image with a size cap, accepting only JPEG, PNG, GIF or WebP bodies.
+    """
     try:
-        response = requests.get(img_url)
-        response.raise_for_status()
-        return response.content
+        # A directly linked image was already fetched when the link was read
+        download = get_run_download(
+            img_url, lambda url: download_url(url, expected_kinds=IMAGE_KINDS, max_bytes=IMAGE_MAX_BYTES)
+        )
+        if not download or download.kind not in IMAGE_KINDS or download.size > IMAGE_MAX_BYTES:
+            return None
+        with download:
+            return bytes(download.content)
     except Exception as e:
         logger.error(f"Failed to download image {img_url}: {e}")
         return None
@@ -97,18 +141,66 @@ def is_proper_image(image):
     width, height = image.size
     return width >= min_width and height >= min_height
 
-def process_image_for_menu_text(image):
+def process_image_for_menu_text(image, preprocessing=None, details=None):
     """
     Processes the image to extract menu text using OCR, with targeted keyword
-    matching for "Veckans" sections and weekday names.
+    matching for "Veckans" sections and weekday names. Only the text-dense region
+    of the photo (e.g. the menu board) is cropped, deskewed and OCR'd.
+
+    Word-level confidences are used to reject bad scans early: if the first pass is
+    unreliable, the image is retried with alternative preprocessing, and if it is
+    still unreliable no text is returned so the LLM stage is skipped.
+
+    preprocessing ('fixed', 'otsu' or 'grayscale') is tried first; the one that
+    produced the text is stored in details['preprocessing'] when details is given.
     """
     try:
-        # Preprocess image for OCR
-        processed_image = preprocess_image_for_ocr(image)
-
-        # Use Tesseract OCR to extract text
         custom_oem_psm_config = r'--oem 1 --psm 6'
-        text = pytesseract.image_to_string(processed_image, lang='swe', config=custom_oem_psm_config)
+        variants = {
+            'fixed': preprocess_image_for_ocr,
+            'otsu': preprocess_image_for_ocr_otsu,
+            'grayscale': preprocess_image_for_ocr_grayscale,
+        }
+        # The preprocessing that worked for this source last time goes first
+        order = [preprocessing] if preprocessing in variants else []
+        order += [name for name in variants if name not in order]
+
+        # OCR only the text-dense part of the photo, cropped and deskewed
+        region = crop_text_region(image)
+        was_cropped = region.size < image.width * image.height
+
+        # Preprocess image for OCR and run Tesseract with confidences
+        processed_image = variants[order[0]](region)
+        height, width = processed_image.shape[:2]
+        result = ocr_regions(processed_image, [(0, 0, width, height)], config=custom_oem_psm_config)[0]
+        used = {id(result): order[0]}
+
+        if not is_acceptable_ocr(result):
+            record_ocr_retry("image")
+            candidates = [result]
+            alternatives = [(name, lambda name=name: variants[name](region)) for name in order[1:]]
+            if was_cropped:
+                # The region may have missed part of the menu
+                alternatives.append(('full_image', lambda: preprocess_image_for_ocr(image)))
+            for name, alternative in alternatives:
+                candidate = ocr_with_confidence(alternative(), config=custom_oem_psm_config)
+                used[id(candidate)] = name
+                candidates.append(candidate)
+                if is_acceptable_ocr(candidate):
+                    break
+            result = best_ocr_result(candidates)
+
+        if details is not None and result is not None:
+            details['preprocessing'] = used.get(id(result))
+
+        accepted = is_acceptable_ocr(result)
+        record_ocr_result(result, "image", accepted)
+        summarize_ocr_results("image", [(result, accepted)])
+        if not accepted:
+            logger.info("OCR confidence too low. Skipping image before the LLM stage.")
+            return None
+
+        text = result['text']
 
         # Check for relevant keywords to confirm it's a menu
         keywords = [
@@ -126,22 +218,24 @@ def process_image_for_menu_text(image):
 
 def preprocess_image_for_ocr(image):
     """
-    Applies preprocessing steps to the image to enhance OCR accuracy.
+    Applies preprocessing steps to the image to enhance OCR accuracy: the image is
+    rescaled to a target text height (downscaling large photos instead of always
+    upscaling), denoised only as much as its noise level needs, and thresholded.
     """
-    # Convert to grayscale
-    gray_image = image.convert("L")
-    np_image = np.array(gray_image)
-
-    # Resize to improve OCR accuracy
-    np_image = cv2.resize(np_image, None, fx=1.5, fy=1.5, interpolation=cv2.INTER_CUBIC)
+    return normalize_image_for_ocr(image, binarize='fixed')
 
-    # Apply bilateral filter to reduce noise while preserving edges
-    np_image = cv2.bilateralFilter(np_image, 9, 75, 75)
-
-    # Thresholding to create a binary image
-    _, np_image = cv2.threshold(np_image, 150, 255, cv2.THRESH_BINARY)
+def preprocess_image_for_ocr_otsu(image):
+    """
+    Alternative preprocessing for low-confidence scans: Otsu thresholding instead of
+    the fixed threshold, which copes better with uneven lighting.
+    """
+    return normalize_image_for_ocr(image, binarize='otsu')
 
-    return Image.fromarray(np_image)
+def preprocess_image_for_ocr_grayscale(image):
+    """
+    Alternative preprocessing that leaves binarization to Tesseract.
+    """
+    return normalize_image_for_ocr(image, binarize=None)
 
 def contains_keyword(text, keywords):
     """
@@ -0,0 +1,480 @@
+import hashlib
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+from PIL import Image
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Longest side of the page copy used for layout analysis (200-DPI A4 is ~2339 px)
+LAYOUT_MAX_SIDE = 1200
+# Contour area threshold at full resolution (the previous fixed value)
+MIN_CONTOUR_AREA = 1000
+# Block size of the adaptive threshold at full resolution
+THRESHOLD_BLOCK_SIZE = 11
+# Padding (full-resolution pixels) added around mapped boxes to absorb rounding
+BOX_PADDING = 2
+# Number of analysed pages kept in the cache
+LAYOUT_CACHE_SIZE = 32
+# Pages with more external contours than this (counted at full resolution, as
+# before downscaling was introduced) suit contour-based OCR
+AUTO_CONTOUR_THRESHOLD = 10
+
+_layout_cache = OrderedDict()
+# Batch workers analyse pages on several threads
+_layout_cache_lock = threading.Lock()
+
+
+def preprocess_image_for_contour_detection(image, block_size=THRESHOLD_BLOCK_SIZE, offset=2):
+    """
+    Converts the image to grayscale and applies inverse adaptive thresholding.
+    Accepts a PIL image or a grayscale NumPy array. A larger offset ignores
+    low-contrast texture such as walls or table surfaces.
+    """
+    if isinstance(image, Image.Image):
+        gray = np.asarray(image.convert('L'))
+    else:
+        gray = np.asarray(image)
+
+    # Apply adaptive thresholding
+    thresh = cv2.adaptiveThreshold(
+        gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+        cv2.THRESH_BINARY_INV, block_size, offset
+    )
+
+    return thresh
+
+
+def find_contours(thresh_image, mode=cv2.RETR_EXTERNAL):
+    contours, _ = cv2.findContours(
+        thresh_image, mode, cv2.CHAIN_APPROX_SIMPLE
+    )
+    return contours
+
+
+def filter_and_sort_contours(contours, min_area=MIN_CONTOUR_AREA):
+    # Filter contours based on area
+    filtered_contours = []
+    for cnt in contours:
+        x, y, w, h = cv2.boundingRect(cnt)
+        area = cv2.contourArea(cnt)
+        if area > min_area:  # Adjust the threshold as needed
+            filtered_contours.append((x, y, w, h))
+
+    # Sort contours top-to-bottom, then left-to-right
+    sorted_contours = sorted(filtered_contours, key=lambda b: (b[1], b[0]))
+    return sorted_contours
+
+
+def downscale_page(image, max_side=LAYOUT_MAX_SIDE):
+    """
+    Returns a grayscale copy of the page with its longest side at most max_side,
+    the factor applied, and the full-resolution (width, height).
+    """
+    if isinstance(image, Image.Image):
+        gray = np.asarray(image.convert('L'))
+    else:
+        gray = np.asarray(image)
+    height, width = gray.shape[:2]
+    factor = min(1.0, max_side / float(max(height, width)))
+    if factor < 1.0:
+        size = (max(1, int(width * factor)), max(1, int(height * factor)))
+        gray = cv2.resize(gray, size, interpolation=cv2.INTER_AREA)
+    return gray, factor, (width, height)
+
+
+def map_boxes_to_full_resolution(boxes, factor, full_size, padding=BOX_PADDING):
+    """
+    Maps (x, y, w, h) boxes found on the downscaled page back to full-resolution
+    coordinates, rounding outwards and clamping to the page.
+    """
+    full_width, full_height = full_size
+    mapped = []
+    for (x, y, w, h) in boxes:
+        x0 = max(0, int(math.floor(x / factor)) - padding)
+        y0 = max(0, int(math.floor(y / factor)) - padding)
+        x1 = min(full_width, int(math.ceil((x + w) / factor)) + padding)
+        y1 = min(full_height, int(math.ceil((y + h) / factor)) + padding)
+        mapped.append((x0, y0, x1 - x0, y1 - y0))
+    return mapped
+
+
+def analyze_page_layout(image):
+    """
+    Runs contour-based layout analysis on a downscaled copy of the page and returns
+    a dict with:
+        - contour_count: number of external contours, at full resolution
+        - boxes: filtered regions in reading order, in full-resolution coordinates
+        - factor: the downscale factor used for the analysis
+
+    Results are cached by page content, so the auto-selection probe and the
+    solution that follows it analyse each page only once.
+    """
+    start = time.perf_counter()
+    small, factor, full_size = downscale_page(image)
+    cache_key = hashlib.md5(small.tobytes()).hexdigest() + f":{full_size[0]}x{full_size[1]}"
+
+    with _layout_cache_lock:
+        cached = _layout_cache.get(cache_key)
+        if cached is not None:
+            _layout_cache.move_to_end(cache_key)
+    if cached is not None:
+        logger.info("Using cached layout analysis for page.")
+        return cached
+
+    # Scale the threshold window and area limit with the page
+    block_size = max(3, int(round(THRESHOLD_BLOCK_SIZE * factor)) | 1)
+    thresh = preprocess_image_for_contour_detection(small, block_size=block_size)
+    contours = find_contours(thresh)
+    boxes = filter_and_sort_contours(contours, min_area=MIN_CONTOUR_AREA * factor * factor)
+
+    # Downscaling merges and drops small contours, so a count near the auto-selection
+    # threshold is recounted at full resolution to keep the baseline decision
+    contour_count = len(contours)
+    if factor < 1.0 and contour_count <= AUTO_CONTOUR_THRESHOLD:
+        gray = np.asarray(image.convert('L')) if isinstance(image, Image.Image) else np.asarray(image)
+        contour_count = len(find_contours(preprocess_image_for_contour_detection(gray)))
+
+    layout = {
+        'contour_count': contour_count,
+        'boxes': map_boxes_to_full_resolution(boxes, factor, full_size),
+        'factor': factor,
+    }
+
+    with _layout_cache_lock:
+        _layout_cache[cache_key] = layout
+        if len(_layout_cache) > LAYOUT_CACHE_SIZE:
+            _layout_cache.popitem(last=False)
+
+    logger.info(
+        f"Layout analysis at {small.shape[1]}x{small.shape[0]} (factor {factor:.2f}): "
+        f"{layout['contour_count']} contours, {len(layout['boxes'])} regions, "
+        f"took {time.perf_counter() - start:.3f}s."
+    )
+    return layout
+
+
+def clear_layout_cache():
+    with _layout_cache_lock:
+        _layout_cache.clear()
+
+
+# Text-block merging, reading order and composite packing
+
+# Horizontal / vertical merge distance, as multiples of the median box height
+MERGE_GAP_X = 1.5
+MERGE_GAP_Y = 0.8
+# Blocks at least this share of the page width split the page into bands
+SPANNING_BLOCK_RATIO = 0.6
+# Blocks lower than this many median heights and narrower than this share of the
+# page are packed into composites instead of being OCR'd on their own
+LEFTOVER_MAX_LINES = 2.5
+LEFTOVER_MAX_WIDTH_RATIO = 0.3
+# White space between pieces of a composite, and the tallest composite allowed
+COMPOSITE_PADDING = 20
+COMPOSITE_MAX_HEIGHT = 4000
+
+
+def connected_labels(adjacency):
+    """
+    Labels the connected components of a boolean adjacency matrix by repeated
+    minimum-label propagation. Returns labels numbered 0..k-1.
+    """
+    count = adjacency.shape[0]
+    labels = np.arange(count)
+    while True:
+        neighbour_labels = np.where(adjacency, labels[None, :], count).min(axis=1)
+        new_labels = np.minimum(labels, neighbour_labels)
+        if np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+    _, labels = np.unique(labels, return_inverse=True)
+    return labels
+
+
+def merge_text_blocks(boxes, gap_x=None, gap_y=None):
+    """
+    Clusters overlapping and nearby (x, y, w, h) boxes into blocks. Boxes closer
+    than gap_x horizontally and gap_y vertically are merged, repeatedly, until no
+    blocks touch. Gaps default to multiples of the median box height, so words on
+    a line and lines of a paragraph join while column gutters stay apart.
+    """
+    if len(boxes) < 2:
+        return list(boxes)
+
+    array = np.asarray(boxes, dtype=np.float64)
+    rects = np.stack([array[:, 0], array[:, 1], array[:, 0] + array[:, 2], array[:, 1] + array[:, 3]], axis=1)
+    median_height = float(np.median(array[:, 3]))
+    half_gap_x = (MERGE_GAP_X * median_height if gap_x is None else gap_x) / 2.0
+    half_gap_y = (MERGE_GAP_Y * median_height if gap_y is None else gap_y) / 2.0
+
+    while len(rects) > 1:
+        x0 = rects[:, 0] - half_gap_x
+        y0 = rects[:, 1] - half_gap_y
+        x1 = rects[:, 2] + half_gap_x
+        y1 = rects[:, 3] + half_gap_y
+        adjacency = (
+            (x0[:, None] <= x1[None, :]) & (x0[None, :] <= x1[:, None])
+            & (y0[:, None] <= y1[None, :]) & (y0[None, :] <= y1[:, None])
+        )
+        labels = connected_labels(adjacency)
+        block_count = labels.max() + 1
+        if block_count == len(rects):
+            break
+
+        merged = np.empty((block_count, 4))
+        merged[:, :2] = np.inf
+        merged[:, 2:] = -np.inf
+        np.minimum.at(merged[:, 0], labels, rects[:, 0])
+        np.minimum.at(merged[:, 1], labels, rects[:, 1])
+        np.maximum.at(merged[:, 2], labels, rects[:, 2])
+        np.maximum.at(merged[:, 3], labels, rects[:, 3])
+        rects = merged
+
+    return [
+        (int(x0), int(y0), int(x1 - x0), int(y1 - y0))
+        for x0, y0, x1, y1 in rects
+    ]
+
+
+def order_blocks_for_reading(boxes, page_width):
+    """
+    Sorts blocks in reading order. Blocks spanning most of the page width (titles,
+    banners) split the page into horizontal bands; inside a band, blocks whose
+    horizontal extents overlap form a column, and columns are read left to right.
+    """
+    bands = []
+    current = []
+    for box in sorted(boxes, key=lambda b: (b[1], b[0])):
+        if box[2] >= SPANNING_BLOCK_RATIO * page_width:
+            if current:
+                bands.append(current)
+                current = []
+            bands.append([box])
+        else:
+            current.append(box)
+    if current:
+        bands.append(current)
+
+    ordered = []
+    for band in bands:
+        # Group blocks into columns by merging overlapping x-intervals
+        columns = []
+        for box in sorted(band, key=lambda b: b[0]):
+            if columns and box[0] <= columns[-1]['x1']:
+                columns[-1]['x1'] = max(columns[-1]['x1'], box[0] + box[2])
+                columns[-1]['boxes'].append(box)
+            else:
+                columns.append({'x1': box[0] + box[2], 'boxes': [box]})
+        for column in columns:
+            ordered.extend(sorted(column['boxes'], key=lambda b: (b[1], b[0])))
+    return ordered
+
+
+def plan_text_blocks(boxes, page_size):
+    """
+    Turns the raw contour boxes of a page into an OCR plan. Returns a dict with
+    'blocks' (OCR'd one by one) and 'leftovers' (packed into composites), each a
+    list of (reading_order_index, box).
+    """
+    page_width, _ = page_size
+    if not boxes:
+        return {'blocks': [], 'leftovers': []}
+
+    merged = merge_text_blocks(boxes)
+    ordered = order_blocks_for_reading(merged, page_width)
+    median_height = float(np.median([box[3] for box in boxes]))
+
+    plan = {'blocks': [], 'leftovers': []}
+    for index, box in enumerate(ordered):
+        is_small = (
+            box[3] < LEFTOVER_MAX_LINES * median_height
+            and box[2] < LEFTOVER_MAX_WIDTH_RATIO * page_width
+        )
+        plan['leftovers' if is_small else 'blocks'].append((index, box))
+
+    logger.info(
+        f"Merged {len(boxes)} contour regions into {len(plan['blocks'])} blocks "
+        f"and {len(plan['leftovers'])} small leftovers."
+    )
+    return plan
+
+
+def pack_regions(gray, boxes, padding=COMPOSITE_PADDING, max_height=COMPOSITE_MAX_HEIGHT):
+    """
+    Stacks the given regions of a grayscale page vertically on white canvases so
+    they can be OCR'd together. Returns a list of (composite, offsets), where
+    offsets holds (y_start, y_end, box_index) of every piece in the composite.
+    """
+    composites = []
+    pending = []
+    pending_height = padding
+
+    def flush():
+        width = max(gray[y:y + h, x:x + w].shape[1] for _, (x, y, w, h) in pending) + 2 * padding
+        canvas = np.full((pending_height, width), 255, dtype=np.uint8)
+        offsets = []
+        top = padding
+        for index, (x, y, w, h) in pending:
+            piece = gray[y:y + h, x:x + w]
+            canvas[top:top + piece.shape[0], padding:padding + piece.shape[1]] = piece
+            offsets.append((top, top + piece.shape[0], index))
+            top += piece.shape[0] + padding
+        composites.append((canvas, offsets))
+
+    for index, box in enumerate(boxes):
+        piece_height = box[3] + padding
+        if pending and pending_height + piece_height > max_height:
+            flush()
+            pending = []
+            pending_height = padding
+        pending.append((index, box))
+        pending_height += piece_height
+
+    if pending:
+        flush()
+    return composites
+
+
+# Text-region location and deskew for photographed menus
+
+# Threshold window and offset for region location; the offset is high enough to
+# ignore surface texture while keeping printed or chalk text
+REGION_BLOCK_SIZE = 25
+REGION_THRESHOLD_OFFSET = 12
+# Kernel (at analysis resolution) that joins the glyphs of a line into one blob
+LINE_KERNEL = (15, 3)
+# Line blobs must be at least this many times wider than they are tall
+LINE_MIN_ASPECT = 1.5
+# Blocks with at least this share of the densest block's ink join the text region
+REGION_MIN_INK_RATIO = 0.2
+# Margin (share of the region size) kept around the cropped region
+REGION_MARGIN = 0.03
+# Do not crop when the region already covers this share of the image
+REGION_MAX_COVERAGE = 0.9
+# Skew angles (degrees) outside this range are left alone
+MIN_DESKEW_ANGLE = 0.5
+MAX_DESKEW_ANGLE = 15.0
+
+
+def line_angle(contour):
+    """
+    Returns the tilt of an elongated line blob in degrees, in (-45, 45].
+    """
+    (_, _), (width, height), angle = cv2.minAreaRect(contour)
+    if width < height:
+        angle -= 90.0
+    while angle <= -45.0:
+        angle += 90.0
+    while angle > 45.0:
+        angle -= 90.0
+    return angle
+
+
+def locate_text_region(image):
+    """
+    Finds the text-dense part of a photo or scan, e.g. the menu board on a wall.
+    Glyphs are joined into line blobs, lines are merged into blocks, and the block
+    with the most ink is kept together with blocks of comparable ink. Returns a dict
+    with 'box' (full-resolution (x, y, w, h)), 'angle' (median line tilt in degrees)
+    and 'coverage' (share of the image the box covers), or None if no text lines
+    were found.
+    """
+    small, factor, full_size = downscale_page(image)
+    thresh = preprocess_image_for_contour_detection(
+        small, block_size=REGION_BLOCK_SIZE, offset=REGION_THRESHOLD_OFFSET
+    )
+
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, LINE_KERNEL)
+    lines = cv2.dilate(thresh, kernel)
+    # All contours, not just external ones: a board's frame would otherwise hide its text
+    contours = [
+        cnt for cnt in find_contours(lines, mode=cv2.RETR_LIST)
+        if cv2.boundingRect(cnt)[2] >= LINE_MIN_ASPECT * cv2.boundingRect(cnt)[3]
+    ]
+    line_boxes = filter_and_sort_contours(contours, min_area=MIN_CONTOUR_AREA * factor * factor)
+    if not line_boxes:
+        return None
+
+    blocks = merge_text_blocks(line_boxes)
+    ink = np.array([np.count_nonzero(thresh[y:y + h, x:x + w]) for (x, y, w, h) in blocks])
+    selected = [block for block, amount in zip(blocks, ink) if amount >= REGION_MIN_INK_RATIO * ink.max()]
+
+    x0 = min(x for x, _, _, _ in selected)
+    y0 = min(y for _, y, _, _ in selected)
+    x1 = max(x + w for x, _, w, _ in selected)
+    y1 = max(y + h for _, y, _, h in selected)
+    margin_x = int((x1 - x0) * REGION_MARGIN)
+    margin_y = int((y1 - y0) * REGION_MARGIN)
+    region = (x0 - margin_x, y0 - margin_y, x1 - x0 + 2 * margin_x, y1 - y0 + 2 * margin_y)
+    box = map_boxes_to_full_resolution([region], factor, full_size)[0]
+
+    # Tilt of the long lines inside the region
+    angles = []
+    for cnt in contours:
+        x, y, w, h = cv2.boundingRect(cnt)
+        if x >= x0 and y >= y0 and x + w <= x1 and y + h <= y1 and w >= 3 * h:
+            angles.append(line_angle(cnt))
+    angle = float(np.median(angles)) if angles else 0.0
+
+    return {
+        'box': box,
+        'angle': angle,
+        'coverage': (box[2] * box[3]) / float(full_size[0] * full_size[1]),
+    }
+
+
+def deskew(gray, angle):
+    """
+    Rotates a grayscale image by -angle degrees around its centre, replicating the
+    border so dark backgrounds (chalkboards) are not framed in white. Small and
+    implausibly large angles are ignored.
+    """
+    if abs(angle) < MIN_DESKEW_ANGLE or abs(angle) > MAX_DESKEW_ANGLE:
+        return gray
+    height, width = gray.shape[:2]
+    matrix = cv2.getRotationMatrix2D((width / 2.0, height / 2.0), angle, 1.0)
+    return cv2.warpAffine(gray, matrix, (width, height), flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+
+
+def crop_text_region(image):
+    """
+    Deskews a photo or scan around its text-dense region and crops to it. Returns a
+    grayscale NumPy array; the whole image is returned when no region is found or
+    the region covers almost all of it.
+    """
+    if isinstance(image, Image.Image):
+        gray = np.asarray(image.convert('L'))
+    else:
+        gray = np.asarray(image)
+
+    start = time.perf_counter()
+    region = locate_text_region(gray)
+    if region is None:
+        logger.info("No text region found; OCR'ing the whole image.")
+        return gray
+
+    if region['coverage'] < REGION_MAX_COVERAGE:
+        # Deskew a padded crop, then cut the box out of it: rotating the tight crop
+        # would turn its corners in from outside the frame and clip tilted text
+        x, y, w, h = region['box']
+        sin = abs(math.sin(math.radians(region['angle'])))
+        pad_x, pad_y = int(math.ceil(h * sin / 2.0)), int(math.ceil(w * sin / 2.0))
+        px0, py0 = max(0, x - pad_x), max(0, y - pad_y)
+        padded = deskew(gray[py0:min(gray.shape[0], y + h + pad_y), px0:min(gray.shape[1], x + w + pad_x)], region['angle'])
+        cropped = padded[y - py0:y - py0 + h, x - px0:x - px0 + w]
+    else:
+        cropped = deskew(gray, region['angle'])
+
+    logger.info(
+        f"Text region {cropped.shape[1]}x{cropped.shape[0]} of {gray.shape[1]}x{gray.shape[0]} "
+        f"({gray.size / float(max(1, cropped.size)):.1f}x fewer pixels), skew {region['angle']:.1f} deg, "
+        f"took {time.perf_counter() - start:.3f}s."
+    )
+    return cropped
@@ -0,0 +1,368 @@
+import logging
+import os
+import re
+import threading
+import time
+from collections import Counter
+
+import numpy as np
+import pytesseract
+from PIL import Image
+from pytesseract import Output
+
+try:
+    # Optional in-process Tesseract binding; without it every call spawns a process
+    import tesserocr
+except ImportError:
+    tesserocr = None
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# OCR backend: 'auto' (in-process engine when available), 'tesserocr' or 'pytesseract'
+OCR_BACKEND = os.getenv('OCR_BACKEND', 'auto').lower()
+# Directory containing the traineddata files for the in-process engine
+TESSDATA_PATH = os.getenv('TESSDATA_PATH')
+
+# Words below this confidence (0-100, as reported by Tesseract) count as unreliable
+OCR_WORD_MIN_CONFIDENCE = float(os.getenv('OCR_WORD_MIN_CONFIDENCE', '60'))
+# Images/regions whose weighted mean confidence is below this are rejected
+OCR_MIN_CONFIDENCE = float(os.getenv('OCR_MIN_CONFIDENCE', '55'))
+# Minimum number of recognised words before a result is considered at all
+OCR_MIN_WORDS = int(os.getenv('OCR_MIN_WORDS', '5'))
+
+# Running counters, surfaced through get_ocr_metrics()
+_ocr_metrics = Counter()
+
+
+# Engines created by the pool, kept so they can be released on shutdown
+_engine_local = threading.local()
+_all_engines = []
+_all_engines_lock = threading.Lock()
+
+_TSV_COLUMNS = (
+    'level', 'page_num', 'block_num', 'par_num', 'line_num', 'word_num',
+    'left', 'top', 'width', 'height', 'conf', 'text',
+)
+
+
+def parse_tesseract_config(config):
+    """
+    Extracts the OCR engine mode and page segmentation mode from a pytesseract
+    style config string such as '--oem 1 --psm 6'.
+    """
+    oem_match = re.search(r'--oem\s+(\d+)', config or '')
+    psm_match = re.search(r'--psm\s+(\d+)', config or '')
+    oem = int(oem_match.group(1)) if oem_match else 3
+    psm = int(psm_match.group(1)) if psm_match else 3
+    return oem, psm
+
+
+def use_engine_pool():
+    """
+    Returns True when OCR should go through the in-process engine pool.
+    """
+    if OCR_BACKEND == 'pytesseract':
+        return False
+    if tesserocr is None:
+        if OCR_BACKEND == 'tesserocr':
+            logger.warning("OCR_BACKEND is 'tesserocr' but tesserocr is not installed. Falling back to pytesseract.")
+        return False
+    return True
+
+
+def get_engine(lang, oem):
+    """
+    Returns the Tesseract engine of the current worker thread for the given
+    language and engine mode, initializing it (and loading the traineddata) only once.
+    """
+    engines = getattr(_engine_local, 'engines', None)
+    if engines is None:
+        engines = _engine_local.engines = {}
+
+    engine = engines.get((lang, oem))
+    if engine is None:
+        start = time.perf_counter()
+        kwargs = {'lang': lang, 'oem': tesserocr.OEM(oem)}
+        if TESSDATA_PATH:
+            kwargs['path'] = TESSDATA_PATH
+        engine = tesserocr.PyTessBaseAPI(**kwargs)
+        engines[(lang, oem)] = engine
+        with _all_engines_lock:
+            _all_engines.append(engine)
+        logger.info(
+            f"Initialized Tesseract engine (lang={lang}, oem={oem}) for thread "
+            f"{threading.current_thread().name} in {time.perf_counter() - start:.2f}s."
+        )
+    return engine
+
+
+def shutdown_ocr_engines():
+    """
+    Releases every engine created by the pool.
+    """
+    with _all_engines_lock:
+        engines = list(_all_engines)
+        _all_engines.clear()
+    for engine in engines:
+        try:
+            engine.End()
+        except Exception as e:
+            logger.warning(f"Failed to release Tesseract engine: {e}")
+    _engine_local.__dict__.clear()
+
+
+def to_ocr_buffer(image):
+    """
+    Returns the image as a C-contiguous uint8 NumPy array (grayscale or RGB)
+    without re-encoding it.
+    """
+    if isinstance(image, Image.Image):
+        if image.mode not in ('L', 'RGB'):
+            image = image.convert('L')
+        array = np.asarray(image)
+    else:
+        array = np.asarray(image)
+    if array.dtype != np.uint8:
+        array = array.astype(np.uint8)
+    if array.ndim == 3 and array.shape[2] == 4:
+        array = array[:, :, :3]
+    return np.ascontiguousarray(array)
+
+
+def image_to_data_in_process(image, config, lang='swe'):
+    """
+    Runs OCR on the worker's persistent engine, feeding the raw pixel buffer
+    directly. Returns the same word-level dict as pytesseract.image_to_data.
+    """
+    oem, psm = parse_tesseract_config(config)
+    buffer = to_ocr_buffer(image)
+    height, width = buffer.shape[:2]
+    bytes_per_pixel = 1 if buffer.ndim == 2 else buffer.shape[2]
+
+    engine = get_engine(lang, oem)
+    engine.SetPageSegMode(tesserocr.PSM(psm))
+    engine.SetImageBytes(buffer.tobytes(), width, height, bytes_per_pixel, width * bytes_per_pixel)
+    tsv = engine.GetTSVText(0)
+    engine.Clear()
+
+    data = {column: [] for column in _TSV_COLUMNS}
+    for row in tsv.splitlines():
+        fields = row.split('\t')
+        if len(fields) < len(_TSV_COLUMNS):
+            fields += [''] * (len(_TSV_COLUMNS) - len(fields))
+        for column, value in zip(_TSV_COLUMNS, fields):
+            data[column].append(value if column == 'text' else _to_number(value))
+    return data
+
+
+def _to_number(value):
+    try:
+        return int(value)
+    except ValueError:
+        try:
+            return float(value)
+        except ValueError:
+            return -1
+
+
+def image_to_data(image, config, lang='swe'):
+    """
+    Word-level OCR through the configured backend. The in-process engine pool is
+    preferred; pytesseract (one tesseract process per call) remains the fallback.
+    """
+    if use_engine_pool():
+        try:
+            return image_to_data_in_process(image, config, lang=lang)
+        except Exception as e:
+            logger.warning(f"In-process OCR failed, falling back to pytesseract: {e}")
+    return pytesseract.image_to_data(image, lang=lang, config=config, output_type=Output.DICT)
+
+
+def ocr_with_confidence(image, config, lang='swe'):
+    """
+    Runs Tesseract with word-level output and returns the recognised text together
+    with confidence statistics. The image may be a PIL image or a NumPy array.
+
+    The returned dict contains:
+        - text: the text rebuilt line by line from the recognised words
+        - mean_confidence: character-weighted mean word confidence (0-100)
+        - word_count: number of non-empty words
+        - low_confidence_ratio: share of words below OCR_WORD_MIN_CONFIDENCE
+        - quality: a 0-1 score combining the two signals above
+    """
+    data = image_to_data(image, config, lang=lang)
+    return build_ocr_result(data)
+
+
+def split_ocr_data_by_rows(data, row_ranges):
+    """
+    Splits word-level OCR data of a composite image into one OCR result per piece.
+    row_ranges holds the (y_start, y_end) of each piece; a word belongs to the
+    piece containing its vertical centre.
+    """
+    starts = np.array([start for start, _ in row_ranges])
+    pieces = [{column: [] for column in data} for _ in row_ranges]
+    for i in range(len(data.get('text', []))):
+        try:
+            center = float(data['top'][i]) + float(data['height'][i]) / 2.0
+        except (TypeError, ValueError):
+            continue
+        index = int(np.searchsorted(starts, center, side='right')) - 1
+        if index < 0 or center >= row_ranges[index][1]:
+            continue
+        for column in data:
+            pieces[index][column].append(data[column][i])
+    return [build_ocr_result(piece) for piece in pieces]
+
+
+def build_ocr_result(data):
+    """
+    Builds the OCR result dict from Tesseract's word-level TSV data.
+    """
+    lines = {}
+    total_chars = 0
+    weighted_confidence = 0.0
+    word_count = 0
+    low_confidence_words = 0
+
+    for i, word in enumerate(data.get('text', [])):
+        word = (word or '').strip()
+        try:
+            confidence = float(data['conf'][i])
+        except (TypeError, ValueError):
+            confidence = -1.0
+        if not word or confidence < 0:
+            continue
+
+        line_key = (data['block_num'][i], data['par_num'][i], data['line_num'][i])
+        lines.setdefault(line_key, []).append(word)
+
+        word_count += 1
+        total_chars += len(word)
+        weighted_confidence += confidence * len(word)
+        if confidence < OCR_WORD_MIN_CONFIDENCE:
+            low_confidence_words += 1
+
+    mean_confidence = weighted_confidence / total_chars if total_chars else 0.0
+    low_confidence_ratio = low_confidence_words / word_count if word_count else 1.0
+
+    # Rebuild the text in Tesseract's block/paragraph/line order
+    text_lines = []
+    previous_block = None
+    for (block_num, par_num, line_num) in sorted(lines):
+        if previous_block is not None and (block_num, par_num) != previous_block:
+            text_lines.append('')
+        text_lines.append(' '.join(lines[(block_num, par_num, line_num)]))
+        previous_block = (block_num, par_num)
+
+    return {
+        'text': '\n'.join(text_lines),
+        'mean_confidence': mean_confidence,
+        'word_count': word_count,
+        'low_confidence_ratio': low_confidence_ratio,
+        'quality': (mean_confidence / 100.0) * (1.0 - low_confidence_ratio),
+    }
+
+
+def is_acceptable_ocr(result, min_confidence=None, min_words=None):
+    """
+    Checks whether an OCR result is good enough to be sent further down the pipeline.
+    """
+    if not result:
+        return False
+    min_confidence = OCR_MIN_CONFIDENCE if min_confidence is None else min_confidence
+    min_words = OCR_MIN_WORDS if min_words is None else min_words
+    return result['word_count'] >= min_words and result['mean_confidence'] >= min_confidence
+
+
+def best_ocr_result(results):
+    """
+    Picks the result with the highest quality score from a list of OCR results.
+    """
+    results = [result for result in results if result]
+    if not results:
+        return None
+    return max(results, key=lambda result: (result['quality'], result['word_count']))
+
+
+def record_ocr_result(result, source, accepted):
+    """
+    Logs the confidence statistics of an OCR result and updates the running metrics.
+    """
+    _ocr_metrics['ocr_calls'] += 1
+    _ocr_metrics['accepted' if accepted else 'rejected'] += 1
+    if result:
+        _ocr_metrics['words'] += result['word_count']
+    logger.debug(
+        f"OCR quality for {source}: accepted={accepted}, "
+        f"mean_confidence={result['mean_confidence']:.1f}, words={result['word_count']}, "
+        f"low_confidence_ratio={result['low_confidence_ratio']:.2f}, quality={result['quality']:.2f}"
+        if result else f"OCR quality for {source}: accepted={accepted}, no result"
+    )
+
+
+def summarize_ocr_results(source, results, ocr_calls=None):
+    """
+    Logs one line for a page or image: how many of its OCR results (a list of
+    (result, accepted) pairs) were accepted, their word-weighted mean confidence
+    and word count.
+    """
+    words = sum(result['word_count'] for result, _ in results if result)
+    confidence = (
+        sum(result['mean_confidence'] * result['word_count'] for result, _ in results if result) / words
+        if words else 0.0
+    )
+    accepted = sum(1 for _, ok in results if ok)
+    calls = f", tesseract_calls={ocr_calls}" if ocr_calls is not None else ""
+    logger.info(
+        f"OCR summary for {source}: accepted {accepted} of {len(results)} results, "
+        f"mean_confidence={confidence:.1f}, words={words}{calls}"
+    )
+
+
+def record_ocr_retry(source):
+    """
+    Counts a retry with alternative preprocessing.
+    """
+    _ocr_metrics['retries'] += 1
+    logger.info(f"OCR confidence too low for {source}. Retrying with alternative preprocessing.")
+
+
+def get_ocr_metrics():
+    """
+    Returns a snapshot of the OCR metrics collected in this process.
+    """
+    return dict(_ocr_metrics)
+
+
+def benchmark_ocr_backends(images, config=r'--oem 1 --psm 6', lang='swe', repeats=3):
+    """
+    Compares per-image OCR latency of the pytesseract fallback and the in-process
+    engine pool. Returns a dict of mean milliseconds per image for each backend.
+    """
+    backends = {'pytesseract': lambda image: pytesseract.image_to_data(
+        image, lang=lang, config=config, output_type=Output.DICT)}
+    if tesserocr is not None:
+        # Warm up the engine so initialization is not counted per call
+        get_engine(lang, parse_tesseract_config(config)[0])
+        backends['tesserocr'] = lambda image: image_to_data_in_process(image, config, lang=lang)
+
+    timings = {}
+    for name, run in backends.items():
+        start = time.perf_counter()
+        for _ in range(repeats):
+            for image in images:
+                run(image)
+        elapsed = time.perf_counter() - start
+        timings[name] = elapsed * 1000.0 / max(1, repeats * len(images))
+        logger.info(f"OCR backend {name}: {timings[name]:.1f} ms per image over {len(images)} images.")
+    return timings
+
+
+if __name__ == "__main__":
+    # Usage: python -m scrapers.ocr roi1.png roi2.png ...
+    import sys
+
+    logging.basicConfig(level=logging.INFO)
+    benchmark_ocr_backends([Image.open(path) for path in sys.argv[1:]])
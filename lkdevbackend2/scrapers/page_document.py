@@ -0,0 +1,234 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from urllib.parse import urljoin
+
+from bs4 import BeautifulSoup, UnicodeDammit
+
+from .content_extraction import content_text, find_main_block
+from .downloads import download_url, HTML_KINDS, IMAGE_KINDS, PDF_KINDS
+
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = 'lxml'
+except ImportError:
+    HTML_PARSER = 'html.parser'
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Page documents kept per run, least recently used dropped first
+PAGE_CACHE_SIZE = int(os.getenv('PAGE_CACHE_SIZE', '32'))
+# Downloads (PDFs) kept per run, so a strategy retrying a document the previous
+# one fetched does not download it again
+RUN_DOWNLOAD_CACHE_SIZE = int(os.getenv('RUN_DOWNLOAD_CACHE_SIZE', '2'))
+
+# What a submitted link may serve: a page, or the menu PDF or image itself
+LINK_KINDS = HTML_KINDS + PDF_KINDS + IMAGE_KINDS
+
+# Tried in order when a page declares no charset; statistical detection mistakes
+# short Swedish cp1252 pages for cp1250
+UNDECLARED_ENCODINGS = ['utf-8', 'windows-1252']
+
+_run_state = threading.local()
+
+
+class PageDocument:
+    """
+    A landing page fetched and parsed once, shared by the text, image and PDF
+    scrapers. Derived views (cleaned text, image and link candidates) are computed
+    on first use. html may be raw bytes, decoded with the given encoding or, when
+    none was declared, strict UTF-8 falling back to Windows-1252.
+    """
+
+    def __init__(self, url, html, encoding=None):
+        self.url = url
+        start = time.perf_counter()
+        if isinstance(html, bytes):
+            html = UnicodeDammit(html, known_definite_encodings=[encoding] if encoding else [],
+                                 user_encodings=UNDECLARED_ENCODINGS).unicode_markup
+        self.html = html
+        self.soup = BeautifulSoup(html, HTML_PARSER)
+        self.parse_seconds = time.perf_counter() - start
+        self._text = None
+        self._main_text = None
+        self._main_element = False
+        self._links = None
+        self._images = None
+
+    @property
+    def text(self):
+        """
+        All text of the page with whitespace collapsed to single spaces.
+        """
+        if self._text is None:
+            self._text = ' '.join(self.soup.get_text(separator=' ').split())
+        return self._text
+
+    @property
+    def main_element(self):
+        """
+        The block element that looks most like a lunch menu, or None.
+        """
+        if self._main_element is False:
+            self._main_element = find_main_block(self.soup)
+        return self._main_element
+
+    @property
+    def main_text(self):
+        """
+        Only the text of the block that looks most like a lunch menu, without
+        scripts, styles, navigation and footers (the whole page's content text if
+        no block looks like a menu).
+        """
+        if self._main_text is None:
+            element = self.main_element
+            self._main_text = content_text(self.soup if element is None else element)
+        return self._main_text
+
+    @property
+    def link_candidates(self):
+        """
+        The page's links as {'url', 'href', 'anchor_text'} dicts in document order,
+        with absolute URLs and without duplicates.
+        """
+        if self._links is None:
+            self._links = []
+            seen = set()
+            for link in self.soup.find_all('a', href=True):
+                absolute_url = urljoin(self.url, link['href'])
+                if absolute_url in seen:
+                    continue
+                seen.add(absolute_url)
+                anchor_text = ' '.join([link.get_text(' ', strip=True), link.get('title', '')]).strip()
+                self._links.append({'url': absolute_url, 'href': link['href'], 'anchor_text': anchor_text})
+        return self._links
+
+    @property
+    def pdf_candidates(self):
+        """
+        Links that look like they point to a PDF.
+        """
+        return [
+            {'url': link['url'], 'anchor_text': link['anchor_text']}
+            for link in self.link_candidates
+            if 'pdf' in link['href'].lower()
+        ]
+
+    @property
+    def image_candidates(self):
+        """
+        The page's images as {'url', 'alt'} dicts in document order, with absolute URLs.
+        """
+        if self._images is None:
+            self._images = [
+                {'url': urljoin(self.url, img['src']), 'alt': img.get('alt', '')}
+                for img in self.soup.find_all('img')
+                if img.get('src')
+            ]
+        return self._images
+
+
+@contextmanager
+def page_run():
+    """
+    Caches fetched page documents for the duration of the block, so strategies
+    tried on the same landing page during one run share a single fetch and parse.
+    At most PAGE_CACHE_SIZE documents are kept; pages that could not be fetched
+    are remembered too, so they are not fetched again in the same run. The
+    downloads shared through get_run_download are released when the block ends.
+    """
+    outer = getattr(_run_state, 'cache', None)
+    if outer is None:
+        _run_state.cache = OrderedDict()
+        _run_state.downloads = OrderedDict()
+    try:
+        yield
+    finally:
+        if outer is None:
+            _run_state.cache = None
+            for download in _run_state.downloads.values():
+                download.release()
+            _run_state.downloads = None
+
+
+def get_run_download(url, fetch):
+    """
+    Returns fetch(url) (a DownloadedContent or None), reusing the download made
+    earlier in the same page_run() for url. Shared downloads ignore close(); the
+    RUN_DOWNLOAD_CACHE_SIZE most recent ones are kept until the run ends. Outside
+    page_run() the caller owns the download as usual.
+    """
+    downloads = getattr(_run_state, 'downloads', None)
+    if downloads is None:
+        return fetch(url)
+    if url in downloads:
+        downloads.move_to_end(url)
+        logger.info(f"Reusing the download of {url} from this run.")
+        return downloads[url]
+
+    download = fetch(url)
+    if download:
+        download.shared = True
+        downloads[url] = download
+        if len(downloads) > RUN_DOWNLOAD_CACHE_SIZE:
+            downloads.popitem(last=False)[1].release()
+    return download
+
+
+def get_page_document(url, verify=True):
+    """
+    Returns the PageDocument for url, fetched with a size cap and parsed with the
+    fastest available parser. Inside page_run() the document is reused by every
+    scraper asking for the same URL and verify setting. Returns None if the page
+    could not be fetched or the link serves a PDF or image; inside page_run()
+    that body is kept for get_link_download, so it is not fetched again.
+    """
+    cache = getattr(_run_state, 'cache', None)
+    key = (url, verify)
+    if cache is not None and key in cache:
+        cache.move_to_end(key)
+        logger.info(f"Using cached page document for {url}")
+        return cache[key]
+    downloads = getattr(_run_state, 'downloads', None)
+    if downloads is not None and url in downloads:
+        # Already fetched in this run as a PDF or image
+        return None
+
+    document = None
+    download = download_url(url, expected_kinds=LINK_KINDS, verify=verify)
+    if download and download.kind in HTML_KINDS:
+        with download:
+            # Raw bytes, so an undeclared charset is detected rather than assumed UTF-8
+            document = PageDocument(download.url, bytes(download.content), download.encoding)
+        logger.info(f"Parsed {url} with {HTML_PARSER} in {document.parse_seconds:.3f}s.")
+    elif download:
+        logger.info(f"{url} is a {download.kind} document, not an HTML page.")
+        get_run_download(url, lambda _: download)
+        # Does nothing when the download is now shared for the run
+        download.close()
+
+    if cache is not None:
+        cache[key] = document
+        if len(cache) > PAGE_CACHE_SIZE:
+            cache.popitem(last=False)
+    return document
+
+
+def get_link_download(url, kinds, verify=True):
+    """
+    Returns the download of url when the link itself serves one of kinds (a menu
+    PDF or image submitted directly rather than a page linking to it), or None.
+    Inside page_run() this reuses the fetch made by get_page_document for the
+    link; outside it the caller owns (and closes) a fresh download.
+    """
+    downloads = getattr(_run_state, 'downloads', None)
+    if downloads is None:
+        return download_url(url, expected_kinds=kinds, verify=verify)
+    if url not in downloads:
+        get_page_document(url, verify)
+    download = downloads.get(url)
+    return download if download is not None and download.kind in kinds else None
@@ -1,16 +1,46 @@
-from pdf2image import convert_from_bytes
 import pytesseract
 from PIL import Image
 import logging
 import requests
-from bs4 import BeautifulSoup
 import os
 import re
+from concurrent.futures import ThreadPoolExecutor
 import cv2
 import numpy as np
 from PyPDF2 import PdfReader
 from io import BytesIO
 
+from .layout import (
+    AUTO_CONTOUR_THRESHOLD,
+    analyze_page_layout,
+    plan_text_blocks,
+    pack_regions,
+)
+from .downloads import download_url, DOWNLOAD_MAX_BYTES, PDF_KINDS
+from .page_document import get_link_download, get_page_document, get_run_download, page_run
+from .rasterizer import inspect_pdf, iter_pdf_pages
+from .shared_pages import ocr_regions
+from .weeks import (
+    KNOWN_WEEK,
+    classify_source_week,
+    extract_week_number,
+    extract_week_number_from_url,
+    heading_text,
+    parse_week_number,
+    week_distance,
+)
+from .pdf_text import REGION_TEXT_MIN_COVERAGE, route_pdf_pages, text_layer_coverage
+from .ocr import (
+    image_to_data,
+    split_ocr_data_by_rows,
+    ocr_with_confidence,
+    is_acceptable_ocr,
+    best_ocr_result,
+    record_ocr_result,
+    summarize_ocr_results,
+    record_ocr_retry,
+)
+
 # Configure logging
 logger = logging.getLogger(__name__)
 
@@ -21,126 +51,263 @@ pytesseract.pytesseract.tesseract_cmd = r'C:\Users\mohammed.amayri\AppData\Local
 poppler_path = r'C:\poppler-24.08.0\Library\bin'
 os.environ['PATH'] += os.pathsep + poppler_path
 
-def scrape_pdf(main_url, solution=None):
-    pdf_links = find_pdf_links(main_url)
-    if not pdf_links:
-        logger.info("No PDF links found on the page.")
+def scrape_pdf(main_url, solution=None, known_weeks=None, details=None):
+    """
+    Finds the menu PDF linked from main_url (or main_url itself, when it is a
+    PDF) and extracts its text.
+    known_weeks is the set of (iso_year, iso_week) already stored for the restaurant;
+    PDFs that are provably for a past or already stored week are skipped without
+    being fetched, and KNOWN_WEEK is returned when nothing else was found.
+    solution is '1', '2', '3', 'text' (text layer only, never OCR) or None for
+    automatic detection. When details is given, the solution that produced the text
+    is stored in details['solution'].
+    """
+    # Shares the fetch of a directly linked PDF with its processing, also when
+    # called outside a batch run
+    with page_run():
+        candidates = find_pdf_candidates(main_url)
+        direct = False
+        if not candidates:
+            download = get_link_download(main_url, PDF_KINDS)
+            if not download:
+                logger.info("No PDF links found on the page.")
+                return None
+            download.close()
+            # The link is the menu PDF itself, so it needs no ranking or keywords
+            logger.info(f"{main_url} is a PDF; processing it directly.")
+            candidates = [{'url': main_url, 'anchor_text': '', 'score': None}]
+            direct = True
+
+        # Process the most promising PDF first and fall back in rank order
+        skipped_known_week = False
+        for candidate in (candidates if direct else rank_pdf_candidates(candidates)):
+            pdf_url = candidate['url']
+            logger.info(f"Processing potential PDF link: {pdf_url} (score {candidate['score']})")
+            # Check if the PDF is relevant based on the filename or link text
+            if not direct and not is_relevant_pdf(pdf_url) and not is_relevant_anchor_text(candidate['anchor_text']):
+                logger.info(f"Skipping PDF at {pdf_url} because it does not contain relevant keywords in the filename.")
+                continue
+
+            # Skip PDFs whose filename or link text marks them as stale or already ingested
+            week_status = classify_source_week(pdf_url, candidate['anchor_text'], known_weeks)
+            if week_status in ('stale', 'ingested'):
+                logger.info(f"Skipping PDF at {pdf_url} because its week is {week_status}.")
+                skipped_known_week = True
+                continue
+
+            used_solution = solution
+            if solution == 'text':
+                logger.info("Using the text layer only")
+                extracted_text = process_pdf_text_layer(pdf_url)
+            elif solution == '1':
+                logger.info("Using Solution 1")
+                extracted_text = process_pdf_with_solution1(pdf_url)
+            elif solution == '2':
+                logger.info("Using Solution 2")
+                extracted_text = process_pdf_with_solution2(pdf_url)
+            elif solution == '3':
+                logger.info("Using Solution 3")
+                extracted_text = process_pdf_with_solution3(pdf_url)
+            else:
+                logger.info("No specific solution provided. Attempting automatic detection.")
+                auto_details = {}
+                extracted_text = process_pdf_auto(pdf_url, auto_details)
+                used_solution = auto_details.get('solution')
+
+            if extracted_text:
+                # The week marker in the heading of a text-layer document is checked
+                # before the LLM stage; OCR output is not trusted for week numbers
+                if week_status == 'unknown' and used_solution in ('text', '2'):
+                    text_status = classify_source_week(text=heading_text(extracted_text), known_weeks=known_weeks)
+                    if text_status in ('stale', 'ingested'):
+                        logger.info(f"Skipping PDF at {pdf_url} because its content is for a {text_status} week.")
+                        skipped_known_week = True
+                        continue
+                logger.info(f"Relevant text found in PDF: {pdf_url}")
+                if details is not None:
+                    details['solution'] = used_solution
+                return extracted_text
+
+        if skipped_known_week:
+            logger.info("The only relevant PDFs are for a past or already stored week.")
+            return KNOWN_WEEK
+        logger.info("No relevant PDF found containing the specified keywords.")
         return None
 
-    for pdf_url in pdf_links:
-        logger.info(f"Processing potential PDF link: {pdf_url}")
-        # Check if the PDF is relevant based on the filename
-        if not is_relevant_pdf(pdf_url):
-            logger.info(f"Skipping PDF at {pdf_url} because it does not contain relevant keywords in the filename.")
-            continue
-
-        if solution == '1':
-            logger.info("Using Solution 1")
-            extracted_text = process_pdf_with_solution1(pdf_url)
-        elif solution == '2':
-            logger.info("Using Solution 2")
-            extracted_text = process_pdf_with_solution2(pdf_url)
-        elif solution == '3':
-            logger.info("Using Solution 3")
-            extracted_text = process_pdf_with_solution3(pdf_url)
-        else:
-            logger.info("No specific solution provided. Attempting automatic detection.")
-            extracted_text = process_pdf_auto(pdf_url)
-
-        if extracted_text:
-            logger.info(f"Relevant text found in PDF: {pdf_url}")
-            return extracted_text
-
-    logger.info("No relevant PDF found containing the specified keywords.")
-    return None
-
 # Common functions used by all solutions
-def pdf_to_images(pdf_content):
+def pdf_to_images(pdf_content, pages=None):
+    """
+    Renders the requested pages (all by default) to grayscale images. Prefer
+    iter_pdf_page_images for documents that can be processed page by page.
+    """
     try:
         # Convert PDF to images (multi-page support)
-        images = convert_from_bytes(pdf_content, poppler_path=poppler_path)
+        images = [image for _, image in iter_pdf_page_images(pdf_content, pages)]
         return images
     except Exception as e:
         logger.error(f"Error processing PDF: {e}")
         return None
 
+def iter_pdf_page_images(pdf_content, pages=None):
+    """
+    Yields (page_number, image) for the requested pages, rendering them one at a
+    time so only a few pages are held in memory.
+    """
+    return iter_pdf_pages(pdf_content, pages=pages, poppler_path=poppler_path)
+
 def extract_text_from_image(image):
+    """
+    Extracts text from a page image, returning None when the OCR confidence is too
+    low so unreadable scans never reach the LLM stage.
+    """
+    result = extract_ocr_result_from_image(image)
+    summarize_ocr_results("page", [(result, bool(result and result['accepted']))])
+    if not result or not result['accepted']:
+        return None
+    return result['text']
+
+def extract_ocr_result_from_image(image, source="page", min_words=None, retry=True):
+    """
+    Runs OCR with word-level confidences. If the first pass is unreliable and retry
+    is enabled, the image is OCR'd again after Otsu binarization and the better
+    result is kept. The returned dict has an extra 'accepted' flag.
+    """
     try:
         # Extract text using Tesseract
         custom_oem_psm_config = r'--oem 3 --psm 3'
-        text = pytesseract.image_to_string(image, lang='swe', config=custom_oem_psm_config)
-        return text
+        result = ocr_with_confidence(image, config=custom_oem_psm_config)
+
+        if retry and not is_acceptable_ocr(result, min_words=min_words):
+            record_ocr_retry(source)
+            retry_result = ocr_with_confidence(preprocess_image_for_ocr_otsu(image), config=custom_oem_psm_config)
+            result = best_ocr_result([result, retry_result])
+
+        accepted = is_acceptable_ocr(result, min_words=min_words)
+        record_ocr_result(result, source, accepted)
+        result['accepted'] = accepted
+        return result
     except Exception as e:
         logger.error(f"Failed to extract text from image: {e}")
         return None
 
-def find_pdf_links(url):
-    try:
-        response = requests.get(url)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.content, 'html.parser')
+def fetch_pdf(url):
+    """
+    Downloads a PDF with a size cap, accepting it only if its magic bytes say it is
+    a PDF. Returns a DownloadedContent (to be closed by the caller) or None.
+    Inside page_run() the download is shared, so the text-layer strategy and the
+    OCR strategy that follows it fetch the PDF once.
+    """
+    download = get_run_download(url, lambda pdf_url: download_url(pdf_url, expected_kinds=PDF_KINDS))
+    if not download or download.kind not in PDF_KINDS:
+        logger.error(f"The URL does not point to a valid PDF: {url}")
+        return None
+    return download
 
-        # Extract all potential PDF links
-        pdf_links = []
-        for link in soup.find_all('a', href=True):
-            href = link['href']
-            if href.lower().endswith('.pdf') or 'pdf' in href.lower():
-                pdf_links.append(requests.compat.urljoin(url, href))
+def find_pdf_links(url):
+    return [candidate['url'] for candidate in find_pdf_candidates(url)]
 
-        return pdf_links
+def find_pdf_candidates(url):
+    """
+    Collects the potential PDF links of a page together with their anchor text.
+    Returns a list of {'url', 'anchor_text'} dicts in document order, without duplicates.
+    """
+    try:
+        document = get_page_document(url)
+        if not document:
+            return []
+        return document.pdf_candidates
     except Exception as e:
         logger.error(f"Error finding PDF links: {e}")
         return []
 
-def extract_week_number(text):
+# Keyword weights used to rank PDF candidates by filename and link text
+PDF_POSITIVE_KEYWORDS = {
+    'lunch': 3, 'dagens': 3, 'veckans': 2, 'meny': 2, 'menu': 2, 'vecka': 1, 'week': 1,
+}
+PDF_NEGATIVE_KEYWORDS = {
+    'arkiv': -3, 'archive': -3, 'catering': -3, 'julbord': -3, 'a-la-carte': -2, 'alacarte': -2,
+    'dryck': -2, 'drinks': -2, 'wine': -2, 'allergen': -2, 'brunch': -1,
+}
+PDF_PROBE_TIMEOUT = 5
+PDF_PROBE_WORKERS = 8
+
+def keyword_score(text):
+    text = (text or '').lower()
+    score = 0
+    for keywords in (PDF_POSITIVE_KEYWORDS, PDF_NEGATIVE_KEYWORDS):
+        for keyword, weight in keywords.items():
+            if re.search(r'(?<![a-zåäö])' + re.escape(keyword), text):
+                score += weight
+    return score
+
+def probe_pdf_candidate(pdf_url):
     """
-    Extracts the week number from the given text.
-
-    Possible patterns:
-    - Vecka x
-    - Week x
-    - V x
-    - V. x
-    - W x
+    Sends a HEAD request and returns a dict with 'ok', 'content_type' and 'content_length'.
     """
-    week_patterns = [
-        r'vecka\s*\d{1,2}',    # Matches 'Vecka 46' or 'Vecka46'
-        r'week\s*\d{1,2}',     # Matches 'Week 46' or 'Week46'
-        r'\bv\.?\s*\d{1,2}\b', # Matches 'V46', 'V 46', 'V.46', 'V. 46'
-        r'\bw\.?\s*\d{1,2}\b', # Matches 'W46', 'W 46', 'W.46', 'W. 46'
-    ]
-
-    for pattern in week_patterns:
-        match = re.search(pattern, text, re.IGNORECASE)
-        if match:
-            week_str = match.group()
-            # Clean up the string (e.g., remove extra spaces)
-            week_str = re.sub(r'\s+', ' ', week_str.strip())
-            return week_str.capitalize()
-    return None
+    try:
+        response = requests.head(pdf_url, allow_redirects=True, timeout=PDF_PROBE_TIMEOUT)
+        content_length = response.headers.get('Content-Length', '')
+        return {
+            'ok': response.status_code < 400,
+            # Some servers do not support HEAD; do not penalise them
+            'unsupported': response.status_code in (405, 501),
+            'content_type': response.headers.get('Content-Type', '').lower(),
+            'content_length': int(content_length) if content_length.isdigit() else None,
+        }
+    except requests.exceptions.RequestException as e:
+        logger.info(f"HEAD probe failed for {pdf_url}: {e}")
+        return {'ok': False, 'unsupported': True, 'content_type': '', 'content_length': None}
 
-def extract_week_number_from_url(url):
+def rank_pdf_candidates(candidates, today=None):
     """
-    Extracts the week number from the URL or filename.
+    Scores PDF candidates and returns them best first. The score combines:
+        - keywords in the filename and anchor text (menu words up, archives and
+          drink or catering lists down),
+        - the week number in the filename or anchor text compared with the current
+          ISO week (this week best, last week and older penalised),
+        - concurrent HEAD probes: non-PDF responses and files over the download
+          cap are penalised, broken links are dropped to the end.
+    Ties keep document order.
     """
-    filename = url.split('/')[-1].lower()
+    if not candidates:
+        return []
 
-    # Define patterns that match 'vecka' or 'v' at the start or after a separator
-    week_patterns = [
-        r'(?:^|[\-_\.])vecka[\s\-\.]*\d{1,2}',  # Matches 'vecka46', 'vecka-46', '_vecka_46', etc.
-        r'(?:^|[\-_\.])v[\s\-\.]*\d{1,2}',      # Matches 'v46', 'v-46', '_v_46', etc.
-        r'(?:^|[\-_\.])w[\s\-\.]*\d{1,2}',      # Matches 'w46', 'w-46', '_w_46', etc.
-    ]
+    with ThreadPoolExecutor(max_workers=min(PDF_PROBE_WORKERS, len(candidates))) as executor:
+        probes = list(executor.map(probe_pdf_candidate, [candidate['url'] for candidate in candidates]))
+
+    ranked = []
+    for position, (candidate, probe) in enumerate(zip(candidates, probes)):
+        filename = candidate['url'].split('/')[-1]
+        score = keyword_score(filename) + keyword_score(candidate['anchor_text'])
+
+        week = parse_week_number(extract_week_number_from_url(candidate['url']))
+        if week is None:
+            week = parse_week_number(extract_week_number(candidate['anchor_text']))
+        if week is not None:
+            distance = week_distance(week, today)
+            if distance == 0:
+                score += 5
+            elif distance == 1:
+                score += 2  # Next week's menu is sometimes published early
+            elif distance == -1:
+                score -= 2
+            else:
+                score -= 5
 
-    for pattern in week_patterns:
-        match = re.search(pattern, filename, re.IGNORECASE)
-        if match:
-            week_str = match.group()
-            # Clean up the string (e.g., remove separators and extra spaces)
-            week_str = re.sub(r'[\-_\.]', ' ', week_str)
-            week_str = re.sub(r'\s+', ' ', week_str.strip())
-            return week_str.capitalize()
-    return None
+        if not probe['ok'] and not probe['unsupported']:
+            score -= 10
+        elif 'application/pdf' in probe['content_type']:
+            score += 2
+        elif probe['content_type'] and 'octet-stream' not in probe['content_type']:
+            score -= 4
+        if probe['content_length'] and probe['content_length'] > DOWNLOAD_MAX_BYTES:
+            score -= 10
+
+        ranked.append(dict(candidate, score=score, week=week, position=position))
+
+    ranked.sort(key=lambda candidate: (-candidate['score'], candidate['position']))
+    logger.info("Ranked PDF candidates: " + ", ".join(f"{c['url']} ({c['score']})" for c in ranked))
+    return ranked
 
 def is_relevant_pdf(url):
     """
@@ -152,6 +319,13 @@ def is_relevant_pdf(url):
         return True
     return False
 
+def is_relevant_anchor_text(anchor_text):
+    """
+    Checks if the link text mentions lunch, 'dagens' or an explicit week number.
+    """
+    anchor_text = (anchor_text or '').lower()
+    return 'lunch' in anchor_text or 'dagens' in anchor_text or bool(extract_week_number(anchor_text))
+
 def extract_text_with_pypdf2(pdf_content):
     try:
         # Wrap pdf_content in BytesIO to create a file-like object
@@ -205,17 +379,20 @@ def process_pdf_with_solution1(url):
     """
     Solution 1: Uses contour detection and ROI extraction.
     """
+    download = None
     try:
-        # Fetch the PDF content from the URL
-        response = requests.get(url)
-        response.raise_for_status()
-
-        # Check content type to confirm it's a PDF
-        if 'application/pdf' not in response.headers.get('Content-Type', ''):
-            logger.error(f"The URL does not point to a valid PDF: {url}")
+        # Fetch the PDF content from the URL (size-capped, sniffed as PDF)
+        download = fetch_pdf(url)
+        if not download:
             return None
 
-        pdf_content = response.content
+        pdf_content = download.content
+
+        # Check the page count from the PDF structure before rendering anything
+        pdf_info = inspect_pdf(pdf_content)
+        if pdf_info and pdf_info['page_count'] > 2:
+            logger.info(f"Skipping PDF at {url} because it has more than 2 pages.")
+            return None
 
         # Convert PDF to images
         images = pdf_to_images(pdf_content)
@@ -223,11 +400,6 @@ def process_pdf_with_solution1(url):
             logger.error(f"No images were generated from the PDF at {url}.")
             return None
 
-        # Check if the PDF has more than 2 pages
-        if len(images) > 2:
-            logger.info(f"Skipping PDF at {url} because it has more than 2 pages.")
-            return None
-
         # Step 1: Extract text from the PDF to find week number and keywords
         week_text = ""
         for i, image in enumerate(images):
@@ -264,14 +436,9 @@ def process_pdf_with_solution1(url):
             for i, image in enumerate(images):
                 logger.info(f"Processing page {i + 1} of the PDF at {url} for menu text...")
 
-                # Preprocess image for contour detection
-                thresh_image = preprocess_image_for_contour_detection(image)
-
-                # Find contours
-                contours = find_contours(thresh_image)
-
-                # Filter and sort contours
-                sorted_contours = filter_and_sort_contours(contours)
+                # Find, filter and sort contours on a downscaled copy of the page;
+                # boxes come back in full-resolution coordinates for cropping
+                sorted_contours = analyze_page_layout(image)['boxes']
                 if not sorted_contours:
                     logger.warning(f"No significant contours found on page {i + 1}. Using the whole page for OCR.")
                     page_text = extract_text_from_image(image)
@@ -279,11 +446,8 @@ def process_pdf_with_solution1(url):
                         full_text += page_text + "\n\n"
                     continue
 
-                # Crop image regions based on contours
-                rois = crop_image_regions(image, sorted_contours)
-
-                # Extract text from each ROI
-                page_text = extract_text_from_rois(rois)
+                # Merge regions into blocks and OCR them with as few calls as possible
+                page_text = extract_text_from_layout(image, sorted_contours)
                 if page_text:
                     full_text += page_text + "\n\n"
 
@@ -310,53 +474,30 @@ def process_pdf_with_solution1(url):
     except Exception as e:
         logger.error(f"Error processing PDF from URL: {e}")
         return None
+    finally:
+        if download:
+            download.close()
 
 def process_pdf_with_solution2(url):
     """
     Solution 2: Uses PyPDF2 for text extraction and falls back to OCR if needed.
     Improved to handle easily selectable text, remove duplicates, and better organize the output.
     """
+    download = None
     try:
-        # Fetch the PDF content from the URL
-        response = requests.get(url)
-        response.raise_for_status()
-
-        # Check content type to confirm it's a PDF
-        if 'application/pdf' not in response.headers.get('Content-Type', ''):
-            logger.error(f"The URL does not point to a valid PDF: {url}")
+        # Fetch the PDF content from the URL (size-capped, sniffed as PDF)
+        download = fetch_pdf(url)
+        if not download:
             return None
 
-        pdf_content = response.content
+        pdf_content = download.content
 
-        # Attempt to extract text directly from the PDF using PyPDF2
-        pdf_text = extract_text_with_pypdf2(pdf_content)
-        if pdf_text and len(pdf_text.strip()) > 50:  # Adjust threshold as needed
-            logger.info("PDF contains selectable text. Using PyPDF2 extracted text.")
-            # Deduplicate lines and organize content
-            cleaned_text = clean_and_organize_text(pdf_text)
-            return cleaned_text
-        else:
-            logger.info("PDF does not contain selectable text or text is insufficient. Proceeding with OCR.")
-
-            # Convert PDF to images and fallback to OCR
-            images = pdf_to_images(pdf_content)
-            if not images:
-                logger.error(f"No images were generated from the PDF at {url}.")
-                return None
-
-            # Extract text from images using OCR
-            full_text = ""
-            for i, image in enumerate(images):
-                logger.info(f"Extracting text from page {i + 1} using OCR...")
-                page_text = extract_text_from_image(image)
-                if page_text:
-                    full_text += page_text + "\n\n"
-
-            if not full_text.strip():
-                logger.warning(f"No text extracted from the PDF at {url} using OCR.")
-                return None
-
-            return full_text.strip()
+        # Use each page's text layer where it is usable and OCR only the rest
+        extracted_text = extract_text_with_page_routing(pdf_content)
+        if not extracted_text:
+            logger.warning(f"No text extracted from the PDF at {url}.")
+            return None
+        return extracted_text
 
     except requests.exceptions.RequestException as e:
         logger.error(f"Network error while fetching the PDF: {e}")
@@ -364,6 +505,91 @@ def process_pdf_with_solution2(url):
     except Exception as e:
         logger.error(f"Error processing PDF from URL: {e}")
         return None
+    finally:
+        if download:
+            download.close()
+
+def process_pdf_text_layer(url):
+    """
+    Uses only the pages with a dense, clean text layer and never renders or OCRs
+    anything. Returns None for scanned PDFs, so a caller can move on to OCR.
+    """
+    download = None
+    try:
+        download = fetch_pdf(url)
+        if not download:
+            return None
+
+        pdf_info = inspect_pdf(download.content)
+        if not pdf_info or not pdf_info['text_layer_pages']:
+            logger.info(f"The PDF at {url} has no text layer.")
+            return None
+
+        text_pages = route_pdf_pages(pdf_info)['text_pages']
+        full_text = "\n\n".join(text_pages[n] for n in sorted(text_pages) if text_pages[n].strip())
+        if not full_text.strip():
+            return None
+        return clean_and_organize_text(full_text)
+    except Exception as e:
+        logger.error(f"Error processing PDF from URL: {e}")
+        return None
+    finally:
+        if download:
+            download.close()
+
+def extract_text_with_page_routing(pdf_content, pdf_info=None, routes=None):
+    """
+    Extracts text page by page: pages with a dense, clean text layer use it (in
+    reading order), image-only or garbled pages are rendered and OCR'd, and pages
+    that have both a text layer and images use the text layer plus OCR of the
+    layout regions it does not cover.
+    Text-layer output is deduplicated and organized; pure OCR output is returned as is.
+    """
+    pdf_info = pdf_info or inspect_pdf(pdf_content)
+    if not pdf_info:
+        return None
+
+    routes = routes or route_pdf_pages(pdf_info)
+    page_texts = dict(routes['text_pages'])
+    mixed_pages = routes.get('mixed_pages') or {}
+
+    rendered_pages = sorted(set(routes['ocr_pages']) | set(mixed_pages))
+    if rendered_pages:
+        for page_number, image in iter_pdf_page_images(pdf_content, pages=rendered_pages):
+            if page_number in mixed_pages:
+                page = pdf_info['reader'].pages[page_number - 1]
+                page_text = extract_uncovered_regions(page, mixed_pages[page_number], image, page_number)
+            else:
+                logger.info(f"Extracting text from page {page_number} using OCR...")
+                page_text = extract_text_from_image(image)
+            if page_text:
+                page_texts[page_number] = page_text
+
+    full_text = "\n\n".join(page_texts[n] for n in sorted(page_texts) if page_texts[n].strip())
+    if not full_text.strip():
+        return None
+    if routes['text_pages'] or mixed_pages:
+        # Deduplicate lines and organize content
+        return clean_and_organize_text(full_text)
+    return full_text.strip()
+
+def extract_uncovered_regions(page, text, image, page_number):
+    """
+    Returns the text layer of a page followed by the OCR text of the layout
+    regions the text layer does not cover (e.g. a scanned menu under a typed
+    heading), so only those regions are OCR'd.
+    """
+    boxes = analyze_page_layout(image)['boxes']
+    coverage = text_layer_coverage(page, boxes, image.size)
+    uncovered = [box for box, share in zip(boxes, coverage) if share < REGION_TEXT_MIN_COVERAGE]
+    logger.info(
+        f"Page {page_number}: text layer covers {len(boxes) - len(uncovered)} of {len(boxes)} "
+        f"regions, OCR for the rest."
+    )
+    if not uncovered:
+        return text
+    ocr_text = extract_text_from_layout(image, uncovered)
+    return "\n\n".join(part for part in (text, ocr_text) if part and part.strip())
 
 def clean_and_organize_text(text):
     """
@@ -479,38 +705,36 @@ def process_pdf_with_solution3(url):
     """
     Solution 3: Directly performs OCR on the whole image with preprocessing and targeted regions for "Veckans" sections.
     """
+    download = None
     try:
-        # Fetch the PDF content from the URL
-        response = requests.get(url)
-        response.raise_for_status()
-
-        # Check content type to confirm it's a PDF
-        if 'application/pdf' not in response.headers.get('Content-Type', ''):
-            logger.error(f"The URL does not point to a valid PDF: {url}")
+        # Fetch the PDF content from the URL (size-capped, sniffed as PDF)
+        download = fetch_pdf(url)
+        if not download:
             return None
 
-        pdf_content = response.content
-
-        # Convert PDF to images
-        images = pdf_to_images(pdf_content)
-        if not images:
-            logger.error(f"No images were generated from the PDF at {url}.")
-            return None
+        pdf_content = download.content
 
-        # Full text extraction
+        # Full text extraction, rendering pages one at a time
         full_text = ""
-        for i, image in enumerate(images):
-            logger.info(f"Extracting text from page {i + 1} using OCR with preprocessing...")
+        first_page = None
+        for page_number, image in iter_pdf_page_images(pdf_content):
+            if first_page is None:
+                first_page = image
+            logger.info(f"Extracting text from page {page_number} using OCR with preprocessing...")
             processed_image = preprocess_image_for_ocr(image)
             page_text = extract_text_from_image(processed_image)
             if page_text:
                 full_text += page_text + "\n\n"
             else:
-                logger.warning(f"No text extracted from page {i + 1} using OCR.")
+                logger.warning(f"No text extracted from page {page_number} using OCR.")
+
+        if first_page is None:
+            logger.error(f"No images were generated from the PDF at {url}.")
+            return None
 
         # Extract "Veckans" sections specifically
-        veckans_fisk_text = extract_text_from_region(images[0], keyword="Veckans Fisk")
-        veckans_vegetariska_text = extract_text_from_region(images[0], keyword="Veckans Vegetariska")
+        veckans_fisk_text = extract_text_from_region(first_page, keyword="Veckans Fisk")
+        veckans_vegetariska_text = extract_text_from_region(first_page, keyword="Veckans Vegetariska")
 
         # Combine extracted parts
         combined_text = full_text + "\n\n" + veckans_fisk_text + "\n\n" + veckans_vegetariska_text
@@ -522,6 +746,9 @@ def process_pdf_with_solution3(url):
     except Exception as e:
         logger.error(f"Error processing PDF from URL: {e}")
         return None
+    finally:
+        if download:
+            download.close()
 
 def extract_text_from_region(image, keyword):
     """
@@ -529,7 +756,7 @@ def extract_text_from_region(image, keyword):
     """
     # Find the approximate region where the keyword is located and extract text from that area
     text = extract_text_from_image(image)
-    if keyword in text:
+    if text and keyword in text:
         start_idx = text.find(keyword)
         # Extract text around the keyword (e.g., the following lines or sentences)
         extracted_text = text[start_idx:start_idx + 300]  # Adjust 300 to capture nearby content
@@ -612,6 +839,20 @@ def preprocess_image_for_ocr(image):
 
     return Image.fromarray(thresholded_image)
 
+def preprocess_image_for_ocr_otsu(image):
+    """
+    Alternative preprocessing for low-confidence pages: Otsu thresholding adapts the
+    cut-off to the page instead of using a fixed value.
+    """
+    if isinstance(image, Image.Image):
+        np_image = np.array(image.convert("L"))
+    else:
+        np_image = np.asarray(image)
+    np_image = cv2.GaussianBlur(np_image, (3, 3), 0)
+    _, thresholded_image = cv2.threshold(np_image, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+
+    return Image.fromarray(thresholded_image)
+
 def extract_special_sections(text, section_keywords):
     """
     Extracts special sections from text based on specific keywords (e.g., "Veckans Fisk" or "Veckans Vegetariska").
@@ -695,24 +936,31 @@ def extract_special_sections(text, section_keywords):
         logger.error(f"Error processing PDF from URL: {e}")
         return None
 
-def process_pdf_auto(url):
+def process_pdf_auto(url, details=None):
     """
     Automatically selects the best solution based on the PDF's characteristics.
+    The selected solution is stored in details['solution'] when details is given.
     """
+    details = details if details is not None else {}
+    download = None
     try:
         # Fetch the PDF content
-        response = requests.get(url)
-        response.raise_for_status()
-        pdf_content = response.content
-
-        # Attempt to extract text using PyPDF2 (Solution 2)
-        text = extract_text_with_pypdf2(pdf_content)
-        if text and len(text.strip()) > 50:  # Threshold can be adjusted
-            logger.info("Auto-detection selected Solution 2 (PyPDF2)")
-            return process_pdf_with_solution2(url)
-
-        # Convert PDF to images
-        images = pdf_to_images(pdf_content)
+        download = fetch_pdf(url)
+        if not download:
+            return None
+        pdf_content = download.content
+
+        # Route pages with a usable text layer to text extraction (Solution 2)
+        pdf_info = inspect_pdf(pdf_content)
+        if pdf_info and pdf_info['text_layer_pages']:
+            routes = route_pdf_pages(pdf_info)
+            if routes['text_pages'] or routes['mixed_pages']:
+                logger.info("Auto-detection selected Solution 2 (text layer, OCR only for image-only pages)")
+                details['solution'] = '2'
+                return extract_text_with_page_routing(pdf_content, pdf_info, routes)
+
+        # Render only the first page for the layout probe
+        images = pdf_to_images(pdf_content, pages=[1])
         if not images:
             logger.error("Failed to convert PDF to images.")
             return None
@@ -720,72 +968,74 @@ def process_pdf_auto(url):
         # Analyze the image to decide between Solution 1 and Solution 3
         if is_suitable_for_solution1(images[0]):
             logger.info("Auto-detection selected Solution 1 (Contour Detection)")
+            details['solution'] = '1'
             return process_pdf_with_solution1(url)
         else:
             logger.info("Auto-detection selected Solution 3 (Direct OCR)")
+            details['solution'] = '3'
             return process_pdf_with_solution3(url)
 
     except Exception as e:
         logger.error(f"Error during automatic PDF processing: {e}")
         return None
+    finally:
+        if download:
+            download.close()
 
 def is_suitable_for_solution1(image):
     """
     Analyzes the image to determine if contour detection is appropriate.
     """
-    # Preprocess the image
-    thresh_image = preprocess_image_for_contour_detection(image)
-    contours = find_contours(thresh_image)
-    if contours and len(contours) > 10:  # Adjust threshold based on testing
+    # Layout analysis runs on a downscaled copy and is cached for solution 1
+    layout = analyze_page_layout(image)
+    if layout['contour_count'] > AUTO_CONTOUR_THRESHOLD:
         return True
     else:
         return False
 
 # Functions related to image preprocessing and contour detection
 
-def preprocess_image_for_contour_detection(image):
-    # Convert PIL Image to OpenCV format
-    cv_image = np.array(image.convert('RGB'))
-    gray = cv2.cvtColor(cv_image, cv2.COLOR_BGR2GRAY)
-
-    # Apply adaptive thresholding
-    thresh = cv2.adaptiveThreshold(
-        gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-        cv2.THRESH_BINARY_INV, 11, 2
-    )
-
-    return thresh
-
-def find_contours(thresh_image):
-    contours, _ = cv2.findContours(
-        thresh_image, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE
-    )
-    return contours
-
-def filter_and_sort_contours(contours):
-    # Filter contours based on area
-    filtered_contours = []
-    for cnt in contours:
-        x, y, w, h = cv2.boundingRect(cnt)
-        area = cv2.contourArea(cnt)
-        if area > 1000:  # Adjust the threshold as needed
-            filtered_contours.append((x, y, w, h))
-
-    # Sort contours top-to-bottom, then left-to-right
-    sorted_contours = sorted(filtered_contours, key=lambda b: (b[1], b[0]))
-    return sorted_contours
-
-def crop_image_regions(image, contours):
-    rois = []
-    for (x, y, w, h) in contours:
-        roi = image.crop((x, y, x + w, y + h))
-        rois.append(roi)
-    return rois
-
-def extract_text_from_rois(rois):
-    full_text = ""
-    for roi in rois:
-        text = extract_text_from_image(roi)
-        if text:
-            full_text += text + "\n"
-    return full_text
+def extract_text_from_layout(image, boxes):
+    """
+    OCRs the regions of a page with as few Tesseract calls as possible: nearby and
+    overlapping boxes are merged into column/paragraph blocks that are OCR'd one by
+    one, and small leftovers (single words, prices) are packed into composite
+    images whose text is mapped back to each piece. Text is returned in reading order.
+    """
+    np_image = np.asarray(image.convert('L')) if isinstance(image, Image.Image) else image
+    page_size = (np_image.shape[1], np_image.shape[0])
+    plan = plan_text_blocks(boxes, page_size)
+
+    texts = {}
+    ocr_calls = 0
+    outcomes = []
+
+    # Blocks go to the OCR workers as shared-memory descriptors when a pool is configured
+    block_results = ocr_regions(np_image, [box for _, box in plan['blocks']], config=r'--oem 3 --psm 3')
+    for (index, _), result in zip(plan['blocks'], block_results):
+        ocr_calls += 1
+        accepted = is_acceptable_ocr(result, min_words=1)
+        record_ocr_result(result, f"block {index + 1}", accepted)
+        outcomes.append((result, accepted))
+        if accepted and result['text']:
+            texts[index] = result['text']
+
+    leftover_boxes = [box for _, box in plan['leftovers']]
+    for composite, offsets in pack_regions(np_image, leftover_boxes):
+        try:
+            data = image_to_data(composite, config=r'--oem 3 --psm 6')
+        except Exception as e:
+            logger.error(f"Failed to extract text from composite image: {e}")
+            continue
+        ocr_calls += 1
+        results = split_ocr_data_by_rows(data, [(start, end) for start, end, _ in offsets])
+        for (_, _, piece), result in zip(offsets, results):
+            index = plan['leftovers'][piece][0]
+            accepted = is_acceptable_ocr(result, min_words=1)
+            record_ocr_result(result, f"leftover {index + 1}", accepted)
+            outcomes.append((result, accepted))
+            if accepted and result['text']:
+                texts[index] = result['text']
+
+    summarize_ocr_results(f"page layout ({len(boxes)} contour regions)", outcomes, ocr_calls)
+    return "\n".join(texts[index] for index in sorted(texts))
@@ -0,0 +1,298 @@
+import logging
+import os
+import re
+
+import numpy as np
+
+from PyPDF2.generic import ContentStream
+
+from .layout import merge_text_blocks, order_blocks_for_reading
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# A page's text layer is used instead of OCR when it has at least this many characters
+PAGE_TEXT_MIN_CHARS = int(os.getenv('PAGE_TEXT_MIN_CHARS', '50'))
+# ...and at least this share of its non-space characters are letters or digits
+PAGE_TEXT_MIN_ALNUM_RATIO = 0.6
+# ...and at most this share are undecodable glyphs
+PAGE_TEXT_MAX_GARBAGE_RATIO = 0.02
+
+# Rough glyph width as a share of the font size, used to estimate fragment widths
+GLYPH_WIDTH_RATIO = 0.5
+
+# A page with a clean text layer is also OCR'd where its images cover at least this
+# share of the page (a scanned menu under a typed heading, not a logo)
+PAGE_IMAGE_MIN_COVERAGE = float(os.getenv('PAGE_IMAGE_MIN_COVERAGE', '0.1'))
+# Resolution of the grid the image coverage of a page is measured on
+IMAGE_COVERAGE_GRID = 100
+
+# A layout region whose area is at least this share text-layer text is not OCR'd
+REGION_TEXT_MIN_COVERAGE = float(os.getenv('REGION_TEXT_MIN_COVERAGE', '0.2'))
+
+
+def collect_text_fragments(page):
+    """
+    Collects the text fragments of a PyPDF2 page with their position on the page.
+    Returns a list of (x, y, font_size, text) in PDF user space (origin bottom-left).
+    """
+    fragments = []
+
+    def visitor(text, cm, tm, font_dict, font_size):
+        if not text or not text.strip():
+            return
+        # Combine the text matrix with the current transformation matrix
+        x = tm[4] * cm[0] + tm[5] * cm[2] + cm[4]
+        y = tm[4] * cm[1] + tm[5] * cm[3] + cm[5]
+        size = abs((font_size or 0) * tm[3] * cm[3]) or abs(font_size or 0) or 10.0
+        for i, line in enumerate(text.split('\n')):
+            if line.strip():
+                fragments.append((x, y - i * size * 1.2, size, line.strip()))
+
+    page.extract_text(visitor_text=visitor)
+    return fragments
+
+
+def fragment_boxes(page, fragments, scale=1.0):
+    """
+    Turns fragments into (x, y, w, h) boxes with a top-left origin at the corner of
+    the page's mediabox, which is not always at (0, 0). scale converts PDF points
+    to pixels of a rendered page.
+    """
+    left, bottom = (float(v) for v in page.mediabox.lower_left)
+    top = bottom + float(page.mediabox.height)
+    return [
+        (
+            int((x - left) * scale),
+            int((top - y - size) * scale),
+            max(1, int(len(text) * size * GLYPH_WIDTH_RATIO * scale)),
+            max(1, int(size * scale)),
+        )
+        for x, y, size, text in fragments
+    ]
+
+
+def join_line(line_fragments):
+    """
+    Joins the fragments of one line left to right, adding a space only where the
+    gap suggests a word boundary (some PDFs emit one fragment per glyph).
+    """
+    line_fragments = sorted(line_fragments, key=lambda f: f[0])
+    text = line_fragments[0][3]
+    previous_end = line_fragments[0][0] + len(line_fragments[0][3]) * line_fragments[0][2] * GLYPH_WIDTH_RATIO
+    for x, _, size, fragment in line_fragments[1:]:
+        separator = '' if x - previous_end < size * 0.1 else ' '
+        text += separator + fragment
+        previous_end = max(previous_end, x + len(fragment) * size * GLYPH_WIDTH_RATIO)
+    return text
+
+
+def extract_positional_text(page):
+    """
+    Extracts the text of a PyPDF2 page in reading order. Fragments are turned into
+    boxes and grouped with the same block merging and column ordering used for
+    scanned pages, so multi-column menus are read column by column instead of
+    line by line across columns.
+    """
+    try:
+        fragments = collect_text_fragments(page)
+        if not fragments:
+            return page.extract_text() or ""
+
+        page_width = float(page.mediabox.width)
+
+        # Boxes in top-left origin coordinates, as used by the layout module
+        boxes = fragment_boxes(page, fragments)
+        blocks = order_blocks_for_reading(merge_text_blocks(boxes), page_width)
+
+        # Assign every fragment to the first block containing its centre
+        array = np.asarray(boxes, dtype=np.float64)
+        centers_x = array[:, 0] + array[:, 2] / 2.0
+        centers_y = array[:, 1] + array[:, 3] / 2.0
+        block_array = np.asarray(blocks, dtype=np.float64)
+        inside = (
+            (centers_x[:, None] >= block_array[None, :, 0])
+            & (centers_x[:, None] <= block_array[None, :, 0] + block_array[None, :, 2])
+            & (centers_y[:, None] >= block_array[None, :, 1])
+            & (centers_y[:, None] <= block_array[None, :, 1] + block_array[None, :, 3])
+        )
+        assignment = np.where(inside.any(axis=1), inside.argmax(axis=1), len(blocks) - 1)
+
+        block_texts = []
+        for block_index in range(len(blocks)):
+            members = [(boxes[i][1], fragments[i]) for i in np.flatnonzero(assignment == block_index)]
+            if not members:
+                continue
+            # Group fragments into lines by their top coordinate
+            members.sort(key=lambda m: (m[0], m[1][0]))
+            lines = []
+            current = [members[0]]
+            for member in members[1:]:
+                if member[0] - current[0][0] <= current[0][1][2] * 0.5:
+                    current.append(member)
+                else:
+                    lines.append(current)
+                    current = [member]
+            lines.append(current)
+            block_texts.append("\n".join(join_line([m[1] for m in line]) for line in lines))
+
+        return "\n\n".join(block_texts)
+    except Exception as e:
+        logger.warning(f"Positional text extraction failed, using plain extraction: {e}")
+        return page.extract_text() or ""
+
+
+def is_readable_text_layer(text):
+    """
+    Checks whether a page's embedded text is clean (mostly letters and digits, few
+    undecodable glyphs), however little of it there is.
+    """
+    characters = re.sub(r'\s+', '', text or '')
+    if not characters:
+        return False
+    alnum_ratio = sum(c.isalnum() for c in characters) / len(characters)
+    garbage = characters.count('\ufffd') + len(re.findall(r'\(cid:\d+\)', text))
+    return alnum_ratio >= PAGE_TEXT_MIN_ALNUM_RATIO and garbage / len(characters) <= PAGE_TEXT_MAX_GARBAGE_RATIO
+
+
+def is_clean_text_layer(text):
+    """
+    Checks whether a page's embedded text is dense and clean enough to be used
+    instead of OCR.
+    """
+    characters = re.sub(r'\s+', '', text or '')
+    return len(characters) >= PAGE_TEXT_MIN_CHARS and is_readable_text_layer(text)
+
+
+def multiply_matrices(m, n):
+    """Multiplies two PDF transformation matrices given as (a, b, c, d, e, f)."""
+    return (
+        m[0] * n[0] + m[1] * n[2],
+        m[0] * n[1] + m[1] * n[3],
+        m[2] * n[0] + m[3] * n[2],
+        m[2] * n[1] + m[3] * n[3],
+        m[4] * n[0] + m[5] * n[2] + n[4],
+        m[4] * n[1] + m[5] * n[3] + n[5],
+    )
+
+
+def collect_image_boxes(content, resources, reader, ctm=(1, 0, 0, 1, 0, 0), depth=0):
+    """
+    Walks a content stream and returns the (x0, y0, x1, y1) bounding boxes, in PDF
+    user space, of the image XObjects it draws, following form XObjects a few
+    levels deep.
+    """
+    xobjects = resources.get('/XObject') if resources is not None else None
+    xobjects = xobjects.get_object() if xobjects is not None else {}
+    boxes = []
+    stack = []
+    for operands, operator in ContentStream(content, reader).operations:
+        if operator == b'q':
+            stack.append(ctm)
+        elif operator == b'Q':
+            ctm = stack.pop() if stack else ctm
+        elif operator == b'cm':
+            ctm = multiply_matrices(tuple(float(v) for v in operands), ctm)
+        elif operator == b'Do' and operands and operands[0] in xobjects:
+            xobject = xobjects[operands[0]].get_object()
+            subtype = xobject.get('/Subtype')
+            if subtype == '/Image':
+                # An image fills the unit square of the current transformation
+                corners = [(x * ctm[0] + y * ctm[2] + ctm[4], x * ctm[1] + y * ctm[3] + ctm[5])
+                           for x, y in ((0, 0), (1, 0), (0, 1), (1, 1))]
+                xs, ys = zip(*corners)
+                boxes.append((min(xs), min(ys), max(xs), max(ys)))
+            elif subtype == '/Form' and depth < 3:
+                matrix = tuple(float(v) for v in xobject.get('/Matrix', (1, 0, 0, 1, 0, 0)))
+                form_resources = xobject.get('/Resources')
+                form_resources = form_resources.get_object() if form_resources is not None else resources
+                boxes.extend(collect_image_boxes(
+                    xobject, form_resources, reader, multiply_matrices(matrix, ctm), depth + 1
+                ))
+    return boxes
+
+
+def page_image_coverage(page):
+    """
+    Returns the share of a PyPDF2 page's area covered by the images it draws. A
+    small logo covers next to nothing; a scanned menu pasted under a typed heading
+    covers most of the page. Returns 0.0 if the page cannot be inspected, so a page
+    with a clean text layer is then read from that layer alone.
+    """
+    try:
+        content = page.get_contents()
+        if content is None:
+            return 0.0
+        resources = page.get('/Resources')
+        resources = resources.get_object() if resources is not None else None
+        boxes = collect_image_boxes(content, resources, page.pdf)
+        if not boxes:
+            return 0.0
+
+        # Union of the boxes on a coarse grid, so overlapping images count once
+        left, bottom = (float(v) for v in page.mediabox.lower_left)
+        width, height = float(page.mediabox.width), float(page.mediabox.height)
+        grid = np.zeros((IMAGE_COVERAGE_GRID, IMAGE_COVERAGE_GRID), dtype=bool)
+        for x0, y0, x1, y1 in boxes:
+            col0 = int(np.clip((x0 - left) / width, 0, 1) * IMAGE_COVERAGE_GRID)
+            col1 = int(np.ceil(np.clip((x1 - left) / width, 0, 1) * IMAGE_COVERAGE_GRID))
+            row0 = int(np.clip((y0 - bottom) / height, 0, 1) * IMAGE_COVERAGE_GRID)
+            row1 = int(np.ceil(np.clip((y1 - bottom) / height, 0, 1) * IMAGE_COVERAGE_GRID))
+            grid[row0:row1, col0:col1] = True
+        return float(grid.mean())
+    except Exception as e:
+        logger.warning(f"Could not inspect page images, treating the page as text only: {e}")
+        return 0.0
+
+
+def text_layer_coverage(page, regions, image_size):
+    """
+    Returns, for each layout region of the rendered page (pixel boxes), the share
+    of its area covered by text-layer fragments.
+    """
+    width, height = image_size
+    scale = width / float(page.mediabox.width)
+    mask = np.zeros((height, width), dtype=bool)
+    for x, y, w, h in fragment_boxes(page, collect_text_fragments(page), scale):
+        mask[max(0, y):max(0, y + h), max(0, x):max(0, x + w)] = True
+    coverage = []
+    for x, y, w, h in regions:
+        region = mask[y:y + h, x:x + w]
+        coverage.append(float(region.mean()) if region.size else 0.0)
+    return coverage
+
+
+def route_pdf_pages(pdf_info):
+    """
+    Decides per page whether to use the embedded text layer, OCR, or both. Returns
+    a dict with:
+        - text_pages: {page_number: text} for pages with a dense, clean text layer
+          and at most small images (logos, icons)
+        - mixed_pages: {page_number: text} for pages with a clean text layer whose
+          images cover a meaningful share of the page; the regions the text layer
+          does not cover are OCR'd
+        - ocr_pages: page numbers that are image-only or whose text layer is garbled
+    """
+    text_pages = {}
+    mixed_pages = {}
+    ocr_pages = []
+    for page_number, page in enumerate(pdf_info['reader'].pages, start=1):
+        text = ""
+        if page_number in pdf_info['text_layer_pages']:
+            text = extract_positional_text(page)
+            text = text.encode('utf-8', errors='ignore').decode('utf-8')
+        if not is_readable_text_layer(text):
+            ocr_pages.append(page_number)
+        elif page_image_coverage(page) >= PAGE_IMAGE_MIN_COVERAGE:
+            mixed_pages[page_number] = text
+        elif is_clean_text_layer(text):
+            text_pages[page_number] = text
+        else:
+            ocr_pages.append(page_number)
+
+    logger.info(
+        f"PDF page routing: text layer for pages {sorted(text_pages) or 'none'}, "
+        f"text layer and OCR for pages {sorted(mixed_pages) or 'none'}, "
+        f"OCR for pages {ocr_pages or 'none'}."
+    )
+    return {'text_pages': text_pages, 'mixed_pages': mixed_pages, 'ocr_pages': ocr_pages}
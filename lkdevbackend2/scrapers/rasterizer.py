@@ -0,0 +1,136 @@
+import logging
+import os
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from pdf2image import convert_from_path, pdfinfo_from_bytes
+from PyPDF2 import PdfReader
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Rendering resolution; pdf2image's default is 200 DPI
+PDF_RENDER_DPI = int(os.getenv('PDF_RENDER_DPI', '200'))
+# Number of pages rendered concurrently (and the most pages held in memory at once)
+PDF_RENDER_THREADS = int(os.getenv('PDF_RENDER_THREADS', '2'))
+
+
+def inspect_pdf(pdf_content):
+    """
+    Reads the PDF structure without rendering anything. Returns a dict with:
+        - page_count: number of pages
+        - text_layer_pages: 1-based numbers of pages that reference fonts, i.e.
+          pages that have an embedded text layer
+        - reader: the PdfReader, so callers can reuse the parsed document
+    Returns None if the PDF cannot be parsed.
+    """
+    try:
+        reader = PdfReader(BytesIO(pdf_content))
+        text_layer_pages = []
+        for page_number, page in enumerate(reader.pages, start=1):
+            resources = page.get('/Resources')
+            resources = resources.get_object() if resources is not None else {}
+            if '/Font' in resources:
+                text_layer_pages.append(page_number)
+        return {
+            'page_count': len(reader.pages),
+            'text_layer_pages': text_layer_pages,
+            'reader': reader,
+        }
+    except Exception as e:
+        logger.error(f"Error reading PDF structure: {e}")
+        return None
+
+
+def count_pdf_pages(pdf_content, poppler_path=None):
+    """
+    Returns the number of pages, from PyPDF2 or, for PDFs it cannot parse, from
+    poppler's pdfinfo (which renders them fine). Returns None if neither can.
+    """
+    info = inspect_pdf(pdf_content)
+    if info:
+        return info['page_count']
+    try:
+        kwargs = {'poppler_path': poppler_path} if poppler_path else {}
+        return int(pdfinfo_from_bytes(pdf_content, **kwargs)['Pages'])
+    except Exception as e:
+        logger.error(f"Error reading PDF page count: {e}")
+        return None
+
+
+def render_page(pdf_path, page_number, dpi=PDF_RENDER_DPI, grayscale=True, poppler_path=None):
+    """
+    Renders a single page of a PDF file. Returns a PIL image or None.
+    """
+    start = time.perf_counter()
+    kwargs = {'poppler_path': poppler_path} if poppler_path else {}
+    pages = convert_from_path(
+        pdf_path, dpi=dpi, first_page=page_number, last_page=page_number,
+        grayscale=grayscale, **kwargs
+    )
+    if not pages:
+        return None
+    logger.info(f"Rendered page {page_number} at {dpi} DPI in {time.perf_counter() - start:.2f}s.")
+    return pages[0]
+
+
+def iter_pdf_pages(pdf_content, pages=None, dpi=PDF_RENDER_DPI, grayscale=True,
+                   thread_count=PDF_RENDER_THREADS, poppler_path=None):
+    """
+    Renders the requested pages (1-based numbers, all pages by default) one at a
+    time and yields (page_number, image) in order. Pages are rendered ahead in
+    parallel, but at most thread_count pages (the one being consumed included) are
+    held at once, regardless of the document length. The PDF is written to a
+    temporary file once and removed when the generator is exhausted or closed.
+    """
+    if pages is None:
+        page_count = count_pdf_pages(pdf_content, poppler_path)
+        if not page_count:
+            return
+        pages = range(1, page_count + 1)
+    pages = iter(list(pages))
+    thread_count = max(1, thread_count)
+
+    fd, pdf_path = tempfile.mkstemp(suffix='.pdf')
+    executor = ThreadPoolExecutor(max_workers=thread_count)
+    pending = deque()
+    try:
+        with os.fdopen(fd, 'wb') as pdf_file:
+            pdf_file.write(pdf_content)
+
+        def submit(page_number):
+            future = executor.submit(render_page, pdf_path, page_number, dpi, grayscale, poppler_path)
+            pending.append((page_number, future))
+
+        for _ in range(thread_count):
+            page_number = next(pages, None)
+            if page_number is None:
+                break
+            submit(page_number)
+
+        while pending:
+            page_number, future = pending.popleft()
+            try:
+                image = future.result()
+            except Exception as e:
+                logger.error(f"Error rendering page {page_number}: {e}")
+                image = None
+
+            if image is not None:
+                yield page_number, image
+
+            # Only start the next page once the consumer is done with this one
+            next_page = next(pages, None)
+            if next_page is not None:
+                submit(next_page)
+    finally:
+        for _, future in pending:
+            future.cancel()
+        executor.shutdown(wait=True)
+        try:
+            os.remove(pdf_path)
+        except OSError:
+            pass
@@ -0,0 +1,101 @@
+import datetime
+import logging
+import re
+
+from .content_extraction import MIN_BLOCK_SCORE, content_text, menu_signal_score
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Identifiers and class names that are safe to use in a selector; names with
+# digits are usually generated per build or per post and are left out
+STABLE_NAME_PATTERN = re.compile(r'^[A-Za-z][A-Za-z_-]*$')
+# Largest menu text a recipe may return before it is considered broken
+RECIPE_MAX_CHARS = 20000
+
+
+def build_css_selector(element):
+    """
+    Builds a CSS selector that matches only element, walking up to the nearest
+    ancestor with a stable, unique id. Each step uses the tag, up to two stable
+    class names and :nth-of-type when siblings would otherwise match. Returns None
+    if no unique selector could be built.
+    """
+    root = element
+    while root.parent is not None:
+        root = root.parent
+
+    parts = []
+    node = element
+    while node is not None and node.name not in (None, '[document]', 'html'):
+        element_id = node.get('id')
+        if element_id and STABLE_NAME_PATTERN.match(element_id) and len(root.select(f'#{element_id}')) == 1:
+            parts.insert(0, f'{node.name}#{element_id}')
+            break
+
+        part = node.name
+        classes = [name for name in node.get('class', []) if STABLE_NAME_PATTERN.match(name)][:2]
+        if classes:
+            part += '.' + '.'.join(classes)
+        if node.parent is not None:
+            siblings = node.parent.find_all(node.name, recursive=False)
+            if len(siblings) > 1:
+                part += f':nth-of-type({siblings.index(node) + 1})'
+        parts.insert(0, part)
+        node = node.parent
+
+    selector = ' > '.join(parts)
+    try:
+        if selector and root.select(selector) == [element]:
+            return selector
+    except Exception as e:
+        logger.warning(f"Could not validate selector '{selector}': {e}")
+    return None
+
+
+def make_recipe(element, strategy):
+    """
+    Creates the extraction recipe for a menu container found by discovery: the
+    selector to go straight to it next time and the strategy that found it.
+    Returns None if no unique selector exists.
+    """
+    selector = build_css_selector(element)
+    if not selector:
+        return None
+    return {
+        'selector': selector,
+        'strategy': strategy,
+        'learned_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+    }
+
+
+def is_valid_recipe_text(text):
+    """
+    Cheap check that the text under a recipe's node still looks like a menu.
+    """
+    return bool(text) and len(text) <= RECIPE_MAX_CHARS and menu_signal_score(text) >= MIN_BLOCK_SCORE
+
+
+def apply_recipe(soup, recipe, strategy):
+    """
+    Goes straight to the node named by a stored recipe and returns its text, or
+    None when the recipe belongs to another strategy or no longer matches a menu
+    (the caller then falls back to full discovery).
+    """
+    if not recipe or recipe.get('strategy') != strategy or not recipe.get('selector'):
+        return None
+    try:
+        element = soup.select_one(recipe['selector'])
+    except Exception as e:
+        logger.warning(f"Invalid recipe selector '{recipe['selector']}': {e}")
+        return None
+    if element is None:
+        logger.info(f"Recipe selector '{recipe['selector']}' no longer matches; rediscovering.")
+        return None
+
+    text = content_text(element)
+    if not is_valid_recipe_text(text):
+        logger.info(f"Recipe selector '{recipe['selector']}' no longer holds a menu; rediscovering.")
+        return None
+    logger.info(f"Extracted menu with recipe selector '{recipe['selector']}'.")
+    return text
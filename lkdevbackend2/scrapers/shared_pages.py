@@ -0,0 +1,239 @@
+import atexit
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+import pytesseract
+
+from .ocr import ocr_with_confidence
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Number of OCR worker processes; 0 runs OCR in the calling thread
+OCR_PROCESS_WORKERS = int(os.getenv('OCR_PROCESS_WORKERS', '0'))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+class SharedPageBuffer:
+    """
+    A decoded grayscale page placed in shared memory once, so OCR workers can
+    attach to it by name and slice their regions without the page being pickled.
+
+    The creating process owns the segment: use it as a context manager (or call
+    release()) to close and unlink it once all workers are done.
+    """
+
+    def __init__(self, array):
+        array = np.ascontiguousarray(array, dtype=np.uint8)
+        self.shape = array.shape
+        self.dtype = array.dtype.str
+        self._shm = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+        self.array = np.ndarray(self.shape, dtype=array.dtype, buffer=self._shm.buf)
+        self.array[...] = array
+
+    @property
+    def descriptor(self):
+        """
+        What workers receive instead of the pixels.
+        """
+        return {'name': self._shm.name, 'shape': self.shape, 'dtype': self.dtype}
+
+    def release(self):
+        if self._shm is None:
+            return
+        # Drop the view first; the segment cannot be closed while it is exported
+        self.array = None
+        self._shm.close()
+        try:
+            self._shm.unlink()
+        except FileNotFoundError:
+            pass
+        self._shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+
+def start_process_pool(max_workers, **kwargs):
+    """
+    Creates a process pool whose workers share the parent's resource tracker, so
+    segments they attach to are not reported as leaked (or unlinked) when a
+    worker exits.
+    """
+    if os.name == 'posix':
+        resource_tracker.ensure_running()
+    return ProcessPoolExecutor(max_workers=max_workers, **kwargs)
+
+
+def _init_worker(tesseract_cmd):
+    # Workers started with 'spawn' do not inherit the path set by the scrapers
+    pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+
+
+def _ocr_shared_region(descriptor, box, config, lang):
+    """
+    Worker side: attaches to the shared page, OCRs one region of it and detaches.
+    Returns (ocr_result, ocr_seconds).
+    """
+    shm = shared_memory.SharedMemory(name=descriptor['name'])
+    try:
+        page = np.ndarray(descriptor['shape'], dtype=np.dtype(descriptor['dtype']), buffer=shm.buf)
+        x, y, w, h = box
+        region = page[y:y + h, x:x + w]
+        start = time.perf_counter()
+        result = ocr_with_confidence(region, config=config, lang=lang)
+        elapsed = time.perf_counter() - start
+        del page, region
+        return result, elapsed
+    finally:
+        shm.close()
+
+
+def get_ocr_pool():
+    """
+    Returns the shared OCR process pool, or None when OCR_PROCESS_WORKERS is 0.
+    """
+    global _pool
+    if OCR_PROCESS_WORKERS <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = start_process_pool(
+                OCR_PROCESS_WORKERS,
+                initializer=_init_worker,
+                initargs=(pytesseract.pytesseract.tesseract_cmd,),
+            )
+            logger.info(f"Started OCR process pool with {OCR_PROCESS_WORKERS} workers.")
+        return _pool
+
+
+def shutdown_ocr_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True)
+            _pool = None
+
+
+atexit.register(shutdown_ocr_pool)
+
+
+def ocr_regions(gray, boxes, config, lang='swe'):
+    """
+    OCRs the (x, y, w, h) regions of a grayscale page and returns one OCR result per
+    box (None where OCR failed). With a process pool, the page is placed in shared
+    memory once and workers receive only its descriptor and their box; the
+    IPC overhead per page is logged.
+    """
+    if not boxes:
+        return []
+
+    pool = get_ocr_pool()
+    if pool is None:
+        results = []
+        for (x, y, w, h) in boxes:
+            try:
+                results.append(ocr_with_confidence(gray[y:y + h, x:x + w], config=config, lang=lang))
+            except Exception as e:
+                logger.error(f"Failed to extract text from region: {e}")
+                results.append(None)
+        return results
+
+    start = time.perf_counter()
+    with SharedPageBuffer(gray) as page:
+        setup_seconds = time.perf_counter() - start
+        futures = [pool.submit(_ocr_shared_region, page.descriptor, box, config, lang) for box in boxes]
+
+        results = []
+        ocr_seconds = 0.0
+        for future in futures:
+            try:
+                result, elapsed = future.result()
+                ocr_seconds += elapsed
+                results.append(result)
+            except Exception as e:
+                logger.error(f"Failed to extract text from region in worker: {e}")
+                results.append(None)
+
+    wall_seconds = time.perf_counter() - start
+    # Time not spent inside Tesseract, spread over the workers
+    overhead = max(0.0, wall_seconds - ocr_seconds / min(len(boxes), OCR_PROCESS_WORKERS))
+    logger.info(
+        f"OCR'd {len(boxes)} regions in worker processes: {wall_seconds:.3f}s wall, "
+        f"{ocr_seconds:.3f}s OCR, shared memory setup {setup_seconds * 1000:.1f} ms, "
+        f"IPC overhead ~{overhead * 1000:.1f} ms per page."
+    )
+    return results
+
+
+def _pickled_region_task(region):
+    return float(region.mean())
+
+
+def _shared_region_task(descriptor, box):
+    shm = shared_memory.SharedMemory(name=descriptor['name'])
+    try:
+        page = np.ndarray(descriptor['shape'], dtype=np.dtype(descriptor['dtype']), buffer=shm.buf)
+        x, y, w, h = box
+        value = float(page[y:y + h, x:x + w].mean())
+        del page
+        return value
+    finally:
+        shm.close()
+
+
+def benchmark_page_transfer(gray, boxes, workers=4, repeats=5):
+    """
+    Measures the IPC cost per page of sending regions to worker processes by
+    pickling the pixels versus sending shared-memory descriptors. The worker task
+    is trivial, so the timings are dominated by transfer overhead.
+    """
+    timings = {}
+    with start_process_pool(workers) as pool:
+        # Warm up the workers so process start-up is not measured
+        list(pool.map(_pickled_region_task, [gray[:1, :1]] * workers))
+
+        start = time.perf_counter()
+        for _ in range(repeats):
+            regions = [gray[y:y + h, x:x + w] for (x, y, w, h) in boxes]
+            list(pool.map(_pickled_region_task, regions))
+        timings['pickled_regions_ms'] = (time.perf_counter() - start) * 1000.0 / repeats
+
+        start = time.perf_counter()
+        for _ in range(repeats):
+            list(pool.map(_pickled_region_task, [gray] * len(boxes)))
+        timings['pickled_page_ms'] = (time.perf_counter() - start) * 1000.0 / repeats
+
+        start = time.perf_counter()
+        for _ in range(repeats):
+            with SharedPageBuffer(gray) as page:
+                descriptor = page.descriptor
+                list(pool.map(_shared_region_task, [descriptor] * len(boxes), boxes))
+        timings['shared_memory_ms'] = (time.perf_counter() - start) * 1000.0 / repeats
+
+    logger.info(f"Page transfer benchmark ({len(boxes)} regions, {gray.nbytes} byte page): {timings}")
+    return timings
+
+
+if __name__ == "__main__":
+    # Usage: python -m scrapers.shared_pages page.png
+    import sys
+
+    from PIL import Image
+
+    from .layout import analyze_page_layout
+
+    logging.basicConfig(level=logging.INFO)
+    page_image = Image.open(sys.argv[1])
+    page_boxes = analyze_page_layout(page_image)['boxes'] or [(0, 0, page_image.width, page_image.height)]
+    benchmark_page_transfer(np.asarray(page_image.convert('L')), page_boxes)
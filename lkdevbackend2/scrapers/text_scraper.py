@@ -1,24 +1,44 @@
-import requests
-from bs4 import BeautifulSoup
+import logging
+import os
 import re
-import time
-
-def scrape_text(url):
-    try:
-        response = requests.get(url, verify=False)
-        time.sleep(2)  # Add a delay before processing
-        response.raise_for_status()
-    except requests.exceptions.RequestException as e:
-        print(f"Failed to fetch {url}: {e}")
-        return None
-
-    soup = BeautifulSoup(response.text, 'html.parser')
-    # Extract all text from the page
-    page_text = soup.get_text(separator=' ')
-    
-    # Remove all newlines and tabs
-    cleaned_text = ' '.join(page_text.split())
-    
+
+from .page_document import get_page_document
+from .recipes import apply_recipe, make_recipe
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# 'main' keeps only the block that looks like the menu, 'full' keeps the whole page
+TEXT_EXTRACTION_MODE = os.getenv('TEXT_EXTRACTION_MODE', 'main')
+
+def scrape_text(url, mode=TEXT_EXTRACTION_MODE):
+    menu_text, _ = scrape_text_with_recipe(url, mode=mode)
+    return menu_text
+
+def scrape_text_with_recipe(url, recipe=None, mode=TEXT_EXTRACTION_MODE):
+    """
+    Scrapes the menu text of a page. A stored recipe sends the extraction straight
+    to the menu node; when there is none or it no longer holds a menu, the menu block
+    is rediscovered and a new recipe is learned from it.
+    Returns (menu_text, recipe).
+    """
+    # Fetched once per run and shared with the other scrapers; the download is
+    # size-capped and aborted early if the link is not an HTML page
+    document = get_page_document(url, verify=False)
+    if not document:
+        logger.error(f"Failed to fetch {url}")
+        return None, recipe
+
+    # Text of the menu block (or the whole page), with newlines and tabs removed
+    cleaned_text = apply_recipe(document.soup, recipe, 'text')
+    if cleaned_text is None:
+        if mode == 'main':
+            cleaned_text = document.main_text
+            element = document.main_element
+            recipe = make_recipe(element, 'text') if element is not None else None
+        else:
+            cleaned_text = document.text
+
     # Define day names in Swedish and English
     day_names = [
         "Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday",
@@ -31,4 +51,4 @@ def scrape_text(url):
     # Insert a newline before each day name match
     cleaned_text = re.sub(day_pattern, r"\n for the day : \1", cleaned_text)
 
-    return cleaned_text
+    return cleaned_text, recipe
@@ -0,0 +1,225 @@
+import datetime
+import logging
+import re
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Lines at the top of a document searched for its week marker
+HEADING_LINES = 5
+
+
+class KnownWeek:
+    """
+    Returned by a scraper instead of None when the only sources it found are for
+    a past or already stored week, so "nothing new" can be told apart from
+    "nothing found". It is falsy, so callers that only check for text treat it
+    like None.
+    """
+
+    def __bool__(self):
+        return False
+
+    def __repr__(self):
+        return 'KNOWN_WEEK'
+
+
+KNOWN_WEEK = KnownWeek()
+
+
+def extract_week_number(text):
+    """
+    Extracts the week number from the given text.
+
+    Possible patterns:
+    - Vecka x
+    - Week x
+    - V x
+    - V. x
+    - W x
+    """
+    week_patterns = [
+        r'vecka\s*\d{1,2}',    # Matches 'Vecka 46' or 'Vecka46'
+        r'week\s*\d{1,2}',     # Matches 'Week 46' or 'Week46'
+        r'\bv\.?\s*\d{1,2}\b', # Matches 'V46', 'V 46', 'V.46', 'V. 46'
+        r'\bw\.?\s*\d{1,2}\b', # Matches 'W46', 'W 46', 'W.46', 'W. 46'
+    ]
+
+    for pattern in week_patterns:
+        match = re.search(pattern, text, re.IGNORECASE)
+        if match:
+            week_str = match.group()
+            # Clean up the string (e.g., remove extra spaces)
+            week_str = re.sub(r'\s+', ' ', week_str.strip())
+            return week_str.capitalize()
+    return None
+
+
+def extract_week_number_from_url(url):
+    """
+    Extracts the week number from the URL or filename.
+    """
+    filename = url.split('/')[-1].lower()
+
+    # Define patterns that match 'vecka' or 'v' at the start or after a separator
+    week_patterns = [
+        r'(?:^|[\-_\.])vecka[\s\-\.]*\d{1,2}',  # Matches 'vecka46', 'vecka-46', '_vecka_46', etc.
+        r'(?:^|[\-_\.])v[\s\-\.]*\d{1,2}',      # Matches 'v46', 'v-46', '_v_46', etc.
+        r'(?:^|[\-_\.])w[\s\-\.]*\d{1,2}',      # Matches 'w46', 'w-46', '_w_46', etc.
+    ]
+
+    for pattern in week_patterns:
+        match = re.search(pattern, filename, re.IGNORECASE)
+        if match:
+            week_str = match.group()
+            # Clean up the string (e.g., remove separators and extra spaces)
+            week_str = re.sub(r'[\-_\.]', ' ', week_str)
+            week_str = re.sub(r'\s+', ' ', week_str.strip())
+            return week_str.capitalize()
+    return None
+
+
+def parse_week_number(week_str):
+    """
+    Returns the number from a week marker such as 'Vecka 46' or 'V 46', or None.
+    """
+    if not week_str:
+        return None
+    match = re.search(r'(\d{1,2})', week_str)
+    if not match:
+        return None
+    week = int(match.group(1))
+    return week if 1 <= week <= 53 else None
+
+
+def weeks_in_iso_year(year):
+    """
+    Number of ISO weeks in a year (52 or 53); 28 December is always in the last one.
+    """
+    return datetime.date(year, 12, 28).isocalendar()[1]
+
+
+def current_iso_week(today=None):
+    """
+    Returns the (iso_year, iso_week) of today.
+    """
+    today = today or datetime.date.today()
+    iso = today.isocalendar()
+    return iso[0], iso[1]
+
+
+def resolve_iso_week(week, today=None):
+    """
+    Resolves a bare week number to the (iso_year, iso_week) closest to today, so
+    week 1 seen in late December belongs to the next year and week 52 or 53 seen
+    in early January to the previous one. Years without a week 53 are skipped.
+    """
+    if week is None:
+        return None
+    today = today or datetime.date.today()
+    current_year = current_iso_week(today)[0]
+    candidates = [
+        (abs((datetime.date.fromisocalendar(year, week, 1) - today).days), year)
+        for year in (current_year - 1, current_year, current_year + 1)
+        if week <= weeks_in_iso_year(year)
+    ]
+    if not candidates:
+        return None
+    return min(candidates)[1], week
+
+
+def week_distance(week, today=None):
+    """
+    Signed distance in weeks from the current ISO week to week, across the new
+    year (53-week years included).
+    """
+    resolved = resolve_iso_week(week, today)
+    if resolved is None:
+        return None
+    current = current_iso_week(today)
+    monday = datetime.date.fromisocalendar(*resolved, 1)
+    current_monday = datetime.date.fromisocalendar(*current, 1)
+    return (monday - current_monday).days // 7
+
+
+def to_date(value):
+    """
+    Converts a stored validFrom/validTo value ({'$date': iso string}, an ISO string
+    or a datetime) to a date, or None.
+    """
+    if isinstance(value, dict):
+        value = value.get('$date')
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    if isinstance(value, str):
+        try:
+            return datetime.datetime.fromisoformat(value.replace('Z', '+00:00')).date()
+        except ValueError:
+            return None
+    return None
+
+
+def stored_menu_weeks(lunch_menus):
+    """
+    Returns the set of (iso_year, iso_week) covered by the validFrom/validTo ranges of
+    the menus already stored for a restaurant.
+    """
+    weeks = set()
+    for item in lunch_menus or []:
+        valid_from = to_date(item.get('validFrom'))
+        valid_to = to_date(item.get('validTo')) or valid_from
+        if not valid_from:
+            continue
+        day = valid_from
+        while day <= valid_to:
+            iso = day.isocalendar()
+            weeks.add((iso[0], iso[1]))
+            day += datetime.timedelta(days=7)
+        iso = valid_to.isocalendar()
+        weeks.add((iso[0], iso[1]))
+    return weeks
+
+
+def classify_week(week, known_weeks=None, today=None):
+    """
+    Classifies a detected week number against the current ISO week and the weeks
+    already stored. Returns:
+        - 'unknown' when no week was detected,
+        - 'stale' when the week is in the past,
+        - 'ingested' when the week is already stored,
+        - 'current' otherwise (this week or a future one).
+    """
+    resolved = resolve_iso_week(week, today)
+    if resolved is None:
+        return 'unknown'
+    if resolved < current_iso_week(today):
+        return 'stale'
+    if known_weeks and resolved in known_weeks:
+        return 'ingested'
+    return 'current'
+
+
+def heading_text(text, lines=HEADING_LINES):
+    """
+    The first non-empty lines of a document's text, where a week marker names the
+    week of the whole menu (further down, 'v 12' may be anything).
+    """
+    return "\n".join([line for line in (text or '').splitlines() if line.strip()][:lines])
+
+
+def classify_source_week(url='', text='', known_weeks=None, today=None):
+    """
+    Classifies a source by the week marker in its URL/filename, falling back to
+    its link text or the heading of its text. Only text that is not OCR output
+    should be passed, since OCR misreads make week numbers up. See classify_week
+    for the results.
+    """
+    week = parse_week_number(extract_week_number_from_url(url)) if url else None
+    if week is None and text:
+        week = parse_week_number(extract_week_number(text))
+    status = classify_week(week, known_weeks, today)
+    if status in ('stale', 'ingested'):
+        logger.info(f"Source {url or 'text'} is for week {week}: {status}.")
+    return status
@@ -1,6 +1,7 @@
 import os
+import datetime
 from dotenv import load_dotenv
-from pymongo import MongoClient
+from pymongo import MongoClient, ReturnDocument, ASCENDING, DESCENDING
 from bson.objectid import ObjectId
 import logging
 
@@ -22,6 +23,12 @@ if not MONGO_URI:
 DATABASE_NAME = os.getenv('DATABASE_NAME', 'test')  # Default to 'test' if not set
 COLLECTION_NAME = os.getenv('COLLECTION_NAME', 'restaurant')  # Default to 'restaurant' if not set
 
+# Claims order restaurants by the window of this many minutes they became due in,
+# and only then longest first, so a cheap restaurant waits at most for the
+# expensive ones that became due in the same window
+DUE_BUCKET_MINUTES = int(os.getenv('DUE_BUCKET_MINUTES', '15'))
+LONGEST_FIRST_CLAIM_SORT = [('dueBucket', ASCENDING), ('costEstimate.seconds', DESCENDING)]
+
 # Initialize MongoDB client
 try:
     client = MongoClient(MONGO_URI)
@@ -50,4 +57,230 @@ def update_restaurant_menus(restaurant_id, lunch_menus):
         logger.error(f"Failed to update restaurant {restaurant_id}: {e}")
         return 0
 
+def update_restaurant_recipe(restaurant_id, recipe):
+    """
+    Stores the extraction recipe (menu selector and strategy) learned for a restaurant.
+    """
+    try:
+        if not isinstance(restaurant_id, ObjectId):
+            restaurant_id = ObjectId(restaurant_id)
+        result = restaurants_collection.update_one(
+            {'_id': restaurant_id},
+            {'$set': {'extraction_recipe': recipe}}
+        )
+        if result.modified_count > 0:
+            logger.info(f"Stored extraction recipe for restaurant {restaurant_id}: {recipe.get('selector')}")
+        return result.modified_count
+    except Exception as e:
+        logger.error(f"Failed to store extraction recipe for restaurant {restaurant_id}: {e}")
+        return 0
+
+def update_restaurant_endpoint(restaurant_id, endpoint):
+    """
+    Stores the backing API endpoint discovered for a restaurant's menu, or clears it
+    when endpoint is None.
+    """
+    try:
+        if not isinstance(restaurant_id, ObjectId):
+            restaurant_id = ObjectId(restaurant_id)
+        result = restaurants_collection.update_one(
+            {'_id': restaurant_id},
+            {'$set': {'menu_endpoint': endpoint}}
+        )
+        if result.modified_count > 0:
+            logger.info(f"Stored menu endpoint for restaurant {restaurant_id}: {endpoint.get('url') if endpoint else None}")
+        return result.modified_count
+    except Exception as e:
+        logger.error(f"Failed to store menu endpoint for restaurant {restaurant_id}: {e}")
+        return 0
+
+def update_restaurant_facebook_since(restaurant_id, timestamp):
+    """
+    Stores the Unix timestamp of the newest Facebook post seen for a restaurant, so
+    the next run only asks for newer posts.
+    """
+    try:
+        if not isinstance(restaurant_id, ObjectId):
+            restaurant_id = ObjectId(restaurant_id)
+        result = restaurants_collection.update_one(
+            {'_id': restaurant_id},
+            {'$set': {'facebook_since': timestamp}}
+        )
+        return result.modified_count
+    except Exception as e:
+        logger.error(f"Failed to store Facebook timestamp for restaurant {restaurant_id}: {e}")
+        return 0
+
+def update_restaurant_strategy_memo(restaurant_id, memo):
+    """
+    Stores which scraping strategy (and PDF solution or preprocessing) worked for a
+    restaurant, with its latency and cost, so the next run tries it first.
+    """
+    try:
+        if not isinstance(restaurant_id, ObjectId):
+            restaurant_id = ObjectId(restaurant_id)
+        result = restaurants_collection.update_one(
+            {'_id': restaurant_id},
+            {'$set': {'strategy_memo': memo}}
+        )
+        return result.modified_count
+    except Exception as e:
+        logger.error(f"Failed to store strategy memo for restaurant {restaurant_id}: {e}")
+        return 0
+
+def due_bucket(next_due_at):
+    """
+    The start of the DUE_BUCKET_MINUTES window next_due_at falls in, or None.
+    """
+    if next_due_at is None:
+        return None
+    if next_due_at.tzinfo is None:
+        # MongoDB returns naive UTC datetimes
+        next_due_at = next_due_at.replace(tzinfo=datetime.timezone.utc)
+    width = DUE_BUCKET_MINUTES * 60
+    timestamp = next_due_at.timestamp()
+    return datetime.datetime.fromtimestamp(timestamp - timestamp % width, datetime.timezone.utc)
+
+def update_restaurant_schedule(restaurant_id, next_due_at, last_run_at=None, last_outcome=None):
+    """
+    Stores when a restaurant is due to be scraped next (None for never) and the
+    time and outcome of the run that just finished.
+    """
+    try:
+        if not isinstance(restaurant_id, ObjectId):
+            restaurant_id = ObjectId(restaurant_id)
+        fields = {'nextDueAt': next_due_at, 'dueBucket': due_bucket(next_due_at)}
+        if last_run_at is not None:
+            fields['lastRunAt'] = last_run_at
+            fields['lastRunOutcome'] = last_outcome
+        result = restaurants_collection.update_one({'_id': restaurant_id}, {'$set': fields})
+        return result.modified_count
+    except Exception as e:
+        logger.error(f"Failed to store schedule for restaurant {restaurant_id}: {e}")
+        return 0
+
+def update_restaurant_content_hash(restaurant_id, content_hash, changed_at=None, max_events=20):
+    """
+    Stores the hash of the latest scraped menu content. With changed_at, a change
+    event is also appended to changeEvents (keeping the last max_events).
+    """
+    try:
+        if not isinstance(restaurant_id, ObjectId):
+            restaurant_id = ObjectId(restaurant_id)
+        update = {'$set': {'contentHash': content_hash}}
+        if changed_at is not None:
+            update['$push'] = {
+                'changeEvents': {'$each': [{'at': changed_at, 'hash': content_hash}], '$slice': -max_events}
+            }
+        result = restaurants_collection.update_one({'_id': restaurant_id}, update)
+        return result.modified_count
+    except Exception as e:
+        logger.error(f"Failed to store content hash for restaurant {restaurant_id}: {e}")
+        return 0
+
+def update_restaurant_cost_estimate(restaurant_id, estimate):
+    """
+    Stores the moving average of how long a restaurant takes to process, in total
+    and per stage, used to order and assign batch work.
+    """
+    try:
+        if not isinstance(restaurant_id, ObjectId):
+            restaurant_id = ObjectId(restaurant_id)
+        result = restaurants_collection.update_one(
+            {'_id': restaurant_id},
+            {'$set': {'costEstimate': estimate}}
+        )
+        return result.modified_count
+    except Exception as e:
+        logger.error(f"Failed to store cost estimate for restaurant {restaurant_id}: {e}")
+        return 0
+
+def due_restaurants_filter(now):
+    """
+    Query matching restaurants that are due (nextDueAt passed or never set) and not
+    leased by a live worker.
+    """
+    return {
+        'menuPeriodicity': {'$ne': 'Never'},
+        '$and': [
+            {'$or': [{'nextDueAt': {'$lte': now}}, {'nextDueAt': None}]},
+            {'$or': [{'leaseExpiresAt': {'$lte': now}}, {'leaseExpiresAt': None}]},
+        ],
+    }
+
+def ensure_claim_indexes():
+    """
+    Creates the indexes used to find and claim due restaurants, earliest due or
+    longest first.
+    """
+    try:
+        restaurants_collection.create_index([('nextDueAt', ASCENDING), ('leaseExpiresAt', ASCENDING)])
+        restaurants_collection.create_index(
+            LONGEST_FIRST_CLAIM_SORT + [('nextDueAt', ASCENDING), ('leaseExpiresAt', ASCENDING)]
+        )
+    except Exception as e:
+        logger.error(f"Failed to create claim index: {e}")
+
+def claim_due_restaurant(worker_id, lease_seconds, sort=None, restaurant_id=None):
+    """
+    Atomically claims a due restaurant for worker_id with a lease of lease_seconds,
+    the earliest due unless another sort is given, or the given restaurant if it
+    is still due and unclaimed. Returns the claimed restaurant, or None if nothing
+    is due.
+    """
+    now = datetime.datetime.now(datetime.timezone.utc)
+    query = due_restaurants_filter(now)
+    if restaurant_id is not None:
+        query['_id'] = restaurant_id
+    try:
+        return restaurants_collection.find_one_and_update(
+            query,
+            {'$set': {
+                'leaseOwner': worker_id,
+                'leaseExpiresAt': now + datetime.timedelta(seconds=lease_seconds),
+            }},
+            sort=sort or [('nextDueAt', ASCENDING)],
+            return_document=ReturnDocument.AFTER,
+        )
+    except Exception as e:
+        logger.error(f"Failed to claim a restaurant for worker {worker_id}: {e}")
+        return None
+
+def renew_restaurant_lease(restaurant_id, worker_id, lease_seconds):
+    """
+    Extends the lease of a restaurant held by worker_id. Returns 0 when the lease
+    has been lost (expired and claimed by another worker).
+    """
+    try:
+        result = restaurants_collection.update_one(
+            {'_id': restaurant_id, 'leaseOwner': worker_id},
+            {'$set': {
+                'leaseExpiresAt': datetime.datetime.now(datetime.timezone.utc)
+                + datetime.timedelta(seconds=lease_seconds)
+            }}
+        )
+        return result.matched_count
+    except Exception as e:
+        logger.error(f"Failed to renew lease on restaurant {restaurant_id}: {e}")
+        return 0
+
+def release_restaurant(restaurant_id, worker_id, next_due_at, last_run_at, last_outcome):
+    """
+    Releases the lease of worker_id on a restaurant and stores when it is due next
+    with the time and outcome of the run. Does nothing if the lease was lost.
+    """
+    try:
+        result = restaurants_collection.update_one(
+            {'_id': restaurant_id, 'leaseOwner': worker_id},
+            {
+                '$set': {'nextDueAt': next_due_at, 'dueBucket': due_bucket(next_due_at),
+                         'lastRunAt': last_run_at, 'lastRunOutcome': last_outcome},
+                '$unset': {'leaseOwner': '', 'leaseExpiresAt': ''},
+            }
+        )
+        return result.modified_count
+    except Exception as e:
+        logger.error(f"Failed to release restaurant {restaurant_id}: {e}")
+        return 0
+
 # You can add additional database functions here, such as fetching restaurants, etc.
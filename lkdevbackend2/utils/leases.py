@@ -0,0 +1,48 @@
+import logging
+import os
+import socket
+import threading
+import uuid
+from contextlib import contextmanager
+
+from utils.database import renew_restaurant_lease
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# A claim expires this long after the last heartbeat, so a crashed worker's
+# restaurants are picked up by the others (seconds)
+WORKER_LEASE_SECONDS = int(os.getenv('WORKER_LEASE_SECONDS', '300'))
+WORKER_HEARTBEAT_SECONDS = int(os.getenv('WORKER_HEARTBEAT_SECONDS', '60'))
+
+
+def make_worker_id(role='worker'):
+    return f"{socket.gethostname()}-{os.getpid()}-{role}-{uuid.uuid4().hex[:6]}"
+
+
+@contextmanager
+def heartbeat(restaurant_ids, worker_id):
+    """
+    Renews the leases on the restaurants every WORKER_HEARTBEAT_SECONDS while the
+    block runs. Yields the set of restaurant _ids whose lease was lost; those are
+    no longer renewed.
+    """
+    stop = threading.Event()
+    lost = set()
+
+    def renew():
+        while not stop.wait(WORKER_HEARTBEAT_SECONDS):
+            for restaurant_id in restaurant_ids:
+                if restaurant_id in lost:
+                    continue
+                if not renew_restaurant_lease(restaurant_id, worker_id, WORKER_LEASE_SECONDS):
+                    logger.warning(f"Worker {worker_id} lost its lease on restaurant {restaurant_id}.")
+                    lost.add(restaurant_id)
+
+    thread = threading.Thread(target=renew, name=f"heartbeat-{worker_id}", daemon=True)
+    thread.start()
+    try:
+        yield lost
+    finally:
+        stop.set()
+        thread.join()
@@ -0,0 +1,129 @@
+import datetime
+import logging
+import os
+import uuid
+
+from pymongo import ASCENDING, DESCENDING
+
+from utils.database import db
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+RUN_LEDGER_COLLECTION = os.getenv('RUN_LEDGER_COLLECTION', 'run_ledger')
+# Unfinished runs younger than this are resumed instead of starting a new one (hours)
+RUN_RESUME_MAX_AGE_HOURS = int(os.getenv('RUN_RESUME_MAX_AGE_HOURS', '12'))
+# Ledger entries are removed by MongoDB this long after their last update (days)
+RUN_LEDGER_TTL_DAYS = int(os.getenv('RUN_LEDGER_TTL_DAYS', '14'))
+
+ledger_collection = db[RUN_LEDGER_COLLECTION]
+
+# Stages checkpointed per restaurant, in order, with the output each one stores
+STAGES = ('scraped', 'processed')
+
+
+def utcnow():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+def ensure_ledger_indexes():
+    try:
+        ledger_collection.create_index([('run_id', ASCENDING), ('restaurant_id', ASCENDING)], unique=True)
+        ledger_collection.create_index('updated_at', expireAfterSeconds=RUN_LEDGER_TTL_DAYS * 24 * 3600)
+    except Exception as e:
+        logger.error(f"Failed to create run ledger index: {e}")
+
+
+def start_run(run_id=None):
+    """
+    Returns the id of the run to execute: run_id if given, else the latest
+    unfinished run started within RUN_RESUME_MAX_AGE_HOURS (resumed), else a new one.
+    """
+    ensure_ledger_indexes()
+    if run_id is None:
+        unfinished = ledger_collection.find_one(
+            {'restaurant_id': None, 'state': 'in_progress',
+             'started_at': {'$gte': utcnow() - datetime.timedelta(hours=RUN_RESUME_MAX_AGE_HOURS)}},
+            sort=[('started_at', DESCENDING)],
+        )
+        if unfinished:
+            logger.info(f"Resuming unfinished run {unfinished['run_id']}.")
+            return unfinished['run_id']
+        run_id = f"{utcnow():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:6]}"
+
+    ledger_collection.update_one(
+        {'run_id': run_id, 'restaurant_id': None},
+        {'$setOnInsert': {'state': 'in_progress', 'started_at': utcnow()}, '$set': {'updated_at': utcnow()}},
+        upsert=True,
+    )
+    logger.info(f"Started run {run_id}.")
+    return run_id
+
+
+def finish_run(run_id, outcomes, report=None):
+    """
+    Records the end of a pass over a run, with a count of the restaurants per
+    outcome and the batch report (predicted and actual makespan), if any. The run
+    is marked completed only when no restaurant failed; otherwise it stays in
+    progress, so the next start_run resumes it and retries the failed ones.
+    """
+    counts = {}
+    for outcome in outcomes.values():
+        counts[outcome] = counts.get(outcome, 0) + 1
+    state = 'in_progress' if counts.get('failed') else 'completed'
+    if state == 'in_progress':
+        logger.warning(f"Run {run_id} left unfinished: {counts['failed']} restaurants failed.")
+    ledger_collection.update_one(
+        {'run_id': run_id, 'restaurant_id': None},
+        {'$set': {'state': state, 'finished_at': utcnow(), 'updated_at': utcnow(), 'outcomes': counts,
+                  'batch_report': report}},
+    )
+
+
+def run_progress(run_id):
+    """
+    Returns the ledger entries of a run as a dict of restaurant _id to entry.
+    """
+    return {
+        entry['restaurant_id']: entry
+        for entry in ledger_collection.find({'run_id': run_id, 'restaurant_id': {'$ne': None}})
+    }
+
+
+def save_stage(run_id, restaurant_id, stage, output, extra_outputs=None):
+    """
+    Checkpoints the output of a finished stage, so a restarted run can resume the
+    restaurant after it. extra_outputs maps names to anything else the stage
+    produced (read back with stage_output, like the stage's own output).
+    """
+    outputs = {f"outputs.{name}": value for name, value in (extra_outputs or {}).items()}
+    outputs[f"outputs.{stage}"] = output
+    try:
+        ledger_collection.update_one(
+            {'run_id': run_id, 'restaurant_id': restaurant_id},
+            {'$set': {'state': 'in_progress', 'stage': stage, **outputs, 'updated_at': utcnow()}},
+            upsert=True,
+        )
+    except Exception as e:
+        logger.error(f"Failed to checkpoint stage '{stage}' of restaurant {restaurant_id} in run {run_id}: {e}")
+
+
+def complete_restaurant(run_id, restaurant_id, outcome):
+    """
+    Records that a restaurant is done for this run; a restarted run skips it.
+    """
+    try:
+        ledger_collection.update_one(
+            {'run_id': run_id, 'restaurant_id': restaurant_id},
+            {'$set': {'state': 'completed', 'outcome': outcome, 'updated_at': utcnow()}},
+            upsert=True,
+        )
+    except Exception as e:
+        logger.error(f"Failed to complete restaurant {restaurant_id} in run {run_id}: {e}")
+
+
+def stage_output(entry, stage):
+    """
+    The checkpointed output of a stage in a ledger entry, or None.
+    """
+    return ((entry or {}).get('outputs') or {}).get(stage)
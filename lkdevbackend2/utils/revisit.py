@@ -0,0 +1,150 @@
+import datetime
+import hashlib
+import logging
+import os
+import random
+import statistics
+from zoneinfo import ZoneInfo
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+REVISIT_TIMEZONE = ZoneInfo(os.getenv('SCHEDULE_TIMEZONE', 'Europe/Stockholm'))
+# Change events kept per restaurant, and needed before the policy is trusted
+REVISIT_HISTORY_EVENTS = int(os.getenv('REVISIT_HISTORY_EVENTS', '20'))
+REVISIT_MIN_EVENTS = int(os.getenv('REVISIT_MIN_EVENTS', '3'))
+# Dense polling starts this long before the expected publication time (minutes)...
+REVISIT_LEAD_MINUTES = int(os.getenv('REVISIT_LEAD_MINUTES', '60'))
+# ...polls every REVISIT_DENSE_MINUTES for REVISIT_DENSE_HOURS, then every REVISIT_SPARSE_HOURS
+REVISIT_DENSE_MINUTES = int(os.getenv('REVISIT_DENSE_MINUTES', '30'))
+REVISIT_DENSE_HOURS = int(os.getenv('REVISIT_DENSE_HOURS', '6'))
+REVISIT_SPARSE_HOURS = int(os.getenv('REVISIT_SPARSE_HOURS', '4'))
+# Share of backed-off polls moved to a random earlier time, to notice drift
+REVISIT_EXPLORATION = float(os.getenv('REVISIT_EXPLORATION', '0.05'))
+
+# Length of one publication cycle per menuPeriodicity
+CYCLE_LENGTHS = {
+    'daily': datetime.timedelta(days=1),
+    'weekly': datetime.timedelta(days=7),
+}
+
+
+def menu_content_hash(text):
+    """
+    Hash of a scraped menu text with whitespace and case normalized, so only real
+    content changes produce a new hash.
+    """
+    normalized = ' '.join((text or '').split()).lower()
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+
+def cycle_anchor(moment, periodicity):
+    """
+    Start (local midnight, or Monday midnight for weekly menus) of the calendar
+    period containing moment.
+    """
+    local = moment.astimezone(REVISIT_TIMEZONE)
+    day = local.date()
+    if periodicity == 'weekly':
+        day -= datetime.timedelta(days=day.weekday())
+    return datetime.datetime.combine(day, datetime.time(0), tzinfo=REVISIT_TIMEZONE)
+
+
+def event_time(event):
+    at = event['at'] if isinstance(event, dict) else event
+    # MongoDB returns naive UTC datetimes
+    return at.replace(tzinfo=datetime.timezone.utc) if at.tzinfo is None else at
+
+
+def expected_publication_offset(events, periodicity):
+    """
+    The typical time within the cycle at which the menu changes, as an offset
+    from the period start (e.g. Sunday 19:00 is 6 days 19 hours for weekly menus),
+    or None without enough history. Offsets are averaged around the cycle, so
+    Sunday night and Monday morning changes do not average to Thursday.
+    """
+    length = CYCLE_LENGTHS.get(periodicity)
+    if length is None or len(events) < REVISIT_MIN_EVENTS:
+        return None
+    period = length.total_seconds()
+    offsets = [
+        (event_time(event) - cycle_anchor(event_time(event), periodicity)).total_seconds()
+        for event in events[-REVISIT_HISTORY_EVENTS:]
+    ]
+    reference = offsets[-1]
+    # Unwrap each offset to within half a cycle of the latest one
+    unwrapped = [reference + (offset - reference + period / 2) % period - period / 2 for offset in offsets]
+    return datetime.timedelta(seconds=statistics.median(unwrapped) % period)
+
+
+def adaptive_next_poll(restaurant, now, rng=random):
+    """
+    Derives the next poll time from the restaurant's change history: densely
+    around the expected publication time until this cycle's menu has been
+    captured, then backed off to the next cycle's window (with a small chance of
+    an earlier exploratory poll). Returns None when the history is too short or
+    the periodicity is not daily or weekly; the periodicity schedule applies then.
+    """
+    periodicity = (restaurant.get('menuPeriodicity') or '').strip().lower()
+    events = restaurant.get('changeEvents') or []
+    offset = expected_publication_offset(events, periodicity)
+    if offset is None:
+        return None
+    length = CYCLE_LENGTHS[periodicity]
+    lead = datetime.timedelta(minutes=REVISIT_LEAD_MINUTES)
+
+    # Start of the current cycle's polling window
+    window_start = cycle_anchor(now, periodicity) + offset - lead
+    while window_start > now:
+        window_start -= length
+    next_window = window_start + length
+
+    if event_time(events[-1]) >= window_start:
+        # This cycle's menu is captured: wait for the next window
+        if rng.random() < REVISIT_EXPLORATION:
+            return now + (next_window - now) * rng.random()
+        return next_window
+
+    dense_until = window_start + lead + datetime.timedelta(hours=REVISIT_DENSE_HOURS)
+    step = datetime.timedelta(minutes=REVISIT_DENSE_MINUTES) if now < dense_until \
+        else datetime.timedelta(hours=REVISIT_SPARSE_HOURS)
+    return min(now + step, next_window)
+
+
+def simulate_polling(publication_offset_hours=(6 * 24 + 19, 6 * 24 + 20, 6 * 24 + 18.5), weeks=52, seed=1):
+    """
+    Replays weekly menus published around the given offsets (hours after Monday
+    00:00) and compares hourly fixed polling with the adaptive policy. Returns
+    {'fixed'|'adaptive': {'polls', 'mean_staleness_minutes'}}.
+    """
+    rng = random.Random(seed)
+    start = datetime.datetime(2024, 1, 1, tzinfo=REVISIT_TIMEZONE)
+    publications = [
+        start + datetime.timedelta(weeks=week, hours=rng.choice(publication_offset_hours) + rng.uniform(-0.5, 0.5))
+        for week in range(weeks)
+    ]
+    end = publications[-1] + datetime.timedelta(days=1)
+
+    results = {}
+    for policy in ('fixed', 'adaptive'):
+        restaurant = {'menuPeriodicity': 'Weekly', 'changeEvents': []}
+        now = start
+        polls = 0
+        staleness = []
+        seen = 0
+        while now < end:
+            polls += 1
+            published = sum(1 for p in publications if p <= now)
+            if published > seen:
+                staleness.append((now - publications[published - 1]).total_seconds() / 60)
+                restaurant['changeEvents'].append({'at': now})
+                seen = published
+            next_poll = adaptive_next_poll(restaurant, now, rng) if policy == 'adaptive' else None
+            now = next_poll or now + datetime.timedelta(hours=1)
+        results[policy] = {'polls': polls, 'mean_staleness_minutes': round(statistics.mean(staleness), 1)}
+    return results
+
+
+if __name__ == "__main__":
+    for policy, result in simulate_polling().items():
+        print(f"{policy}: {result['polls']} polls, mean staleness {result['mean_staleness_minutes']} minutes")
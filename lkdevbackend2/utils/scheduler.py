@@ -1,12 +1,183 @@
+import datetime
+import hashlib
+import heapq
+import logging
+import os
+import random
+from zoneinfo import ZoneInfo
+
 from apscheduler.schedulers.blocking import BlockingScheduler
 from main import fetch_and_update_menus
+from utils.database import claim_due_restaurant, due_restaurants_filter, release_restaurant, restaurants_collection
+from utils.leases import WORKER_LEASE_SECONDS, heartbeat, make_worker_id
+from utils.revisit import adaptive_next_poll
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Local time of the restaurants; the scrape window is opened in this zone
+SCHEDULE_TIMEZONE = ZoneInfo(os.getenv('SCHEDULE_TIMEZONE', 'Europe/Stockholm'))
+# Scrape window: restaurants are spread over WINDOW_MINUTES from WINDOW_START_HOUR
+SCHEDULE_WINDOW_START_HOUR = int(os.getenv('SCHEDULE_WINDOW_START_HOUR', '9'))
+SCHEDULE_WINDOW_MINUTES = int(os.getenv('SCHEDULE_WINDOW_MINUTES', '120'))
+# Random offset (seconds) added to each due time, so slots do not line up exactly
+SCHEDULE_JITTER_SECONDS = int(os.getenv('SCHEDULE_JITTER_SECONDS', '120'))
+# How often the due queue is checked (minutes)
+SCHEDULE_TICK_MINUTES = int(os.getenv('SCHEDULE_TICK_MINUTES', '5'))
+# Most restaurants processed per tick; the rest stay due for the next tick
+SCHEDULE_MAX_PER_TICK = int(os.getenv('SCHEDULE_MAX_PER_TICK', '25'))
+# Delay before retrying a restaurant whose menu could not be scraped (minutes)
+SCHEDULE_RETRY_MINUTES = int(os.getenv('SCHEDULE_RETRY_MINUTES', '60'))
+# Weekday (0 = Monday) on which weekly menus are scraped
+SCHEDULE_WEEKLY_DAY = int(os.getenv('SCHEDULE_WEEKLY_DAY', '0'))
+
+# Outcomes after which the restaurant is retried soon instead of at its next period:
+# the scrape or processing went wrong. 'nothing_new' (only known weeks, no new
+# Facebook post) is the normal result between menus and waits for the next period
+RETRY_OUTCOMES = ('no_text', 'not_processed', 'failed')
+
+
+def window_offset(restaurant_id):
+    """
+    A stable offset (seconds) within the scrape window for a restaurant, so each
+    restaurant keeps its own slot and the window's load is spread evenly.
+    """
+    digest = hashlib.sha1(str(restaurant_id).encode('utf-8')).digest()
+    return int.from_bytes(digest[:4], 'big') % max(1, SCHEDULE_WINDOW_MINUTES * 60)
+
+
+def next_period_day(periodicity, today):
+    """
+    The next local date on which a restaurant with this menuPeriodicity is due,
+    or None for Never. Daily menus are due on the next weekday, weekly menus on
+    SCHEDULE_WEEKLY_DAY, monthly menus on the first weekday of the next month.
+    Unknown periodicities are treated as daily.
+    """
+    periodicity = (periodicity or 'Daily').strip().lower()
+    if periodicity == 'never':
+        return None
+    if periodicity == 'weekly':
+        days = (SCHEDULE_WEEKLY_DAY - today.weekday()) % 7 or 7
+        return today + datetime.timedelta(days=days)
+    if periodicity == 'monthly':
+        day = (today.replace(day=1) + datetime.timedelta(days=32)).replace(day=1)
+    else:
+        day = today + datetime.timedelta(days=1)
+    while day.weekday() >= 5:
+        day += datetime.timedelta(days=1)
+    return day
+
+
+def next_due_at(restaurant, now=None, outcome=None):
+    """
+    Computes when a restaurant is due next (a UTC datetime), or None if it never is.
+    A failed scrape is retried after SCHEDULE_RETRY_MINUTES; otherwise the
+    restaurant gets its slot in the scrape window of its next period day.
+    """
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    jitter = datetime.timedelta(seconds=random.uniform(0, SCHEDULE_JITTER_SECONDS))
+    if outcome in RETRY_OUTCOMES and (restaurant.get('menuPeriodicity') or '').lower() != 'never':
+        return now + datetime.timedelta(minutes=SCHEDULE_RETRY_MINUTES) + jitter
+
+    day = next_period_day(restaurant.get('menuPeriodicity'), now.astimezone(SCHEDULE_TIMEZONE).date())
+    if day is None:
+        return None
+    window_start = datetime.datetime.combine(
+        day, datetime.time(SCHEDULE_WINDOW_START_HOUR), tzinfo=SCHEDULE_TIMEZONE
+    )
+    slot = window_start + datetime.timedelta(seconds=window_offset(restaurant['_id']))
+    return slot.astimezone(datetime.timezone.utc) + jitter
+
+
+def next_check_at(restaurant, now=None, outcome=None):
+    """
+    When to scrape a restaurant next: from its learned publication pattern when
+    the change history allows it (see utils.revisit), else from its periodicity.
+    """
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    if outcome != 'failed':
+        due = adaptive_next_poll(restaurant, now)
+        if due is not None:
+            return due
+    return next_due_at(restaurant, now, outcome)
+
+
+def due_queue(restaurants, now=None):
+    """
+    Builds a priority queue (heap) of (nextDueAt, _id, restaurant) for the
+    restaurants that are due, earliest first. Restaurants never scheduled are due
+    from their slot in today's scrape window.
+    """
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    queue = []
+    for restaurant in restaurants:
+        due = restaurant.get('nextDueAt')
+        if due is None:
+            window_start = datetime.datetime.combine(
+                now.astimezone(SCHEDULE_TIMEZONE).date(), datetime.time(SCHEDULE_WINDOW_START_HOUR),
+                tzinfo=SCHEDULE_TIMEZONE,
+            )
+            due = window_start + datetime.timedelta(seconds=window_offset(restaurant['_id']))
+        elif due.tzinfo is None:
+            # MongoDB returns naive UTC datetimes
+            due = due.replace(tzinfo=datetime.timezone.utc)
+        if due <= now:
+            heapq.heappush(queue, (due, str(restaurant['_id']), restaurant))
+    return queue
+
+
+def run_due_restaurants(now=None):
+    """
+    Processes the restaurants that are due, earliest first and at most
+    SCHEDULE_MAX_PER_TICK of them, then stores when each is due next.
+    Each restaurant is claimed with a lease like the distributed workers
+    (utils.workers) do, so the scheduler and workers never process the same
+    restaurant; restaurants claimed by a worker in the meantime are left to it.
+    Returns the number of restaurants processed.
+    """
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    restaurants = restaurants_collection.find(due_restaurants_filter(now))
+    queue = due_queue(restaurants, now)
+    if not queue:
+        return 0
+
+    worker_id = make_worker_id('scheduler')
+    batch = []
+    while queue and len(batch) < SCHEDULE_MAX_PER_TICK:
+        restaurant = claim_due_restaurant(worker_id, WORKER_LEASE_SECONDS, restaurant_id=heapq.heappop(queue)[2]['_id'])
+        if restaurant is not None:
+            batch.append(restaurant)
+    if not batch:
+        return 0
+    logger.info(f"Processing {len(batch)} due restaurants ({len(queue)} left for the next tick).")
+
+    with heartbeat([restaurant['_id'] for restaurant in batch], worker_id) as lost:
+        outcomes = fetch_and_update_menus(batch)
+    finished = datetime.datetime.now(datetime.timezone.utc)
+    for restaurant in batch:
+        outcome = outcomes.get(restaurant['_id'])
+        if restaurant['_id'] in lost:
+            # Another worker holds the restaurant now and will schedule it
+            continue
+        # update_restaurant has appended any new change event to the restaurant
+        due = next_check_at(restaurant, finished, outcome)
+        release_restaurant(restaurant['_id'], worker_id, due, finished, outcome)
+        logger.info(f"{restaurant['name']}: {outcome}; next due {due.isoformat() if due else 'never'}.")
+    return len(batch)
+
 
 def schedule_tasks():
     scheduler = BlockingScheduler()
 
-    # Schedule tasks based on menuPeriodicity
-    # For simplicity, we'll assume daily updates at 9 AM
-    scheduler.add_job(fetch_and_update_menus, 'cron', hour=9)
+    # Check the due queue every few minutes. Restaurants are due according to their
+    # menuPeriodicity, each at its own slot in the scrape window. A tick that is
+    # still running when the next one fires is not started twice (max_instances),
+    # and ticks missed while busy run once, not in a burst (coalesce).
+    scheduler.add_job(
+        run_due_restaurants, 'interval', minutes=SCHEDULE_TICK_MINUTES,
+        coalesce=True, max_instances=1, misfire_grace_time=SCHEDULE_TICK_MINUTES * 60,
+        next_run_time=datetime.datetime.now(datetime.timezone.utc),
+    )
 
     try:
         scheduler.start()
@@ -0,0 +1,187 @@
+import datetime
+import logging
+import os
+import time
+
+from scrapers.content_extraction import MIN_BLOCK_SCORE, menu_signal_score
+from scrapers.dynamic_scraper import scrape_dynamic_content_with_recipe
+from scrapers.image_scraper import scrape_image
+from scrapers.pdf_scraper import scrape_pdf
+from scrapers.recipes import RECIPE_MAX_CHARS
+from scrapers.text_scraper import scrape_text_with_recipe
+from scrapers.weeks import KNOWN_WEEK
+
+logger = logging.getLogger(__name__)
+
+# Relative cost of each strategy, cheapest first:
+# plain HTTP text, PDF text layer, OCR (PDF pages, then images), headless browser
+STRATEGY_COSTS = {
+    'text': 1,
+    'pdf_text': 2,
+    'pdf_ocr': 5,
+    'image_ocr': 6,
+    'dynamic': 10,
+}
+# The strategies a stored lunch_format points at, tried right after the memo
+FORMAT_STRATEGIES = {
+    'TEXT': ['text'],
+    'PDF': ['pdf_text', 'pdf_ocr'],
+    'IMAGE': ['image_ocr'],
+    'DYNAMIC': ['dynamic'],
+}
+# Menu signal score a strategy outside the stored format and the memo must reach
+# to be used and remembered, since a strategy that merely finds weekday words on
+# an unrelated page would otherwise replace the one that works
+STRATEGY_SWITCH_MIN_SCORE = int(os.getenv('STRATEGY_SWITCH_MIN_SCORE', str(2 * MIN_BLOCK_SCORE)))
+
+
+def strategy_order(lunch_format, memo=None):
+    """
+    Returns the strategies to try: the one that succeeded last time, then those of
+    the stored lunch_format, then the rest from cheapest to most expensive.
+    """
+    order = []
+    if memo and memo.get('strategy') in STRATEGY_COSTS:
+        order.append(memo['strategy'])
+    for name in FORMAT_STRATEGIES.get((lunch_format or '').upper(), []):
+        if name not in order:
+            order.append(name)
+    for name in sorted(STRATEGY_COSTS, key=STRATEGY_COSTS.get):
+        if name not in order:
+            order.append(name)
+    return order
+
+
+def run_strategy(name, link, state, memo, known_weeks):
+    """
+    Runs one strategy. Returns (menu_text, details); details records what was used
+    (PDF solution, preprocessing) and updates state with learned recipes/endpoints.
+    """
+    details = {}
+    remembered = memo if memo and memo.get('strategy') == name else {}
+
+    if name == 'text':
+        menu_text, state['recipe'] = scrape_text_with_recipe(link, state['recipe'])
+    elif name == 'pdf_text':
+        menu_text = scrape_pdf(link, 'text', known_weeks=known_weeks, details=details)
+    elif name == 'pdf_ocr':
+        # Go straight to the solution that worked last time instead of auto-detecting
+        solution = remembered.get('solution') if remembered.get('solution') in ('1', '2', '3') else None
+        menu_text = scrape_pdf(link, solution, known_weeks=known_weeks, details=details)
+    elif name == 'image_ocr':
+        menu_text = scrape_image(
+            link, known_weeks=known_weeks, preprocessing=remembered.get('preprocessing'), details=details
+        )
+    elif name == 'dynamic':
+        menu_text, state['recipe'], state['endpoint'] = scrape_dynamic_content_with_recipe(
+            link, state['recipe'], state['endpoint']
+        )
+    else:
+        raise ValueError(f"Unknown strategy: {name}")
+    return menu_text, details
+
+
+def update_memo(memo, name, succeeded, latency, details=None, validated=True):
+    """
+    Returns the memo with the outcome of one strategy attempt added to its
+    per-strategy statistics; a success also makes it the strategy tried first.
+    """
+    memo = dict(memo or {})
+    stats = dict(memo.get('stats') or {})
+    entry = dict(stats.get(name) or {'successes': 0, 'failures': 0, 'mean_latency': 0.0})
+    attempts = entry['successes'] + entry['failures']
+    entry['mean_latency'] = (entry['mean_latency'] * attempts + latency) / (attempts + 1)
+    entry['successes' if succeeded else 'failures'] += 1
+    stats[name] = entry
+    memo['stats'] = stats
+
+    if succeeded:
+        memo = remember_success(memo, name, latency, details, validated)
+    return memo
+
+
+def remember_success(memo, name, latency, details=None, validated=True):
+    """
+    Returns the memo with name (and the PDF solution or preprocessing it used) as
+    the strategy to try first next time.
+    """
+    memo = dict(memo or {})
+    memo.update({
+        'strategy': name,
+        'solution': (details or {}).get('solution'),
+        'preprocessing': (details or {}).get('preprocessing'),
+        'latency': latency,
+        'cost': STRATEGY_COSTS[name],
+        'validated': validated,
+        'succeeded_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+    })
+    return memo
+
+
+def run_strategy_cascade(restaurant, known_weeks=None):
+    """
+    Scrapes a restaurant's menu through the strategy cascade. The strategy that
+    succeeded last time (restaurant.strategy_memo) is tried first with the same
+    PDF solution or preprocessing; on failure the alternatives are tried from the
+    cheapest to the most expensive.
+
+    A result counts as a success when it carries enough menu signals (weekdays,
+    prices, week marker); strategies other than the remembered and stored-format
+    ones need STRATEGY_SWITCH_MIN_SCORE. If no strategy produces such text, the
+    first non-empty text of the remembered or stored-format strategy is used, as
+    before. When one of those finds only sources for a past or already stored
+    week, the cascade stops and 'text' is KNOWN_WEEK.
+
+    Returns a dict with 'text', 'strategy', 'memo' (to store on the restaurant
+    once the text has been processed), 'recipe' and 'endpoint'.
+    """
+    link = restaurant.get('lunch_link')
+    memo = restaurant.get('strategy_memo') or {}
+    state = {'recipe': restaurant.get('extraction_recipe'), 'endpoint': restaurant.get('menu_endpoint')}
+    trusted = set(FORMAT_STRATEGIES.get((restaurant.get('lunch_format') or '').upper(), []))
+    if memo.get('strategy'):
+        trusted.add(memo['strategy'])
+
+    fallback = None
+    for name in strategy_order(restaurant.get('lunch_format'), memo):
+        start = time.monotonic()
+        try:
+            menu_text, details = run_strategy(name, link, state, memo, known_weeks)
+        except Exception as e:
+            logger.error(f"Strategy '{name}' failed for {restaurant.get('name')}: {e}")
+            menu_text, details = None, {}
+        latency = time.monotonic() - start
+
+        if menu_text is KNOWN_WEEK:
+            # The menu is where the strategy looked, it just is not new
+            if name in trusted:
+                logger.info(f"Strategy '{name}' for {restaurant.get('name')} found only known weeks; stopping.")
+                return dict(state, text=KNOWN_WEEK, strategy=name, memo=memo)
+            continue
+
+        score = menu_signal_score(menu_text) if menu_text else 0
+        validated = score >= MIN_BLOCK_SCORE
+        if name not in trusted:
+            validated = score >= STRATEGY_SWITCH_MIN_SCORE and len(menu_text) <= RECIPE_MAX_CHARS
+        # A strategy remembered for menus without such signals is trusted as it is
+        accepted = validated or (
+            bool(menu_text) and name == memo.get('strategy') and memo.get('validated') is False
+        )
+        memo = update_memo(memo, name, accepted, latency, details, validated)
+        logger.info(
+            f"Strategy '{name}' for {restaurant.get('name')}: "
+            f"{'succeeded' if accepted else 'failed'} in {latency:.2f}s."
+        )
+        if accepted:
+            return dict(state, text=menu_text, strategy=name, memo=memo)
+
+        if menu_text and fallback is None and name in trusted:
+            fallback = (name, menu_text, details, latency)
+
+    if fallback:
+        name, menu_text, details, latency = fallback
+        logger.info(f"No strategy produced a clear menu for {restaurant.get('name')}; using '{name}'.")
+        memo = remember_success(memo, name, latency, details, validated=False)
+        return dict(state, text=menu_text, strategy=name, memo=memo)
+
+    return dict(state, text=None, strategy=None, memo=memo)
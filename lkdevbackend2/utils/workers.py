@@ -0,0 +1,109 @@
+import argparse
+import datetime
+import logging
+import multiprocessing
+import os
+import time
+
+from main import update_restaurant
+from scrapers.page_document import page_run
+from utils.batching import update_cost_estimate
+from utils.database import (
+    LONGEST_FIRST_CLAIM_SORT, claim_due_restaurant, ensure_claim_indexes, release_restaurant,
+    update_restaurant_cost_estimate,
+)
+from utils.leases import WORKER_LEASE_SECONDS, heartbeat, make_worker_id
+from utils.scheduler import next_check_at
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Wait between claim attempts when nothing is due (seconds)
+WORKER_IDLE_SECONDS = int(os.getenv('WORKER_IDLE_SECONDS', '30'))
+# Claim the most expensive due restaurant first, so long jobs do not start last;
+# restaurants that became due in an earlier DUE_BUCKET_MINUTES window still go
+# first, so cheap ones are not starved while expensive ones keep becoming due
+WORKER_LONGEST_FIRST = os.getenv('WORKER_LONGEST_FIRST', '1') == '1'
+CLAIM_SORT = LONGEST_FIRST_CLAIM_SORT if WORKER_LONGEST_FIRST else None
+
+
+def process_claimed(restaurant, worker_id):
+    """
+    Scrapes a claimed restaurant while heartbeating its lease, then releases it
+    with its next due time. A failure releases it for a retry. The restaurant's
+    landing page is fetched and parsed once for all the strategies tried, and
+    dropped before the next claim.
+    """
+    stage_seconds = {}
+    start = time.monotonic()
+    with heartbeat([restaurant['_id']], worker_id) as lost, page_run():
+        try:
+            outcome = update_restaurant(restaurant, stage_seconds=stage_seconds)
+        except Exception as e:
+            logger.error(f"Worker {worker_id} failed on {restaurant.get('name')}: {e}")
+            outcome = 'failed'
+    estimate = update_cost_estimate(restaurant.get('costEstimate'), time.monotonic() - start, stage_seconds)
+    update_restaurant_cost_estimate(restaurant['_id'], estimate)
+    if restaurant['_id'] in lost:
+        # Another worker holds the restaurant now and will schedule it
+        return outcome
+
+    finished = datetime.datetime.now(datetime.timezone.utc)
+    release_restaurant(restaurant['_id'], worker_id, next_check_at(restaurant, finished, outcome), finished, outcome)
+    return outcome
+
+
+def run_worker(worker_id=None, max_restaurants=None, exit_when_idle=False):
+    """
+    Claims and processes due restaurants one at a time until max_restaurants have
+    been processed or, with exit_when_idle, nothing is due. Any number of workers,
+    on any number of machines, can run against the same collection. Returns the
+    outcomes as a dict of restaurant _id to outcome.
+    """
+    worker_id = worker_id or make_worker_id()
+    logger.info(f"Worker {worker_id} started.")
+    ensure_claim_indexes()
+
+    outcomes = {}
+    while max_restaurants is None or len(outcomes) < max_restaurants:
+        restaurant = claim_due_restaurant(worker_id, WORKER_LEASE_SECONDS, CLAIM_SORT)
+        if restaurant is None:
+            if exit_when_idle:
+                break
+            time.sleep(WORKER_IDLE_SECONDS)
+            continue
+        logger.info(f"Worker {worker_id} claimed {restaurant.get('name')}.")
+        outcomes[restaurant['_id']] = process_claimed(restaurant, worker_id)
+
+    logger.info(f"Worker {worker_id} stopped after {len(outcomes)} restaurants.")
+    return outcomes
+
+
+def run_local_workers(processes, exit_when_idle=True):
+    """
+    Starts several worker processes on this machine and waits for them, e.g. to
+    exercise claiming against a local mongod. The processes are spawned, not
+    forked, so each opens its own MongoClient (pymongo clients are not fork-safe).
+    """
+    context = multiprocessing.get_context('spawn')
+    workers = [
+        context.Process(target=run_worker, kwargs={'exit_when_idle': exit_when_idle}, name=f"worker-{i}")
+        for i in range(processes)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return [worker.exitcode for worker in workers]
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Claim and scrape due restaurants.")
+    parser.add_argument('--processes', type=int, default=1, help="worker processes to start on this machine")
+    parser.add_argument('--exit-when-idle', action='store_true', help="stop once nothing is due")
+    args = parser.parse_args()
+    if args.processes > 1:
+        run_local_workers(args.processes, args.exit_when_idle)
+    else:
+        run_worker(exit_when_idle=args.exit_when_idle)
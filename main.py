@@ -1,70 +1,240 @@
 import os
+import datetime
+import json
+import time
 from dotenv import load_dotenv
 import logging
-from utils.database import restaurants_collection, update_restaurant_menus
+from utils.database import (
+    restaurants_collection, update_restaurant_menus, update_restaurant_recipe, update_restaurant_endpoint,
+    update_restaurant_facebook_since, update_restaurant_strategy_memo, update_restaurant_content_hash,
+)
 from utils.data_processing import process_menu_text
-from scrapers.text_scraper import scrape_text
-from scrapers.image_scraper import scrape_image
-from scrapers.pdf_scraper import scrape_pdf
-from scrapers.facebook_scraper import scrape_facebook_post
-from scrapers.dynamic_scraper import scrape_dynamic_content
+from utils.strategies import FORMAT_STRATEGIES, run_strategy_cascade
+from utils.revisit import REVISIT_HISTORY_EVENTS, menu_content_hash
+from utils.batching import run_batch
+from utils.ledger import complete_restaurant, finish_run, run_progress, save_stage, stage_output, start_run
+from scrapers.facebook_scraper import scrape_facebook_posts
+from scrapers.weeks import KNOWN_WEEK, stored_menu_weeks
 
 load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def fetch_and_update_menus():
+def fetch_facebook_posts(restaurants):
+    """
+    Fetches the Facebook pages of the restaurants together in a few batched Graph
+    calls, asking only for posts newer than the last one seen.
+    """
+    facebook_pages = [
+        (restaurant['_id'], restaurant.get('lunch_link'), restaurant.get('facebook_since'))
+        for restaurant in restaurants
+        if (restaurant.get('lunch_format') or '').upper() == 'FACEBOOK POST' and restaurant.get('lunch_link')
+    ]
+    return scrape_facebook_posts(facebook_pages) if facebook_pages else {}
+
+def scrape_restaurant(restaurant, facebook_posts=None):
+    """
+    Scrapes the menu text of one restaurant. Returns (menu_text, learned), where
+    menu_text is None when nothing was found and KNOWN_WEEK when the sources hold
+    nothing new (only known weeks, or no new Facebook menu post), and where
+    learned holds what was learned on the way (extraction recipe, menu endpoint,
+    strategy memo, newest Facebook post) for save_learned_state once the text has
+    been processed.
+    """
+    lunch_format = restaurant.get('lunch_format')
+    restaurant_id = restaurant['_id']
+    learned = {}
+
+    # Weeks already stored, so stale or already ingested sources can be skipped
+    known_weeks = stored_menu_weeks(restaurant.get('lunch_menus'))
+
+    # Scrape menu based on format
+    if lunch_format.upper() in FORMAT_STRATEGIES:
+        # Cheapest strategy that worked last time first, then the alternatives
+        result = run_strategy_cascade(restaurant, known_weeks)
+        menu_text = result['text']
+        # Where the menu was found, if a recipe has been learned, and the backing
+        # API endpoint of a JavaScript-rendered menu, if one was discovered
+        learned['recipe'] = result['recipe']
+        learned['endpoint'] = result['endpoint']
+        learned['memo'] = result['memo']
+    else:
+        if facebook_posts is None:
+            facebook_posts = fetch_facebook_posts([restaurant])
+        facebook_result = facebook_posts.get(restaurant_id)
+        if facebook_result is None:
+            # The page could not be fetched (error, rate limit)
+            return None, learned
+        # Fetched, but no menu post since the newest one seen: nothing new
+        menu_text = facebook_result.get('text') or KNOWN_WEEK
+        # Newest post seen, so the next run only asks for newer ones
+        learned['facebook_since'] = facebook_result.get('newest')
+
+    return menu_text, learned
+
+def save_learned_state(restaurant, learned):
+    """
+    Stores what scrape_restaurant learned, once its text is known to hold a menu
+    (processed, or unchanged since it was processed), so a selector, endpoint
+    or strategy that led to something the LLM could not read is never reused, and
+    Facebook posts that failed processing are fetched again on the next run.
+    """
+    restaurant_id = restaurant['_id']
+    if learned.get('recipe') and learned['recipe'] != restaurant.get('extraction_recipe'):
+        update_restaurant_recipe(restaurant_id, learned['recipe'])
+    if 'endpoint' in learned and learned['endpoint'] != restaurant.get('menu_endpoint'):
+        update_restaurant_endpoint(restaurant_id, learned['endpoint'])
+    if learned.get('memo') and learned['memo'] != restaurant.get('strategy_memo'):
+        update_restaurant_strategy_memo(restaurant_id, learned['memo'])
+    if learned.get('facebook_since') and learned['facebook_since'] != restaurant.get('facebook_since'):
+        update_restaurant_facebook_since(restaurant_id, learned['facebook_since'])
+
+def update_restaurant(restaurant, facebook_posts=None, run_id=None, checkpoint=None, stage_seconds=None):
+    """
+    Scrapes, processes and stores the menu of one restaurant. Returns the outcome:
+    'updated', 'unchanged', 'nothing_new' (only sources for known weeks or no new
+    Facebook post), 'skipped', 'no_text', 'not_processed' or 'failed'.
+
+    With a run_id, the output of each stage (scraped text, processed menus) is
+    checkpointed in the run ledger, and a checkpoint (the restaurant's ledger
+    entry from an interrupted run) resumes after its last finished stage.
+    The seconds spent scraping and processing are added to stage_seconds.
+    """
+    outcome = 'failed'
+    try:
+        outcome = run_restaurant_stages(restaurant, facebook_posts, run_id, checkpoint, stage_seconds)
+    except Exception as e:
+        logger.error(f"Error processing {restaurant['name']}: {e}")
+    # Failed restaurants stay in progress, so a restarted run retries them
+    if run_id and outcome != 'failed':
+        complete_restaurant(run_id, restaurant['_id'], outcome)
+    return outcome
+
+def run_restaurant_stages(restaurant, facebook_posts=None, run_id=None, checkpoint=None, stage_seconds=None):
+    """
+    The stages of update_restaurant; exceptions are left to the caller.
+    """
+    logger.info(f"Processing restaurant: {restaurant['name']}")
+    lunch_link = restaurant.get('lunch_link')
+    lunch_format = restaurant.get('lunch_format')
+    restaurant_id = restaurant['_id']
+    stage_seconds = {} if stage_seconds is None else stage_seconds
+
+    if not lunch_link or not lunch_format:
+        logger.warning(f"Skipping {restaurant['name']} due to missing lunch_link or lunch_format.")
+        return 'skipped'
+    if lunch_format.upper() not in FORMAT_STRATEGIES and lunch_format.upper() != 'FACEBOOK POST':
+        logger.warning(f"Unsupported lunch_format for {restaurant['name']}: {lunch_format}")
+        return 'skipped'
+
+    # Stage 1: scraped menu text (downloads, OCR, browser), checkpointed with what
+    # the scrape learned, so a resumed restaurant still stores it once processed
+    menu_text = stage_output(checkpoint, 'scraped')
+    learned = stage_output(checkpoint, 'learned') or {}
+    if menu_text:
+        logger.info(f"Resuming {restaurant['name']} from its scraped text in run {run_id}")
+    else:
+        start = time.monotonic()
+        menu_text, learned = scrape_restaurant(restaurant, facebook_posts)
+        stage_seconds['scrape'] = time.monotonic() - start
+        if menu_text is KNOWN_WEEK:
+            logger.info(f"Nothing new for {restaurant['name']}")
+            # None of the new posts is a menu, so later runs need not fetch them again
+            if learned.get('facebook_since'):
+                save_learned_state(restaurant, {'facebook_since': learned['facebook_since']})
+            return 'nothing_new'
+        if not menu_text:
+            logger.warning(f"No menu text found for {restaurant['name']}")
+            return 'no_text'
+        if run_id:
+            save_stage(run_id, restaurant_id, 'scraped', menu_text, {'learned': learned})
+
+    # Same content as last time: nothing to process
+    content_hash = menu_content_hash(menu_text)
+    if content_hash == restaurant.get('contentHash'):
+        logger.info(f"Menu content unchanged for {restaurant['name']}")
+        save_learned_state(restaurant, learned)
+        return 'unchanged'
+
+    # Stage 2: menu text processed into structured menus, checkpointed as JSON text
+    # since the menus carry '$date' keys
+    processed = stage_output(checkpoint, 'processed')
+    if processed:
+        lunch_menus = json.loads(processed)
+        logger.info(f"Resuming {restaurant['name']} from its processed menus in run {run_id}")
+    else:
+        start = time.monotonic()
+        lunch_menus = process_menu_text(menu_text)
+        stage_seconds['process'] = time.monotonic() - start
+        if not lunch_menus:
+            logger.warning(f"Failed to process menu for {restaurant['name']}")
+            return 'not_processed'
+        if run_id:
+            save_stage(run_id, restaurant_id, 'processed', json.dumps(lunch_menus))
+
+    # Update database
+    save_learned_state(restaurant, learned)
+    updated_count = update_restaurant_menus(restaurant_id, lunch_menus)
+    # Record when the content changed (the first hash is only a baseline)
+    changed_at = datetime.datetime.now(datetime.timezone.utc) if restaurant.get('contentHash') else None
+    update_restaurant_content_hash(restaurant_id, content_hash, changed_at, REVISIT_HISTORY_EVENTS)
+    if changed_at:
+        restaurant.setdefault('changeEvents', []).append({'at': changed_at, 'hash': content_hash})
+    restaurant['contentHash'] = content_hash
+    if updated_count > 0:
+        logger.info(f"Updated menu for {restaurant['name']}")
+        return 'updated'
+    logger.info(f"No changes made to {restaurant['name']}")
+    return 'unchanged'
+
+def fetch_and_update_menus(restaurants=None, run_id=None):
+    """
+    Updates the menus of the given restaurants (by default every restaurant whose
+    menuPeriodicity is not Never). Returns a dict mapping restaurant _id to its
+    outcome (see update_restaurant).
+
+    With a run_id, progress is recorded in the run ledger: restaurants completed
+    earlier in the same run are skipped and interrupted ones resume from their
+    last finished stage.
+    """
     # Fetch restaurants that need updating
-    restaurants = restaurants_collection.find({
-        'menuPeriodicity': {'$ne': 'Never'}
-    })
+    if restaurants is None:
+        restaurants = list(restaurants_collection.find({
+            'menuPeriodicity': {'$ne': 'Never'}
+        }))
 
+    progress = run_progress(run_id) if run_id else {}
+    outcomes = {}
+    pending = []
     for restaurant in restaurants:
-        try:
-            logger.info(f"Processing restaurant: {restaurant['name']}")
-            lunch_link = restaurant.get('lunch_link')
-            lunch_format = restaurant.get('lunch_format')
-            restaurant_id = restaurant['_id']
-
-            if not lunch_link or not lunch_format:
-                logger.warning(f"Skipping {restaurant['name']} due to missing lunch_link or lunch_format.")
-                continue
-
-            # Scrape menu based on format
-            if lunch_format.upper() == 'TEXT':
-                menu_text = scrape_text(lunch_link)
-            elif lunch_format.upper() == 'IMAGE':
-                menu_text = scrape_image(lunch_link)
-            elif lunch_format.upper() == 'PDF':
-                menu_text = scrape_pdf(lunch_link)
-            elif lunch_format.upper() == 'FACEBOOK POST':
-                menu_text = scrape_facebook_post(lunch_link)
-            elif lunch_format.upper() == 'DYNAMIC':
-                menu_text = scrape_dynamic_content(lunch_link)
-            else:
-                logger.warning(f"Unsupported lunch_format for {restaurant['name']}: {lunch_format}")
-                continue
-
-            if not menu_text:
-                logger.warning(f"No menu text found for {restaurant['name']}")
-                continue
-
-            # Process menu text
-            lunch_menus = process_menu_text(menu_text)
-
-            if not lunch_menus:
-                logger.warning(f"Failed to process menu for {restaurant['name']}")
-                continue
-
-            # Update database
-            updated_count = update_restaurant_menus(restaurant_id, lunch_menus)
-            if updated_count > 0:
-                logger.info(f"Updated menu for {restaurant['name']}")
-            else:
-                logger.info(f"No changes made to {restaurant['name']}")
-
-        except Exception as e:
-            logger.error(f"Error processing {restaurant['name']}: {e}")
+        entry = progress.get(restaurant['_id'])
+        if entry and entry.get('state') == 'completed':
+            outcomes[restaurant['_id']] = entry.get('outcome')
+        else:
+            pending.append(restaurant)
+    if progress:
+        logger.info(f"Run {run_id}: {len(outcomes)} restaurants already done, {len(pending)} to go.")
+
+    facebook_posts = fetch_facebook_posts(
+        [restaurant for restaurant in pending if not stage_output(progress.get(restaurant['_id']), 'scraped')]
+    )
+
+    # Restaurants are spread over BATCH_WORKERS workers, longest estimated first;
+    # each worker fetches and parses a landing page once, whichever scrapers use it
+    batch_outcomes, report = run_batch(
+        pending,
+        lambda restaurant, stage_seconds: update_restaurant(
+            restaurant, facebook_posts, run_id, progress.get(restaurant['_id']), stage_seconds
+        ),
+        # Restaurants with a checkpoint skip stages, so their time is no estimate
+        resumed=lambda restaurant: restaurant['_id'] in progress,
+    )
+    outcomes.update(batch_outcomes)
+
+    if run_id:
+        finish_run(run_id, outcomes, report)
+    return outcomes
 
 if __name__ == "__main__":
-    fetch_and_update_menus()
+    # RUN_ID resumes a given run; otherwise the latest unfinished run is resumed
+    fetch_and_update_menus(run_id=start_run(os.getenv('RUN_ID')))
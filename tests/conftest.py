@@ -0,0 +1,34 @@
+import os
+import sys
+import uuid
+
+import pytest
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# main.py imports the backend's packages as top-level 'utils' and 'scrapers'
+for path in (ROOT, os.path.join(ROOT, 'lkdevbackend2')):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+# utils.database needs a URI at import; nothing connects until a query runs
+os.environ.setdefault('MONGO_URI', 'mongodb://127.0.0.1:27017')
+
+# Tests that need MongoDB create a scratch database on this server and drop it
+# afterwards; they are skipped when nothing answers there
+TEST_MONGO_URI = os.getenv('TEST_MONGO_URI', 'mongodb://127.0.0.1:27017')
+
+
+@pytest.fixture
+def database():
+    client = MongoClient(TEST_MONGO_URI, serverSelectionTimeoutMS=2000)
+    try:
+        client.admin.command('ping')
+    except PyMongoError:
+        pytest.skip(f"No MongoDB at {TEST_MONGO_URI}")
+    name = f"test_{uuid.uuid4().hex[:8]}"
+    yield client[name]
+    client.drop_database(name)
+    client.close()
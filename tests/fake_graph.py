@@ -0,0 +1,67 @@
+import datetime
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class FakeGraph:
+    """
+    A local stand-in for the Graph API batch endpoint. posts maps a page id to its
+    posts ({'message', 'created_time'}, newest first); pages missing from it answer
+    with a Graph error. Every batch received is recorded in batches, and usage is
+    sent back in the X-App-Usage header.
+    """
+
+    def __init__(self, posts, usage=0, errors=None):
+        self.posts = posts
+        self.usage = usage
+        self.errors = errors or {}
+        self.batches = []
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                form = parse_qs(self.rfile.read(int(self.headers['Content-Length'])).decode())
+                batch = json.loads(form['batch'][0])
+                fake.batches.append(batch)
+                body = json.dumps([fake.answer(request) for request in batch]).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('X-App-Usage', json.dumps(
+                    {'call_count': fake.usage, 'total_time': 0, 'total_cputime': 0}
+                ))
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def answer(self, request):
+        url = urlparse(request['relative_url'])
+        page_id = url.path.split('/')[0]
+        if page_id in self.errors:
+            return {'code': 400, 'body': json.dumps({'error': self.errors[page_id]})}
+        if page_id not in self.posts:
+            return {'code': 404, 'body': json.dumps({'error': {'message': 'Unknown page', 'code': 100}})}
+        since = int(parse_qs(url.query).get('since', ['0'])[0])
+        data = [
+            post for post in self.posts[page_id]
+            if datetime.datetime.strptime(post['created_time'], '%Y-%m-%dT%H:%M:%S%z').timestamp() >= since
+        ]
+        return {'code': 200, 'body': json.dumps({'data': data})}
+
+    def requested_urls(self):
+        return [request['relative_url'] for batch in self.batches for request in batch]
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,44 @@
+"""
+Runs main.fetch_and_update_menus for the run in RUN_ID with the scraping and
+LLM stages stubbed, logging each stubbed call to RESUME_LOG. With RESUME_HANG
+set, the processing stage hangs on its RESUME_HANG-th call, so the parent test
+can kill the run while a restaurant sits between its stages.
+"""
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, 'lkdevbackend2')]
+
+import main  # noqa: E402
+
+calls = []
+
+
+def log(line):
+    with open(os.environ['RESUME_LOG'], 'a') as log_file:
+        log_file.write(line + '\n')
+
+
+def scrape_restaurant(restaurant, facebook_posts=None):
+    log(f"scrape {restaurant['name']}")
+    learned = {'memo': {'strategy': 'text_main', 'latency': 0.1, 'cost': 1}}
+    return f"Dagens lunch hos {restaurant['name']}", learned
+
+
+def process_menu_text(menu_text):
+    name = menu_text.rsplit(' ', 1)[-1]
+    calls.append(name)
+    if len(calls) == int(os.getenv('RESUME_HANG', '0')):
+        log(f"hang {name}")
+        time.sleep(600)
+    log(f"process {name}")
+    return [{'day': 'Monday', 'dishes': [menu_text]}]
+
+
+main.scrape_restaurant = scrape_restaurant
+main.process_menu_text = process_menu_text
+
+if __name__ == '__main__':
+    main.fetch_and_update_menus(run_id=main.start_run(os.environ['RUN_ID']))
@@ -0,0 +1,58 @@
+import datetime
+
+import pytest
+
+from utils import database as db_module
+from utils.database import LONGEST_FIRST_CLAIM_SORT, claim_due_restaurant, due_bucket, ensure_claim_indexes
+
+NOW = datetime.datetime.now(datetime.timezone.utc)
+
+
+@pytest.fixture
+def restaurants(database, monkeypatch):
+    monkeypatch.setattr(db_module, 'restaurants_collection', database.restaurant)
+    ensure_claim_indexes()
+    return database.restaurant
+
+
+def add(restaurants, name, next_due_at, seconds):
+    restaurants.insert_one({
+        'name': name, 'menuPeriodicity': 'Weekly', 'nextDueAt': next_due_at,
+        'dueBucket': due_bucket(next_due_at), 'costEstimate': {'seconds': seconds},
+    })
+
+
+def claim_order(count):
+    return [claim_due_restaurant('worker', 60, LONGEST_FIRST_CLAIM_SORT)['name'] for _ in range(count)]
+
+
+def test_longest_first_within_a_due_window(restaurants):
+    window = due_bucket(NOW - datetime.timedelta(minutes=db_module.DUE_BUCKET_MINUTES))
+    add(restaurants, 'text', window + datetime.timedelta(seconds=1), 2.0)
+    add(restaurants, 'ocr', window + datetime.timedelta(seconds=2), 90.0)
+    add(restaurants, 'dynamic', window + datetime.timedelta(seconds=3), 30.0)
+
+    assert claim_order(3) == ['ocr', 'dynamic', 'text']
+
+
+def test_earlier_due_window_goes_before_longer_jobs(restaurants):
+    window = datetime.timedelta(minutes=db_module.DUE_BUCKET_MINUTES)
+    add(restaurants, 'starving text', NOW - 3 * window, 2.0)
+    add(restaurants, 'new ocr', NOW, 90.0)
+    add(restaurants, 'older ocr', NOW - 2 * window, 90.0)
+
+    assert claim_order(3) == ['starving text', 'older ocr', 'new ocr']
+
+
+def test_claim_sort_has_an_index(restaurants):
+    keys = [list(index['key'].items()) for index in restaurants.list_indexes()]
+    assert any(key[:len(LONGEST_FIRST_CLAIM_SORT)] == LONGEST_FIRST_CLAIM_SORT for key in keys)
+
+
+def test_due_bucket_floors_to_the_window(monkeypatch):
+    monkeypatch.setattr(db_module, 'DUE_BUCKET_MINUTES', 15)
+    at = datetime.datetime(2026, 10, 19, 9, 44, 59, tzinfo=datetime.timezone.utc)
+    assert due_bucket(at) == datetime.datetime(2026, 10, 19, 9, 30, tzinfo=datetime.timezone.utc)
+    # MongoDB hands back naive UTC datetimes
+    assert due_bucket(at.replace(tzinfo=None)) == due_bucket(at)
+    assert due_bucket(None) is None
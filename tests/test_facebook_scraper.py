@@ -0,0 +1,131 @@
+import datetime
+
+import pytest
+
+from fake_graph import FakeGraph
+from scrapers import facebook_scraper
+
+
+def timestamp(created_time):
+    return int(datetime.datetime.strptime(created_time, '%Y-%m-%dT%H:%M:%S%z').timestamp())
+
+
+POSTS = {
+    'kebabhuset': [
+        {'message': 'Dagens lunch: falafel', 'created_time': '2026-10-19T09:00:00+0000'},
+        {'message': 'Nya öppettider', 'created_time': '2026-10-18T09:00:00+0000'},
+        {'message': 'Lunch v42: pasta', 'created_time': '2026-10-12T09:00:00+0000'},
+    ],
+    'pizzeria': [
+        {'message': 'Välkomna!', 'created_time': '2026-10-17T09:00:00+0000'},
+    ],
+    'bistro': [
+        {'message': 'Veckans lunch: soppa', 'created_time': '2026-10-16T09:00:00+0000'},
+    ],
+}
+
+
+@pytest.fixture
+def graph(monkeypatch):
+    monkeypatch.setenv('FACEBOOK_ACCESS_TOKEN', 'token')
+    with FakeGraph(POSTS) as fake:
+        monkeypatch.setattr(facebook_scraper, 'FACEBOOK_GRAPH_URL', fake.url)
+        yield fake
+
+
+def test_pages_are_fetched_in_batches(graph, monkeypatch):
+    monkeypatch.setattr(facebook_scraper, 'FACEBOOK_BATCH_SIZE', 2)
+    results = facebook_scraper.scrape_facebook_posts([
+        (1, 'https://www.facebook.com/kebabhuset', None),
+        (2, 'https://www.facebook.com/pizzeria/', None),
+        (3, 'https://facebook.com/bistro?ref=page', None),
+    ])
+
+    assert [len(batch) for batch in graph.batches] == [2, 1]
+    assert results[1] == {'text': 'Dagens lunch: falafel', 'newest': timestamp('2026-10-19T09:00:00+0000')}
+    assert results[2] == {'text': None, 'newest': timestamp('2026-10-17T09:00:00+0000')}
+    assert results[3]['text'] == 'Veckans lunch: soppa'
+
+
+def test_only_posts_after_since_are_requested(graph):
+    since = timestamp('2026-10-18T09:00:00+0000')
+    results = facebook_scraper.scrape_facebook_posts([(1, 'https://www.facebook.com/kebabhuset', since)])
+
+    assert graph.requested_urls() == [
+        f"kebabhuset/posts?fields=message,created_time&limit=5&since={since + 1}"
+    ]
+    assert results[1]['text'] == 'Dagens lunch: falafel'
+
+
+def test_no_new_menu_post_keeps_the_newest_post(graph):
+    since = timestamp('2026-10-19T09:00:00+0000')
+    results = facebook_scraper.scrape_facebook_posts([(1, 'https://www.facebook.com/kebabhuset', since)])
+
+    # Nothing after since: no menu, and since is kept
+    assert results[1] == {'text': None, 'newest': since}
+
+
+def test_shared_page_is_requested_once_and_filtered_per_restaurant(graph):
+    seen_menu = timestamp('2026-10-18T09:00:00+0000')
+    older = timestamp('2026-10-11T09:00:00+0000')
+    results = facebook_scraper.scrape_facebook_posts([
+        (1, 'https://www.facebook.com/kebabhuset', seen_menu),
+        (2, 'https://www.facebook.com/kebabhuset', older),
+    ])
+
+    # One request, for posts after the older since
+    assert graph.requested_urls() == [
+        f"kebabhuset/posts?fields=message,created_time&limit=5&since={older + 1}"
+    ]
+    assert results[1]['text'] == 'Dagens lunch: falafel'
+    assert results[2]['text'] == 'Dagens lunch: falafel'
+    assert results[1]['newest'] == results[2]['newest'] == timestamp('2026-10-19T09:00:00+0000')
+
+
+def test_failed_pages_are_left_out(graph):
+    results = facebook_scraper.scrape_facebook_posts([
+        (1, 'https://www.facebook.com/kebabhuset', None),
+        (2, 'https://www.facebook.com/closed-down', None),
+    ])
+
+    assert 1 in results
+    assert 2 not in results
+
+
+def test_high_app_usage_stops_the_run(graph, monkeypatch):
+    monkeypatch.setattr(facebook_scraper, 'FACEBOOK_BATCH_SIZE', 1)
+    graph.usage = facebook_scraper.FACEBOOK_USAGE_STOP
+    results = facebook_scraper.scrape_facebook_posts([
+        (1, 'https://www.facebook.com/kebabhuset', None),
+        (2, 'https://www.facebook.com/pizzeria', None),
+    ])
+
+    assert len(graph.batches) == 1
+    assert list(results) == [1]
+
+
+def test_high_app_usage_slows_down(graph, monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(facebook_scraper, 'FACEBOOK_BATCH_SIZE', 1)
+    monkeypatch.setattr(facebook_scraper.time, 'sleep', sleeps.append)
+    graph.usage = facebook_scraper.FACEBOOK_USAGE_SLOWDOWN
+    results = facebook_scraper.scrape_facebook_posts([
+        (1, 'https://www.facebook.com/kebabhuset', None),
+        (2, 'https://www.facebook.com/pizzeria', None),
+    ])
+
+    assert len(graph.batches) == 2
+    assert sleeps == [facebook_scraper.FACEBOOK_SLOWDOWN_SECONDS]
+    assert set(results) == {1, 2}
+
+
+def test_throttling_error_stops_the_run(graph, monkeypatch):
+    monkeypatch.setattr(facebook_scraper, 'FACEBOOK_BATCH_SIZE', 1)
+    graph.errors['kebabhuset'] = {'message': 'Application request limit reached', 'code': 4}
+    results = facebook_scraper.scrape_facebook_posts([
+        (1, 'https://www.facebook.com/kebabhuset', None),
+        (2, 'https://www.facebook.com/pizzeria', None),
+    ])
+
+    assert len(graph.batches) == 1
+    assert results == {}
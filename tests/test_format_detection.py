@@ -0,0 +1,117 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+from scrapers import image_scraper
+from scrapers.format_detection import detect_format
+from scrapers.page_document import page_run
+from scrapers.pdf_scraper import scrape_pdf
+
+
+def menu_pdf():
+    """A one-page PDF with a text layer, written out by hand."""
+    lines = [f"{day}: Dagens lunch med sallad och kaffe 125 kr"
+             for day in ['Mandag', 'Tisdag', 'Onsdag', 'Torsdag', 'Fredag']]
+    content = "BT /F1 12 Tf 72 780 Td " + " 0 -40 Td ".join(f"({line}) Tj" for line in lines) + " ET"
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        "<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Contents 4 0 R"
+        " /Resources << /Font << /F1 5 0 R >> >> >>",
+        f"<< /Length {len(content)} >>\nstream\n{content}\nendstream",
+        "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    pdf = "%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(pdf))
+        pdf += f"{number} 0 obj\n{body}\nendobj\n"
+    xref = len(pdf)
+    pdf += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n"
+    pdf += "".join(f"{offset:010d} 00000 n \n" for offset in offsets)
+    pdf += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF"
+    return pdf.encode('latin-1')
+
+
+def menu_png():
+    buffer = BytesIO()
+    Image.new('RGB', (800, 600), 'white').save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+PAGE = (
+    "<html><head><title>Lunch</title></head><body><h1>Veckans lunch</h1>"
+    + "".join(f"<p>{day}: Dagens lunch med sallad och kaffe 125 kr</p>"
+              for day in ['Måndag', 'Tisdag', 'Onsdag', 'Torsdag', 'Fredag'])
+    + "</body></html>"
+).encode('utf-8')
+
+
+@pytest.fixture(scope='module')
+def site():
+    bodies = {
+        '/lunch.pdf': ('application/pdf', menu_pdf()),
+        '/lunch.png': ('image/png', menu_png()),
+        '/lunch.html': ('text/html; charset=utf-8', PAGE),
+    }
+    requests_seen = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            requests_seen.append(self.path)
+            content_type, body = bodies[self.path]
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}", requests_seen
+    server.shutdown()
+    server.server_close()
+
+
+def test_direct_pdf_link_is_detected_and_scraped_with_one_fetch(site):
+    base, requests_seen = site
+    requests_seen.clear()
+    with page_run():
+        detected = detect_format(f"{base}/lunch.pdf")
+        text = scrape_pdf(f"{base}/lunch.pdf")
+
+    assert detected['candidates'] == ['PDF']
+    assert 'Dagens lunch' in text
+    assert requests_seen == ['/lunch.pdf']
+
+
+def test_direct_image_link_is_detected_and_scraped_with_one_fetch(site, monkeypatch):
+    base, requests_seen = site
+    requests_seen.clear()
+    images = []
+    monkeypatch.setattr(image_scraper, 'process_image_for_menu_text',
+                        lambda image, preprocessing=None, details=None: images.append(image.size) or 'Dagens lunch')
+    with page_run():
+        detected = detect_format(f"{base}/lunch.png")
+        text = image_scraper.scrape_image(f"{base}/lunch.png")
+
+    assert detected['candidates'] == ['IMAGE']
+    assert text == 'Dagens lunch'
+    assert images == [(800, 600)]
+    assert requests_seen == ['/lunch.png']
+
+
+def test_html_page_is_detected_with_one_fetch(site):
+    base, requests_seen = site
+    requests_seen.clear()
+    with page_run():
+        detected = detect_format(f"{base}/lunch.html")
+
+    assert detected['format'] == 'TEXT'
+    assert requests_seen == ['/lunch.html']
@@ -0,0 +1,58 @@
+import pytest
+from bson.objectid import ObjectId
+
+import main
+
+
+@pytest.fixture
+def stored(monkeypatch):
+    """Records the learned state main.py stores instead of writing it to MongoDB."""
+    calls = {}
+    monkeypatch.setattr(main, 'update_restaurant_facebook_since',
+                        lambda restaurant_id, since: calls.setdefault('facebook_since', []).append(since))
+    monkeypatch.setattr(main, 'update_restaurant_menus', lambda restaurant_id, menus: 1)
+    monkeypatch.setattr(main, 'update_restaurant_content_hash', lambda *args: None)
+    return calls
+
+
+def facebook_restaurant(since=None):
+    return {
+        '_id': ObjectId(),
+        'name': 'Kebabhuset',
+        'lunch_link': 'https://www.facebook.com/kebabhuset',
+        'lunch_format': 'Facebook post',
+        'facebook_since': since,
+    }
+
+
+def test_page_without_new_menu_post_advances_since(stored):
+    restaurant = facebook_restaurant(since=100)
+    posts = {restaurant['_id']: {'text': None, 'newest': 200}}
+
+    assert main.update_restaurant(restaurant, posts) == 'nothing_new'
+    assert stored['facebook_since'] == [200]
+
+
+def test_menu_post_that_fails_processing_is_fetched_again(stored, monkeypatch):
+    monkeypatch.setattr(main, 'process_menu_text', lambda text: None)
+    restaurant = facebook_restaurant(since=100)
+    posts = {restaurant['_id']: {'text': 'Dagens lunch: falafel', 'newest': 200}}
+
+    assert main.update_restaurant(restaurant, posts) == 'not_processed'
+    assert 'facebook_since' not in stored
+
+
+def test_processed_menu_post_advances_since(stored, monkeypatch):
+    monkeypatch.setattr(main, 'process_menu_text', lambda text: [{'day': 'Monday', 'dishes': ['Falafel']}])
+    restaurant = facebook_restaurant(since=100)
+    posts = {restaurant['_id']: {'text': 'Dagens lunch: falafel', 'newest': 200}}
+
+    assert main.update_restaurant(restaurant, posts) == 'updated'
+    assert stored['facebook_since'] == [200]
+
+
+def test_unfetched_page_has_no_text(stored):
+    restaurant = facebook_restaurant(since=100)
+
+    assert main.update_restaurant(restaurant, {}) == 'no_text'
+    assert 'facebook_since' not in stored
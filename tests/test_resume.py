@@ -0,0 +1,82 @@
+import os
+import subprocess
+import sys
+import time
+import uuid
+
+from conftest import TEST_MONGO_URI
+
+TESTS = os.path.dirname(os.path.abspath(__file__))
+RESTAURANTS = ['alfa', 'bravo', 'charlie', 'delta', 'echo', 'foxtrot']
+
+
+def run_child(database, run_id, log_path, **env):
+    return subprocess.Popen(
+        [sys.executable, os.path.join(TESTS, 'resume_child.py')],
+        env=dict(
+            os.environ, MONGO_URI=TEST_MONGO_URI, DATABASE_NAME=database.name,
+            COLLECTION_NAME='restaurant', RUN_ID=run_id, RESUME_LOG=log_path, BATCH_WORKERS='1', **env
+        ),
+    )
+
+
+def read_log(log_path):
+    if not os.path.exists(log_path):
+        return []
+    with open(log_path) as log_file:
+        return [line.split() for line in log_file.read().splitlines()]
+
+
+def test_killed_run_resumes_without_redoing_work(database, tmp_path):
+    database.restaurant.insert_many([
+        {'name': name, 'lunch_link': f"https://example.com/{name}", 'lunch_format': 'TEXT',
+         'menuPeriodicity': 'Weekly'}
+        for name in RESTAURANTS
+    ])
+    run_id = f"resume-test-{uuid.uuid4().hex[:6]}"
+    first_log = str(tmp_path / 'first.log')
+
+    # Kill the first run while the third restaurant is between scraping and processing
+    child = run_child(database, run_id, first_log, RESUME_HANG='3')
+    try:
+        deadline = time.monotonic() + 60
+        while not any(line[0] == 'hang' for line in read_log(first_log)):
+            assert child.poll() is None, "the run ended before it could be killed"
+            assert time.monotonic() < deadline, "the run never reached the hanging stage"
+            time.sleep(0.1)
+    finally:
+        child.kill()
+        child.wait()
+
+    first = read_log(first_log)
+    completed = [name for action, name in first if action == 'process']
+    hanging = next(name for action, name in first if action == 'hang')
+    assert len(completed) == 2
+    ledger = {
+        entry['restaurant_id']: entry for entry in database.run_ledger.find({'run_id': run_id})
+    }
+    ids = {restaurant['name']: restaurant['_id'] for restaurant in database.restaurant.find()}
+    assert ledger[ids[hanging]]['stage'] == 'scraped'
+    assert ledger[None]['state'] == 'in_progress'
+
+    second_log = str(tmp_path / 'second.log')
+    child = run_child(database, run_id, second_log)
+    assert child.wait(timeout=60) == 0
+
+    second = read_log(second_log)
+    scraped_again = {name for action, name in second if action == 'scrape'}
+    processed_again = {name for action, name in second if action == 'process'}
+    untouched = set(RESTAURANTS) - set(completed) - {hanging}
+    # Completed restaurants are skipped, the checkpointed one resumes from its text
+    assert scraped_again == untouched
+    assert processed_again == untouched | {hanging}
+
+    ledger = {
+        entry['restaurant_id']: entry for entry in database.run_ledger.find({'run_id': run_id})
+    }
+    assert ledger[None]['state'] == 'completed'
+    assert all(ledger[ids[name]]['state'] == 'completed' for name in RESTAURANTS)
+    # What the interrupted scrape learned is stored when the resumed run finishes it
+    resumed = database.restaurant.find_one({'_id': ids[hanging]})
+    assert resumed['strategy_memo']['strategy'] == 'text_main'
+    assert resumed['lunch_menus']